@@ -1,5 +1,10 @@
 # app.py
+import asyncio
 import json
+import os
+import shutil
+import threading
+from functools import partial
 from pathlib import Path
 
 from agents.test_agent import (
@@ -8,169 +13,486 @@ from agents.test_agent import (
     create_test_development_engineer,
     create_test_debugger
 )
-from piplines.core import PipelineStep
+from config.config import config
+from config.paths import WORKING_MEMORY_DIR
+from piplines.checkpoint import DEFAULT_CHECKPOINT_DIR, CheckpointStore
+from piplines.core import PipelineStep, aiter_stream
+from piplines.registry import get_agent_pool, get_prompt_registry
+from piplines.response_cache import get_response_cache
+from piplines.scheduler import AsyncStageScheduler, StageScheduler
+from piplines.transport import FrameCoalescer
+from tools.cancellation import CancelToken, get_cancel_metrics
+from utils.context_utils import compact_plantuml, slice_class_diagram
 from utils.dataset_utils import load_dataset
 from utils.file_utils import read_file
 from utils.file_utils import write_file
-from utils.memory_utils import Memory
+from utils.memory_utils import Memory, ModuleStreamParser
 
 
 class TestAgentApp:
     DEBUG_RUN = {4, 5}
 
-    def __init__(self, *, dataset_name):
+    # 提示词：属性名 -> (文件路径, 是否为 Jinja 模板)；由进程级 PromptRegistry 缓存，文件修改后自动重新加载
+    PROMPTS = {
+        'cot1_desc': ('prompt/test_plan/test_plan.md', True),
+        'cot1_out': ('prompt/test_plan/test_plan_out.md', False),
+        'cot2_desc': ('prompt/test_design/test_design.md', True),
+        'cot2_out': ('prompt/test_design/test_design_out.md', False),
+        'cot4_desc': ('prompt/test_development/test_develop.md', True),
+        'cot4_out': ('prompt/test_development/test_develop_out.md', False),
+        'cot5_desc': ('prompt/test_debugger/test_debug.md', True),
+        'cot5_out': ('prompt/test_debugger/test_debug_out.md', False),
+    }
+
+    # 角色 -> agent 工厂；agent 连同 LLM 客户端与工具实例由进程级 AgentPool 跨运行复用
+    AGENT_FACTORIES = {
+        'architect': create_test_architect,
+        'designer': create_test_designer,
+        'developer': create_test_development_engineer,
+        'debugger': create_test_debugger,
+    }
+
+    def __init__(self, *, dataset_name, stages=None, working_dir=None):
         self.dataset_name = dataset_name
+        # 中间文件（测试计划、测试设计、generatedTest.txt）所在目录。后台运行各自给出独立目录，
+        # 并发运行互不覆盖；未给出时直接使用共享的 working_memory
+        self.working_dir = Path(working_dir) if working_dir is not None else WORKING_MEMORY_DIR
+        self._seed_working_memory()
+        # 只运行指定的流水线阶段（1/2/4/5），未给出时使用 DEBUG_RUN
+        if stages is not None:
+            self.DEBUG_RUN = set(stages)
         self.data = load_dataset(dataset_name)
-        self.test_architect = create_test_architect()
-        self.test_designer=create_test_designer()
-        self.test_developer=create_test_development_engineer()
-        self.test_debugger=create_test_debugger()
-        self.cot1_desc = read_file('prompt/test_plan/test_plan.md')
-        self.cot1_out = read_file('prompt/test_plan/test_plan_out.md')
-        self.cot2_desc = read_file('prompt/test_design/test_design.md')
-        self.cot2_out = read_file('prompt/test_design/test_design_out.md')
-        self.cot4_desc = read_file('prompt/test_development/test_develop.md')
-        self.cot4_out = read_file('prompt/test_development/test_develop_out.md')
-        self.cot5_desc=read_file('prompt/test_debugger/test_debug.md')
-        self.cot5_out=read_file('prompt/test_debugger/test_debug_out.md')
-
-    def _pack_msg(self, type_str, data):
-        """辅助函数：将数据打包成 JSON 行"""
-        return json.dumps({
+        self.agents = get_agent_pool(self.AGENT_FACTORIES, config.get('pipeline', {}).get('agent_pool'))
+        # 阶段 2/4/5 的全局并发上限（模块之间流水线并行）
+        self.max_concurrency = config.get('pipeline', {}).get('max_concurrency', 4)
+        # 内容寻址的阶段检查点（默认关闭）：重跑时复用未变化的测试计划（阶段 1）与测试设计（阶段 2）；
+        # 阶段 4/5 会写测试文件、运行测试，结果取决于磁盘上的代码，不做检查点
+        checkpoint_cfg = config.get('pipeline', {}).get('checkpoint', {})
+        self.checkpoints = CheckpointStore(checkpoint_cfg.get('dir', DEFAULT_CHECKPOINT_DIR)) \
+            if checkpoint_cfg.get('enabled', False) else None
+        # 可选的 LLM 响应缓存（内存 LRU + 磁盘），默认关闭；同样只用于不执行工具的阶段 1/2
+        self.response_cache = get_response_cache(config.get('llm_cache'))
+        # 本次运行的取消标记：客户端断开或调用取消接口时停止 LLM 流并结束测试子进程
+        self.cancel = CancelToken()
+        prompts = get_prompt_registry()
+        for attr, (path, _) in self.PROMPTS.items():
+            setattr(self, attr, prompts.text(path))
+
+    @property
+    def _isolated(self):
+        return self.working_dir.resolve() != WORKING_MEMORY_DIR.resolve()
+
+    def _seed_working_memory(self):
+        """独立工作目录：先复制共享目录中上次运行留下的中间文件，跳过的阶段（如只跑 4/5）照常读取它们"""
+        self.working_dir.mkdir(parents=True, exist_ok=True)
+        if not self._isolated or not WORKING_MEMORY_DIR.is_dir():
+            return
+        for src in WORKING_MEMORY_DIR.iterdir():
+            dst = self.working_dir / src.name
+            if src.is_file() and not src.name.endswith('.tmp') and not dst.exists():
+                shutil.copyfile(src, dst)
+
+    def _publish_working_memory(self):
+        """运行正常结束后把本次的中间文件发布到共享目录（逐个文件先写临时文件再替换），供之后的运行使用"""
+        if not self._isolated:
+            return
+        WORKING_MEMORY_DIR.mkdir(parents=True, exist_ok=True)
+        for src in self.working_dir.iterdir():
+            if not src.is_file() or src.name.endswith('.tmp'):
+                continue
+            tmp = WORKING_MEMORY_DIR / f"{src.name}.{os.getpid()}.{threading.get_ident()}.tmp"
+            shutil.copyfile(src, tmp)
+            os.replace(tmp, WORKING_MEMORY_DIR / src.name)
+
+    def _plan_path(self):
+        return self.working_dir / 'test_plan.json'
+
+    def _test_case_path(self, module):
+        return self.working_dir / ('test_case_' + module.name + '.md')
+
+    @classmethod
+    def warm_up(cls):
+        """
+        服务启动时调用：加载并编译全部提示词，按并发度预先创建各角色的 agent，
+        之后每次运行的准备工作只剩读取数据集。返回预热统计。
+        """
+        prompts = get_prompt_registry()
+        prompts.preload(templates=[p for p, is_template in cls.PROMPTS.values() if is_template],
+                        texts=[p for p, is_template in cls.PROMPTS.values() if not is_template])
+        pipeline_cfg = config.get('pipeline', {})
+        # 模块级节点（阶段 2/4）按并发上限同时使用，阶段 1/5 各一个
+        per_module = pipeline_cfg.get('max_concurrency', 4) * config.get('server', {}).get('max_concurrent_runs', 1)
+        pool = get_agent_pool(cls.AGENT_FACTORIES, pipeline_cfg.get('agent_pool'))
+        pool.prewarm({'architect': 1, 'designer': per_module, 'developer': per_module, 'debugger': 1})
+        return {'prompts': prompts.stats(), 'agents': pool.stats()}
+
+    def _pack_msg(self, type_str, data, *, module=None, stage=None):
+        """辅助函数：将数据打包成 JSON 行（并发调度时附带模块名与阶段号）"""
+        msg = {
             "type": type_str,
             "data": data
-        }, ensure_ascii=False) + "\n"
+        }
+        if module is not None:
+            msg["module"] = module
+        if stage is not None:
+            msg["stage"] = stage
+        return json.dumps(msg, ensure_ascii=False) + "\n"
+
+    @staticmethod
+    def _iter_chunks(streaming_output, debug, echo=False, cancel=None):
+        """
+        遍历 crew 的流式输出，产出 ("content", 文本) 帧；debug 模式下直接打印。
+        echo=True 时 debug 模式下也产出帧（供调用方解析内容）。
+        cancel 被取消后在下一个块到达时抛出 RunCancelled，不再读取剩余的流。
+        """
+        for chunk in streaming_output:
+            if cancel is not None:
+                cancel.check()
+            # 【关键】发送内容块信号. 注意：需要取 chunk.content
+            content = chunk.content if hasattr(chunk, 'content') else str(chunk)
+            if debug:
+                print(content, end="", flush=True)
+                if not echo:
+                    continue
+            yield "content", content
+
+    @staticmethod
+    async def _aiter_chunks(streaming_output, debug, echo=False, cancel=None):
+        """_iter_chunks 的异步版本"""
+        async for chunk in aiter_stream(streaming_output):
+            if cancel is not None:
+                cancel.check()
+            content = chunk.content if hasattr(chunk, 'content') else str(chunk)
+            if debug:
+                print(content, end="", flush=True)
+                if not echo:
+                    continue
+            yield "content", content
+
+    def _plan(self, debug, dispatch, finish_dispatch):
+        """Cot1 — 测试计划；流式解析计划，模块对象一闭合就通过 dispatch 派发"""
+        try:
+            with self.agents.lease('architect') as architect:
+                step1, inputs = self._plan_step(architect)
+                streaming_output = step1.run(**inputs)
+
+                parser = ModuleStreamParser()
+                for frame in self._iter_chunks(streaming_output, debug, echo=True, cancel=self.cancel):
+                    for module in parser.feed(frame[1]):
+                        dispatch(module)
+                    if not debug:
+                        yield frame
+
+            self._dispatch_final_plan(streaming_output, dispatch)
+        finally:
+            # 无论计划成功与否都要封闭调度图，否则调度器会一直等待新节点
+            finish_dispatch()
+
+    async def _aplan(self, debug, dispatch, finish_dispatch):
+        """_plan 的异步版本"""
+        try:
+            with self.agents.lease('architect') as architect:
+                step1, inputs = self._plan_step(architect)
+                streaming_output = await step1.arun(**inputs)
+
+                parser = ModuleStreamParser()
+                async for frame in self._aiter_chunks(streaming_output, debug, echo=True, cancel=self.cancel):
+                    for module in parser.feed(frame[1]):
+                        dispatch(module)
+                    if not debug:
+                        yield frame
+
+            self._dispatch_final_plan(streaming_output, dispatch)
+        finally:
+            finish_dispatch()
+
+    def _plan_step(self, agent):
+        step1 = PipelineStep(
+            agent=agent,
+            template_text=self.cot1_desc,
+            expected_output=self.cot1_out,
+            # 测试计划由 _dispatch_final_plan 写入本次运行的工作目录
+            output_file='',
+            checkpoint=self.checkpoints,
+            cache=self.response_cache,
+            cancel=self.cancel,
+            working_dir=self.working_dir
+        )
+        # 测试计划需要全局视角，不按模块切片，只去掉渲染指令/注释等噪声
+        inputs = dict(
+            srs=self.data.srs,
+            class_diagram=compact_plantuml(self.data.uml_class),
+            sequence_diagram=compact_plantuml(self.data.uml_sequence)
+        )
+        return step1, inputs
+
+    def _dispatch_final_plan(self, streaming_output, dispatch):
+        raw = streaming_output.result.raw
+        write_file(path=self._plan_path(), content=raw, overwrite=True)
+        # 兜底：以最终计划为准，补派流式解析遗漏的模块
+        final_parser = ModuleStreamParser()
+        final_parser.feed(raw)
+        modules = final_parser.modules or Memory(self._plan_path()).modules
+        for module in modules:
+            dispatch(module)
+
+    def _design_step(self, agent):
+        # 每个节点从池中独占借用 agent，避免并发执行时共享状态
+        return PipelineStep(
+            agent=agent,
+            template_text=self.cot2_desc,
+            expected_output=self.cot2_out,
+            output_file='',
+            checkpoint=self.checkpoints,
+            cache=self.response_cache,
+            cancel=self.cancel,
+            working_dir=self.working_dir
+        )
+
+    @staticmethod
+    def _design_title(module):
+        # 这里可能需要在内容里加个标题，说明正在设计哪个模块
+        return f"\n\n**正在设计模块: {module.name if hasattr(module, 'name') else '...'}**\n\n"
+
+    def _save_design(self, module, step2_out):
+        result = step2_out.result.raw
+        # 覆盖写入：重跑/回放同一模块时不会重复追加
+        write_file(path=self._test_case_path(module), content=result, overwrite=True)
+
+    def _design_module(self, module, debug):
+        """Cot2 — 单个模块的测试设计"""
+        yield "content", self._design_title(module)
+
+        with self.agents.lease('designer') as designer:
+            step2_out = self._design_step(designer).run(sut=module.to_json)
+            yield from self._iter_chunks(step2_out, debug, cancel=self.cancel)
+        self._save_design(module, step2_out)
+
+    async def _adesign_module(self, module, debug):
+        """_design_module 的异步版本"""
+        yield "content", self._design_title(module)
+
+        with self.agents.lease('designer') as designer:
+            step2_out = await self._design_step(designer).arun(sut=module.to_json)
+            async for frame in self._aiter_chunks(step2_out, debug, cancel=self.cancel):
+                yield frame
+        self._save_design(module, step2_out)
+
+    def _develop_step(self, module, agent):
+        step4 = PipelineStep(
+            agent=agent,
+            template_text=self.cot4_desc,
+            expected_output=self.cot4_out,
+            output_file='',
+            cancel=self.cancel,
+            working_dir=self.working_dir
+        )
+        testcase = read_file(self._test_case_path(module))
+        inputs = dict(
+            language=self.data.language,
+            available_tools=self.tools_prompt(self.data.language),
+            TEST_CASES_JSON=testcase,
+            # 只传入本模块的类及其直接依赖，而不是整张类图
+            class_diagram=slice_class_diagram(self.data.uml_class, module.classes),
+            ROOT_DIR=self.data.sut_root
+        )
+        return step4, inputs
+
+    def _develop_module(self, module, debug):
+        """Cot4 — 单个模块的测试开发"""
+        with self.agents.lease('developer') as developer:
+            step4, inputs = self._develop_step(module, developer)
+            step4_output = step4.run(**inputs)
+            yield from self._iter_chunks(step4_output, debug, cancel=self.cancel)
+
+    async def _adevelop_module(self, module, debug):
+        """_develop_module 的异步版本"""
+        with self.agents.lease('developer') as developer:
+            step4, inputs = self._develop_step(module, developer)
+            step4_output = await step4.arun(**inputs)
+            async for frame in self._aiter_chunks(step4_output, debug, cancel=self.cancel):
+                yield frame
+
+    def _debug_step(self, agent):
+        step5 = PipelineStep(
+            agent=agent,
+            template_text=self.cot5_desc,
+            expected_output=self.cot5_out,
+            output_file='output/'+self.data.dataset_name+'_test_report.md',
+            cancel=self.cancel,
+            working_dir=self.working_dir
+        )
+        test_suit=read_file(self.working_dir / 'generatedTest.txt')
+        inputs = dict(
+            test_suit=test_suit,
+            ROOT_DIR=self.data.sut_root
+        )
+        return step5, inputs
+
+    def _debug_suite(self, debug):
+        """Cot5 — 运行全部生成的测试"""
+        with self.agents.lease('debugger') as debugger:
+            step5, inputs = self._debug_step(debugger)
+            step5_output=step5.run(**inputs)
+            yield from self._iter_chunks(step5_output, debug, cancel=self.cancel)
+
+    async def _adebug_suite(self, debug):
+        """_debug_suite 的异步版本"""
+        with self.agents.lease('debugger') as debugger:
+            step5, inputs = self._debug_step(debugger)
+            step5_output = await step5.arun(**inputs)
+            async for frame in self._aiter_chunks(step5_output, debug, cancel=self.cancel):
+                yield frame
+
+    # 定义阶段索引映射 (对应前端 stages 数组的下标)
+    # ['测试计划', '测试设计', '测试评审', '测试开发', '测试运行']
+    STAGE_PLAN = 0
+    STAGE_DESIGN = 1
+    STAGE_REVIEW = 2
+    STAGE_DEV = 3
+    STAGE_RUN = 4
+    # 流水线阶段号 -> (前端阶段下标, 阶段名)
+    STAGE_FRAMES = {
+        1: (STAGE_PLAN, "测试计划"),
+        2: (STAGE_DESIGN, "测试设计"),
+        4: (STAGE_DEV, "测试开发"),
+        5: (STAGE_DEV, "测试开发"),
+    }
+
+    def _build_graph(self, scheduler, debug, *, plan, design, develop, debug_suite):
+        """
+        以 (模块, 阶段) 为节点构建 DAG；节点函数由调用方给出（同步或异步版本），两种调度器共用。
+        模块 A 在测试开发时，模块 B 可以同时在测试设计；阶段 3 (测试评审) 暂无处理
+        """
+        dispatched = {}
+
+        def dispatch(module):
+            """为一个模块添加阶段 2/4 节点（同名模块只派发一次）"""
+            if module.name in dispatched:
+                return
+            dispatched[module.name] = module
+            if 2 in self.DEBUG_RUN:
+                scheduler.add_node((module.name, 2), partial(design, module, debug))
+            if 4 in self.DEBUG_RUN:
+                deps = [(module.name, 2)] if 2 in self.DEBUG_RUN else []
+                scheduler.add_node((module.name, 4), partial(develop, module, debug), deps=deps)
+
+        def finish_dispatch():
+            """所有模块派发完毕：添加阶段 5 节点并封闭调度图"""
+            if 5 in self.DEBUG_RUN:
+                # 测试运行需要等所有模块的测试开发完成
+                scheduler.add_node((None, 5), partial(debug_suite, debug),
+                                   deps=scheduler.keys(lambda k: k[1] == 4))
+            scheduler.seal()
 
-    def stream_run(self, debug):
+        if 1 in self.DEBUG_RUN:
+            # 测试计划边生成边解析，每闭合一个模块就立即派发它的测试设计
+            scheduler.add_node((None, 1), partial(plan, debug, dispatch, finish_dispatch))
+        else:
+            # load working memory
+            memory = Memory(self._plan_path())
+            for module in memory.modules:
+                dispatch(module)
+            finish_dispatch()
+
+    def _event_msgs(self, event, started_stages):
+        """把调度器事件翻译成前端的 JSON 行（0 或 1 条）"""
+        module_name, stage = event.key
+        if event.kind == "start" and stage not in started_stages:
+            # 【关键】某阶段的第一个节点开始时发送阶段切换信号
+            started_stages.add(stage)
+            index, name = self.STAGE_FRAMES[stage]
+            yield self._pack_msg("stage", {"index": index, "name": name})
+        elif event.kind == "frame":
+            yield self._pack_msg(event.type_str, event.data, module=module_name, stage=stage)
+        elif event.kind == "end" and event.status != "done":
+            print(f"[scheduler] {event.key} {event.status}: {event.data}")
+            yield self._pack_msg("error", {"status": event.status, "detail": event.data},
+                                 module=module_name, stage=stage)
+
+    @staticmethod
+    def _stream_settings():
+        """返回 (帧合并器, 调度器的帧缓冲上限)，见配置中的 stream 段"""
+        stream_cfg = config.get('stream', {})
+        coalescer = FrameCoalescer(stream_cfg.get('coalesce_window_ms', 50) / 1000,
+                                   stream_cfg.get('coalesce_max_bytes', 8192))
+        return coalescer, stream_cfg.get('max_buffered_frames', 1024)
+
+    def _abandon(self, reason):
+        """流未读完就被关闭：取消本次运行（已被其他地方取消时不重复计数）"""
+        if self.cancel.cancel(reason):
+            get_cancel_metrics().record_run(reason)
+
+    def stream_run(self, debug, cancel=None):
+        """
+        产出流水线的 JSON 行。调用方关闭生成器（WSGI 服务器在客户端断开后的下一次写入失败时关闭它）
+        即视为客户端断开：取消本次运行，尚未开始的节点不再执行，执行中的 LLM 流与测试子进程随之结束。
+        """
+        if cancel is not None:
+            self.cancel = cancel
         print(self.data.dataset_name)
         print(self.data.dataset_root)
-        # 定义阶段索引映射 (对应前端 stages 数组的下标)
-        # ['测试计划', '测试设计', '测试评审', '测试开发', '测试运行']
-        STAGE_PLAN = 0
-        STAGE_DESIGN = 1
-        STAGE_REVIEW = 2
-        STAGE_DEV = 3
-        STAGE_RUN = 4
-
-
-        # --------------------------------------------------------------------
-        # Cot1 — Test planning (测试计划)
-        # --------------------------------------------------------------------
-        if 1 in self.DEBUG_RUN:
-            if not debug:
-                yield self._pack_msg("stage", {"index": STAGE_PLAN, "name": "测试计划"})
-
-            step1 = PipelineStep(
-                agent=self.test_architect,
-                template_text=self.cot1_desc,
-                expected_output=self.cot1_out,
-                output_file="memory/working_memory/test_plan.json"
-            )
-
-            streaming_output = step1.run(
-                srs=self.data.srs,
-                class_diagram=self.data.uml_class,
-                sequence_diagram=self.data.uml_sequence
-            )
-
-            for chunk in streaming_output:
-                # 【关键】发送内容块信号. 注意：需要取 chunk.content
-                content = chunk.content if hasattr(chunk, 'content') else str(chunk)
-                if debug:
-                    print(chunk.content, end="", flush=True)
-                else:
-                    yield self._pack_msg("content", content)
-            # 如果需要保留结果供后续使用
-            final1 = streaming_output.result
-
-        # load working memory
-        memory = Memory('memory/working_memory/test_plan.json')
-        modules = memory.modules
-        # --------------------------------------------------------------------
-        # Cot2 — Test design (测试设计)
-        # --------------------------------------------------------------------
-        if 2 in self.DEBUG_RUN:
-            # 【关键】发送阶段切换信号 -> 切换到第二个页签/进度
-            yield self._pack_msg("stage", {"index": STAGE_DESIGN, "name": "测试设计"})
-
-            step2 = PipelineStep(
-                agent=self.test_designer,
-                template_text=self.cot2_desc,
-                expected_output=self.cot2_out,
-                output_file=''
-            )
-            for module in modules:
-                # 这里可能需要在内容里加个标题，说明正在设计哪个模块
-                yield self._pack_msg("content",
-                                     f"\n\n**正在设计模块: {module.name if hasattr(module, 'name') else '...'}**\n\n")
-
-                step2_out = step2.run(sut=module.to_json)
-                for chunk in step2_out:
-                    content = chunk.content if hasattr(chunk, 'content') else str(chunk)
-                    if debug:
-                        print(chunk.content, end="", flush=True)
-                    else:
-                        yield self._pack_msg("content", content)
-                result = step2_out.result.raw
-                write_file(path='memory/working_memory/test_case_' + module.name+'.md', content=result, overwrite=False)
-
-        # --------------------------------------------------------------------
-        # 跳过阶段 3 (测试评审) 的处理
-        # --------------------------------------------------------------------
-        # 如果这里没有实际逻辑，但你想让进度条跳过，可以发一个空信号，或者直接进入阶段4
-
-        # --------------------------------------------------------------------
-        # Cot4 — Test develop (测试开发)
-        # --------------------------------------------------------------------
-        if 4 in self.DEBUG_RUN:
-            # 【关键】发送阶段切换信号 -> 对应前端 index 3
-            yield self._pack_msg("stage", {"index": STAGE_DEV, "name": "测试开发"})
-            step4 = PipelineStep(
-                agent=self.test_developer,
-                template_text=self.cot4_desc,
-                expected_output=self.cot4_out,
-                output_file=''
-            )
-            for module in modules:
-                testcase = read_file('memory/working_memory/test_case_' + module.name + ".md")
-                step4_output = step4.run(
-                    language=self.data.language,
-                    available_tools=self.tools_prompt(self.data.language),
-                    TEST_CASES_JSON=testcase,
-                    class_diagram=self.data.uml_class,
-                    ROOT_DIR=self.data.sut_root
-                )
-                for chunk in step4_output:
-                    content = chunk.content if hasattr(chunk, 'content') else str(chunk)
-                    if debug:
-                        print(chunk.content, end="", flush=True)
-                    else:
-                        yield self._pack_msg("content", content)
-
-        # --------------------------------------------------------------------
-        # Cot5 — Test run (测试运行)
-        # --------------------------------------------------------------------
-        if 5 in self.DEBUG_RUN:
-            yield self._pack_msg("stage", {"index": STAGE_DEV, "name": "测试开发"})
-            step5 = PipelineStep(
-                agent=self.test_debugger,
-                template_text=self.cot5_desc,
-                expected_output=self.cot5_out,
-                output_file='output/'+self.data.dataset_name+'_test_report.md'
-            )
-            test_suit=read_file('memory/working_memory/generatedTest.txt')
-            step5_output=step5.run(
-                test_suit=test_suit,
-                ROOT_DIR=self.data.sut_root
-            )
-            for chunk in step5_output:
-                content = chunk.content if hasattr(chunk, 'content') else str(chunk)
-                if debug:
-                    print(chunk.content, end="", flush=True)
-                else:
-                    yield self._pack_msg("content", content)
-
-
+        coalescer, max_buffered = self._stream_settings()
+        scheduler = StageScheduler(max_concurrency=self.max_concurrency, cancel=self.cancel,
+                                   max_buffered=max_buffered)
+        self._build_graph(scheduler, debug, plan=self._plan, design=self._design_module,
+                          develop=self._develop_module, debug_suite=self._debug_suite)
+
+        started_stages = set()
+        events = scheduler.stream(tick_sec=coalescer.tick_sec)
+        completed = False
+        try:
+            for event in events:
+                # 连续的 LLM 文本块合并后再打包，一个 token 不再对应一次序列化与一次 HTTP 写入
+                for merged in coalescer.feed(event):
+                    yield from self._event_msgs(merged, started_stages)
+            for merged in coalescer.flush():
+                yield from self._event_msgs(merged, started_stages)
+            completed = True
+            if not self.cancel.cancelled:
+                self._publish_working_memory()
+        finally:
+            if not completed:
+                self._abandon("client_disconnected")
+            events.close()
+
+    async def astream_run(self, debug, cancel=None):
+        """
+        stream_run 的 asyncio 版本：产出相同格式的 JSON 行。
+        所有节点都是同一事件循环上的协程，一个进程可以同时驱动多次运行；
+        调用方关闭该异步生成器（如客户端断开）时，未完成的节点随之取消。
+        cancel 给出时使用调用方的取消标记（如 JobManager 的取消接口）。
+        """
+        if cancel is not None:
+            self.cancel = cancel
+        print(self.data.dataset_name)
+        print(self.data.dataset_root)
+        coalescer, max_buffered = self._stream_settings()
+        scheduler = AsyncStageScheduler(max_concurrency=self.max_concurrency, cancel=self.cancel,
+                                        max_buffered=max_buffered)
+        self._build_graph(scheduler, debug, plan=self._aplan, design=self._adesign_module,
+                          develop=self._adevelop_module, debug_suite=self._adebug_suite)
+
+        started_stages = set()
+        events = scheduler.stream(tick_sec=coalescer.tick_sec)
+        completed = False
+        try:
+            async for event in events:
+                for merged in coalescer.feed(event):
+                    for msg in self._event_msgs(merged, started_stages):
+                        yield msg
+            for merged in coalescer.flush():
+                for msg in self._event_msgs(merged, started_stages):
+                    yield msg
+            completed = True
+            if not self.cancel.cancelled:
+                await asyncio.to_thread(self._publish_working_memory)
+        finally:
+            if not completed:
+                # 线程中执行的工具（同步 crewAI 调用）不受任务取消影响，靠取消标记结束它们的子进程
+                self._abandon("stream_closed")
+            # 显式关闭：异步生成器不会在被丢弃时立即清理
+            await events.aclose()
 
     def run(self):
         print("\nStarting TestAgent Pipeline...\n")
@@ -184,7 +506,7 @@ class TestAgentApp:
             print("Step 1: Test planning...")
 
             step1 = PipelineStep(
-                agent=self.test_architect,
+                agent=create_test_architect(),
                 template_text=self.cot1_desc,
                 expected_output=self.cot1_out,
                 output_file="output/"+docs.dataset_name+"_test_plan.md"
@@ -214,7 +536,7 @@ class TestAgentApp:
             modules = memory.modules
             cot2_outs=[]
             step2 = PipelineStep(
-                agent=self.test_designer,
+                agent=create_test_designer(),
                 template_text=self.cot2_desc,
                 expected_output=self.cot2_out,
                 output_file=''
@@ -244,7 +566,7 @@ class TestAgentApp:
 
             testcase=read_file(r'D:\BJFU\Project\PythonProject\crewai\test_crew\src\test_crew\output\stocktestcase.md')
             step4 = PipelineStep(
-                agent=self.test_developer,
+                agent=create_test_development_engineer(),
                 template_text=self.cot4_desc,
                 expected_output=self.cot4_out,
                 output_file=''
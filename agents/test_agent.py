@@ -13,6 +13,9 @@ llm = LLM(
     base_url=config.config['llm']['base_url']
 )
 
+# 工具的运维配置（并发、开关等），以构造参数传入，不暴露给 LLM
+tools_config = config.config.get('tools') or {}
+
 
 def create_test_architect():
     return Agent(
@@ -44,7 +47,14 @@ def create_test_development_engineer():
         goal="Develop text unit test cases into automated code, using Junit or UnitTest frameworks to ensure that the code is compiled correctly, and use a range of tools to assist you in coding.",
         backstory="Experienced test and development engineer, skilled in developing test cases into test code based on text test cases and project code structures written by testers, proficient in Junit and UnitTest frameworks.",
         llm=llm,
-        tools=[CodeSearchTool(), RunProjectGeneratedTestsTool(), WriteCodeFileTool(),MavenJUnitTool(),SearchJavaCodeTool()]
+        tools=[
+            CodeSearchTool(**tools_config.get('code_search', {})),
+            RunProjectGeneratedTestsTool(**tools_config.get('run_py_test', {})),
+            WriteCodeFileTool(**tools_config.get('write_code_file', {}),
+                              runner_config=tools_config.get('run_py_test', {})),
+            MavenJUnitTool(**tools_config.get('run_junit_tests', {})),
+            SearchJavaCodeTool(),
+        ]
     )
 
 def create_test_debugger():
@@ -58,7 +68,12 @@ def create_test_debugger():
         analyzing failure reasons, locating defect root causes, and structuring the results into reproducible and traceable test reports.
         """,
         llm=llm,
-        tools=[CodeSearchTool(), RunProjectGeneratedTestsTool(),MavenJUnitTool(),SearchJavaCodeTool()]
+        tools=[
+            CodeSearchTool(**tools_config.get('code_search', {})),
+            RunProjectGeneratedTestsTool(**tools_config.get('run_py_test', {})),
+            MavenJUnitTool(**tools_config.get('run_junit_tests', {})),
+            SearchJavaCodeTool(),
+        ]
     )
 
 
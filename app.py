@@ -1,9 +1,11 @@
 import sys
 
-from flask import Flask, Response, stream_with_context
+from flask import Flask, Response, request, stream_with_context
 from flask_cors import CORS
 
 from agent import TestAgentApp
+from config.config import config
+from piplines.transport import encode_stream, negotiate_encoding
 
 app = Flask(__name__)
 
@@ -16,18 +18,27 @@ CORS(
 
 @app.route('/run', methods=['GET'])
 def run():
-    dataset = 'stock'
-    agent_app = TestAgentApp(dataset)
+    # 同步版本：整次运行占用一个请求线程，断开即丢失；后台队列与断线续读见 asgi_app.py
+    dataset = request.args.get('dataset') or 'stock'
+    agent_app = TestAgentApp(dataset_name=dataset)
+    stream_cfg = config.get('stream', {})
+    encoding = negotiate_encoding(request.headers.get('Accept-Encoding', ''), stream_cfg.get('compression', True))
 
-    # 直接使用 stream_run，因为它现在已经是 generate json string 了
+    headers = {
+        'X-Accel-Buffering': 'no',
+        'Cache-Control': 'no-cache',
+        'Connection': 'keep-alive',
+        'Vary': 'Accept-Encoding',
+    }
+    if encoding:
+        headers['Content-Encoding'] = encoding
+
+    # 直接使用 stream_run，因为它现在已经是 generate json string 了；按需压缩，每帧后同步刷新
     response = Response(
-        stream_with_context(agent_app.stream_run()),
+        stream_with_context(encode_stream(agent_app.stream_run(debug=False), encoding,
+                                          stream_cfg.get('compression_level', 6))),
         mimetype='application/json', # 建议改为 json 或 text/event-stream
-        headers={
-            'X-Accel-Buffering': 'no',
-            'Cache-Control': 'no-cache',
-            'Connection': 'keep-alive',
-        }
+        headers=headers
     )
     return response
 
@@ -53,4 +64,7 @@ def run():
     return response
 
 if __name__ == "__main__":
+    if config.get('pipeline', {}).get('agent_pool', {}).get('prewarm', True):
+        # 预先加载提示词并创建 agent，第一次请求不必再等待
+        print(f"[warm-up] {TestAgentApp.warm_up()}")
     app.run(debug=True, threaded=True)
@@ -0,0 +1,355 @@
+"""
+ASGI 版本的流式接口（不依赖 Web 框架，用 uvicorn 等 ASGI 服务器运行）：
+
+    uvicorn asgi_app:app --host 0.0.0.0 --port 5000
+
+运行在后台队列中执行（piplines/jobs.py），与 HTTP 连接解耦：客户端断开、代理超时都不影响运行，
+重新连接时凭 Last-Event-ID 从断点续读，不会重跑。每次运行都是事件循环上的协程（TestAgentApp.astream_run），
+等待 LLM 与测试子进程时不占用线程。
+
+- POST /runs                    创建运行：JSON {"dataset": "stock", "stages": [1, 2, 4, 5]}，返回 run_id；
+                                "cancel_on_disconnect": true 时没有客户端连接（宽限期后）即取消运行
+- GET  /runs                    运行列表
+- GET  /runs/<run_id>           运行状态
+- GET  /runs/<run_id>/events    事件流：默认 SSE（id 为帧序号），从 Last-Event-ID 头或 ?last_event_id= 之后续读
+- POST /runs/<run_id>/cancel    取消运行：停止 LLM 流，结束测试子进程组
+- GET  /run?dataset=stock       兼容旧接口：创建运行并直接输出它的事件流；客户端断开超过宽限期后运行被取消
+- GET  /metrics                 取消带来的节省、队列状态与提示词 / agent 复用情况
+
+帧格式与 app.py 相同（{"type", "data"} JSON 行）：
+- /run 默认按行输出 NDJSON，mate-ui 无需改动；/runs/<run_id>/events 加 ?format=ndjson 同样输出 NDJSON
+- SSE 时每帧一个 data 事件，运行结束后发送 event: end（data 为运行状态）并关闭连接
+- 客户端声明 Accept-Encoding 时按 gzip / deflate 压缩事件流（配置 stream.compression）；
+  已就绪的多帧（如续读时回放日志）合并为一次写入；每次写入都等待服务器发送完毕，慢客户端不会造成无限缓冲
+"""
+import asyncio
+import json
+import re
+import traceback
+from urllib.parse import parse_qs
+
+from agent import TestAgentApp
+from config.config import config
+from piplines.jobs import QueueFull, get_job_manager
+from piplines.registry import get_agent_pool, get_prompt_registry
+from piplines.transport import StreamEncoder, negotiate_encoding
+from tools.cancellation import get_cancel_metrics
+
+# 长时间没有帧时发送的心跳间隔（秒），避免代理断开空闲连接
+KEEPALIVE_SEC = 15
+
+# 已就绪的帧合并写入时单次写入的上限（字节，压缩前）
+WRITE_BATCH_BYTES = 64 * 1024
+
+CORS_HEADERS = [
+    (b"access-control-allow-origin", b"*"),
+    (b"access-control-allow-methods", b"GET, POST, OPTIONS"),
+    (b"access-control-allow-headers", b"*"),
+]
+
+STREAM_HEADERS = [
+    (b"x-accel-buffering", b"no"),
+    (b"cache-control", b"no-cache"),
+]
+
+
+def _query(scope):
+    params = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+    return {k: v[-1] for k, v in params.items()}
+
+
+def _header(scope, name: bytes) -> str:
+    for k, v in scope.get("headers", []):
+        if k.lower() == name:
+            return v.decode("latin-1")
+    return ""
+
+
+async def _send_json(send, status, payload):
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", b"application/json"), *CORS_HEADERS]})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _watch_disconnect(receive, disconnected: asyncio.Event):
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            disconnected.set()
+            return
+
+
+async def _read_json(receive):
+    body = b""
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return None
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            break
+    return json.loads(body) if body.strip() else {}
+
+
+def _encoding(scope):
+    """按 Accept-Encoding 与配置选择响应压缩"""
+    stream_cfg = config.get("stream", {})
+    return negotiate_encoding(_header(scope, b"accept-encoding"), stream_cfg.get("compression", True))
+
+
+async def _stream(receive, send, frames, sse, headers=(), encoding=None):
+    """
+    把 (事件 id, 事件名, JSON 行) 的异步生成器写成流式响应：SSE 时写出 id / event 字段，NDJSON 时只写行。
+    encoding 为 gzip / deflate 时增量压缩，每次写入后同步刷新，客户端可以立即解出已收到的帧。
+    客户端断开时停止并关闭生成器；后台运行不受影响。
+    """
+    content_type = b"text/event-stream; charset=utf-8" if sse else b"application/json"
+    encoder = StreamEncoder(encoding, config.get("stream", {}).get("compression_level", 6))
+    encoding_headers = [(b"vary", b"accept-encoding")]
+    if encoding:
+        encoding_headers.append((b"content-encoding", encoding.encode("ascii")))
+    await send({"type": "http.response.start", "status": 200,
+                "headers": [(b"content-type", content_type), *STREAM_HEADERS, *CORS_HEADERS,
+                            *encoding_headers, *headers]})
+
+    pending = bytearray()
+
+    async def write(extra=b""):
+        body = bytes(pending) + extra
+        pending.clear()
+        if body:
+            # ASGI 服务器在发送缓冲满时才让 send 返回，慢客户端因此会拖慢这里而不是堆积在内存里
+            await send({"type": "http.response.body", "body": encoder.encode(body), "more_body": True})
+
+    disconnected = asyncio.Event()
+    watcher = asyncio.ensure_future(_watch_disconnect(receive, disconnected))
+    gone = asyncio.ensure_future(disconnected.wait())
+    nxt = None
+    try:
+        while True:
+            # 下一帧用独立任务等待：心跳超时不能取消生成器本身
+            if nxt is None:
+                nxt = asyncio.ensure_future(frames.__anext__())
+            if pending:
+                # 让出一次事件循环：下一帧已经就绪（回放日志、合并后的连续帧）时继续攒批，否则先写出
+                await asyncio.sleep(0)
+                if not nxt.done() or len(pending) >= WRITE_BATCH_BYTES:
+                    await write()
+            done, _ = await asyncio.wait({nxt, gone}, timeout=KEEPALIVE_SEC if sse else None,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if gone in done:
+                return
+            if nxt not in done:
+                await write(b": keep-alive\n\n")
+                continue
+            try:
+                event_id, event, line = nxt.result()
+            except StopAsyncIteration:
+                break
+            finally:
+                nxt = None
+            if sse:
+                fields = ([f"id: {event_id}"] if event_id is not None else []) + \
+                         ([f"event: {event}"] if event else [])
+                body = "".join(f + "\n" for f in fields) + f"data: {line.rstrip()}\n\n"
+            else:
+                body = line if line.endswith("\n") else line + "\n"
+            pending += body.encode("utf-8")
+        await write()
+        await send({"type": "http.response.body", "body": encoder.finish()})
+    finally:
+        if nxt is not None:
+            # 等取消落到生成器内部，之后才能关闭它
+            nxt.cancel()
+            await asyncio.gather(nxt, return_exceptions=True)
+        watcher.cancel()
+        gone.cancel()
+        await frames.aclose()
+
+
+async def _run_pipeline(run):
+    """JobManager 的执行函数：构造 TestAgentApp 并产出它的 JSON 行"""
+    # 构造时读取数据集与提示词文件，放到线程池，避免阻塞其他运行；中间文件写在本次运行自己的工作目录
+    agent_app = await asyncio.to_thread(TestAgentApp, dataset_name=run.dataset, stages=run.stages,
+                                        working_dir=run.working_dir)
+    lines = agent_app.astream_run(debug=False, cancel=run.cancel_token)
+    try:
+        async for line in lines:
+            yield line
+    finally:
+        await lines.aclose()
+
+
+def _jobs():
+    return get_job_manager(_run_pipeline, config.get("server", {}))
+
+
+def _parse_stages(value):
+    """stages 可以是整数列表或逗号分隔的字符串；返回 None 表示使用默认阶段，非法时抛出 ValueError"""
+    if value is None or value == "":
+        return None
+    if isinstance(value, str):
+        value = [v for v in value.split(",") if v.strip()]
+    stages = sorted({int(v) for v in value})
+    unknown = [st for st in stages if st not in TestAgentApp.STAGE_FRAMES]
+    if unknown or not stages:
+        raise ValueError(f"unknown stages {unknown}; valid stages are {sorted(TestAgentApp.STAGE_FRAMES)}")
+    return stages
+
+
+async def _submit(send, dataset, stages, cancel_on_disconnect=False):
+    """创建一次运行；参数非法或队列已满时直接写出错误响应并返回 None"""
+    try:
+        stages = _parse_stages(stages)
+    except (TypeError, ValueError) as e:
+        await _send_json(send, 400, {"type": "error", "data": {"status": "bad_request", "detail": str(e)}})
+        return None
+    if not isinstance(dataset, str) or not dataset:
+        await _send_json(send, 400, {"type": "error", "data": {"status": "bad_request", "detail": "dataset is required"}})
+        return None
+    try:
+        return _jobs().submit(dataset, stages, cancel_on_disconnect=bool(cancel_on_disconnect))
+    except QueueFull as e:
+        await _send_json(send, 429, {"type": "error", "data": {"status": "queue_full", "detail": str(e)}})
+        return None
+
+
+async def _run_frames(run, after):
+    frames = _jobs().follow(run, after)
+    try:
+        async for seq, line in frames:
+            yield seq, None, line
+    finally:
+        # 立即注销订阅，断开的宽限期从此刻开始计算
+        await frames.aclose()
+    end = {"type": "end", "data": {"status": run.status, "error": run.error}}
+    yield None, "end", json.dumps(end, ensure_ascii=False)
+
+
+def _last_event_id(scope, params):
+    value = _header(scope, b"last-event-id") or params.get("last_event_id") or "0"
+    try:
+        return max(0, int(value))
+    except ValueError:
+        return 0
+
+
+async def create_run(scope, receive, send):
+    try:
+        body = await _read_json(receive)
+    except ValueError:
+        await _send_json(send, 400, {"type": "error", "data": {"status": "bad_request", "detail": "invalid JSON body"}})
+        return
+    if body is None:
+        return
+    params = _query(scope)
+    run = await _submit(send, body.get("dataset") or params.get("dataset"), body.get("stages", params.get("stages")),
+                        body.get("cancel_on_disconnect", False))
+    if run is None:
+        return
+    await _send_json(send, 202, {**run.to_dict(), "events_url": f"/runs/{run.run_id}/events"})
+
+
+async def list_runs(scope, receive, send):
+    jobs = _jobs()
+    await _send_json(send, 200, {"runs": jobs.list(), **jobs.stats()})
+
+
+async def get_run(scope, receive, send, run_id):
+    run = _jobs().get(run_id)
+    if run is None:
+        await _send_json(send, 404, {"type": "error", "data": {"status": "not_found", "detail": run_id}})
+        return
+    await _send_json(send, 200, run.to_dict())
+
+
+async def cancel_run(scope, receive, send, run_id):
+    run = _jobs().cancel(run_id)
+    if run is None:
+        await _send_json(send, 404, {"type": "error", "data": {"status": "not_found", "detail": run_id}})
+        return
+    await _send_json(send, 202 if not run.finished else 200, run.to_dict())
+
+
+async def metrics(scope, receive, send):
+    try:
+        agents = get_agent_pool().stats()
+    except RuntimeError:
+        agents = None  # 尚未创建过运行，也未预热
+    await _send_json(send, 200, {"cancellation": get_cancel_metrics().snapshot(), "jobs": _jobs().stats(),
+                                 "prompts": get_prompt_registry().stats(), "agents": agents})
+
+
+async def run_events(scope, receive, send, run_id):
+    run = _jobs().get(run_id)
+    if run is None:
+        await _send_json(send, 404, {"type": "error", "data": {"status": "not_found", "detail": run_id}})
+        return
+    params = _query(scope)
+    sse = params.get("format") != "ndjson"
+    await _stream(receive, send, _run_frames(run, _last_event_id(scope, params)), sse, encoding=_encoding(scope))
+
+
+async def run(scope, receive, send):
+    """
+    兼容旧接口：创建运行并立即跟随它的事件流；断开后可在宽限期内用响应头中的 X-Run-Id 续读，
+    宽限期内没有重新连接则取消运行（旧客户端断开即放弃，不必继续消耗 LLM 调用与测试进程）。
+    """
+    params = _query(scope)
+    sse = params.get("format") == "sse" or "text/event-stream" in _header(scope, b"accept")
+    job = await _submit(send, params.get("dataset") or "stock", params.get("stages"), cancel_on_disconnect=True)
+    if job is None:
+        return
+    await _stream(receive, send, _run_frames(job, 0), sse, encoding=_encoding(scope),
+                  headers=[(b"x-run-id", job.run_id.encode("ascii")),
+                           (b"access-control-expose-headers", b"x-run-id")])
+
+
+ROUTES = [
+    ("GET", re.compile(r"^/run$"), run),
+    ("POST", re.compile(r"^/runs$"), create_run),
+    ("GET", re.compile(r"^/runs$"), list_runs),
+    ("GET", re.compile(r"^/runs/([0-9A-Za-z_]+)$"), get_run),
+    ("GET", re.compile(r"^/runs/([0-9A-Za-z_]+)/events$"), run_events),
+    ("POST", re.compile(r"^/runs/([0-9A-Za-z_]+)/cancel$"), cancel_run),
+    ("GET", re.compile(r"^/metrics$"), metrics),
+]
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                if config.get("pipeline", {}).get("agent_pool", {}).get("prewarm", True):
+                    # 预热失败（如提示词文件缺失）不阻止启动，第一次运行时会按需加载并报出同样的错误
+                    try:
+                        print(f"[warm-up] {await asyncio.to_thread(TestAgentApp.warm_up)}")
+                    except Exception:
+                        traceback.print_exc()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                # 正在执行的运行标记为 interrupted，事件日志保留
+                await _jobs().shutdown()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+    if scope["type"] != "http":
+        return
+    if scope["method"] == "OPTIONS":
+        # CORS 预检（mate-ui 的 fetch 带了 Content-Type 头）
+        await send({"type": "http.response.start", "status": 204, "headers": CORS_HEADERS})
+        await send({"type": "http.response.body", "body": b""})
+        return
+    for method, pattern, handler in ROUTES:
+        match = pattern.match(scope["path"])
+        if match and method == scope["method"]:
+            await handler(scope, receive, send, *match.groups())
+            return
+    await _send_json(send, 404, {"type": "error", "data": {"status": "not_found", "detail": scope["path"]}})
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(app, host="127.0.0.1", port=5000)
@@ -0,0 +1,14 @@
+from pathlib import Path
+from typing import Union
+
+# 仓库根目录：memory/ 下的索引、缓存等运行期数据都放在这里，与进程的当前目录无关
+ROOT_DIR = Path(__file__).resolve().parents[1]
+MEMORY_DIR = ROOT_DIR / "memory"
+# 流水线的中间文件（测试计划、测试设计、generatedTest.txt 等）；后台运行各自使用独立目录，成功后发布到这里
+WORKING_MEMORY_DIR = MEMORY_DIR / "working_memory"
+
+
+def resolve_path(path: Union[str, Path]) -> Path:
+    """配置中的相对路径按仓库根目录解析，绝对路径原样返回"""
+    path = Path(path).expanduser()
+    return path if path.is_absolute() else ROOT_DIR / path
@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from config.paths import MEMORY_DIR, resolve_path
+
+# 默认检查点目录（仓库 memory/ 下，与 working_memory 同级）
+DEFAULT_CHECKPOINT_DIR = MEMORY_DIR / "checkpoints"
+
+
+def agent_fingerprint(agent) -> Dict[str, Any]:
+    """
+    提取影响 agent 输出的配置：角色、目标、背景、工具列表、模型与接口地址。
+    """
+    llm = getattr(agent, "llm", None)
+    tools = getattr(agent, "tools", None) or []
+    return {
+        "role": getattr(agent, "role", None),
+        "goal": getattr(agent, "goal", None),
+        "backstory": getattr(agent, "backstory", None),
+        "tools": sorted(getattr(t, "name", type(t).__name__) for t in tools),
+        "model": getattr(llm, "model", None),
+        "base_url": getattr(llm, "base_url", None),
+    }
+
+
+def uses_tools(agent) -> bool:
+    """agent 是否带工具：工具会读写磁盘、运行测试，步骤的结果不只由提示词决定"""
+    return bool(getattr(agent, "tools", None))
+
+
+def step_key(*, description: str, expected_output: str, agent) -> str:
+    """根据渲染后的提示词、期望输出与 agent 配置计算内容寻址的 key"""
+    payload = {
+        "description": description,
+        "expected_output": expected_output,
+        "agent": agent_fingerprint(agent),
+    }
+    blob = json.dumps(payload, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class CheckpointStore:
+    """
+    PipelineStep 结果的内容寻址存储：
+    - key 由渲染后的提示词 + agent 配置 + 模型决定，输入不变则 key 不变
+    - 每个结果一个 JSON 文件：<root>/<key[:2]>/<key>.json
+    重跑同一数据集时，未变化的 (模块, 阶段) 直接复用结果；中途崩溃后从最后完成的节点继续。
+    只适用于结果完全由提示词决定的步骤：带工具的 agent（写文件、运行测试）不使用检查点，见 PipelineStep。
+    """
+
+    def __init__(self, root: str | Path = DEFAULT_CHECKPOINT_DIR):
+        self.root = resolve_path(root)
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> Optional[str]:
+        path = self._path(key)
+        try:
+            record = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, json.JSONDecodeError):
+            return None
+        return record.get("raw")
+
+    def put(self, key: str, raw: str, meta: Optional[Dict[str, Any]] = None) -> None:
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        record = {"key": key, "created_at": time.time(), "meta": meta or {}, "raw": raw}
+        # 先写临时文件再替换，崩溃时不会留下半个检查点
+        tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_text(json.dumps(record, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, path)
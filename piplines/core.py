@@ -1,20 +1,184 @@
+import asyncio
+import threading
+from functools import lru_cache
+from pathlib import Path
+
 from crewai import Task, Crew
 from jinja2 import Template
 
+from piplines.checkpoint import step_key, uses_tools
+from piplines.response_cache import response_key
+from tools.cancellation import bind_cancel_token, install_step_check
+
+
+class ReplayChunk:
+    """回放时的流式块，与 crew 流式输出的块一样提供 content 属性"""
+
+    def __init__(self, content: str):
+        self.content = content
+
+    def __str__(self):
+        return self.content
+
+
+class ReplayResult:
+    """回放时的最终结果，与 crew 的结果一样提供 raw 属性"""
+
+    def __init__(self, raw: str):
+        self.raw = raw
+
+    def __str__(self):
+        return self.raw
+
+
+class ReplayStreamingOutput:
+    """
+    将已保存的结果按行切块回放，接口与 crew.kickoff() 的流式输出一致：
+    可迭代出带 content 的块，迭代结束后通过 result.raw 取得完整结果。
+    """
+
+    def __init__(self, raw: str):
+        self.result = ReplayResult(raw)
+
+    def __iter__(self):
+        for line in self.result.raw.splitlines(keepends=True):
+            yield ReplayChunk(line)
+
+    async def __aiter__(self):
+        for chunk in self:
+            yield chunk
+
+
+class RecordingStreamingOutput:
+    """包装 crew 的流式输出：完整迭代结束后回调 on_complete(raw)，其余行为不变"""
+
+    def __init__(self, inner, on_complete):
+        self._inner = inner
+        self._on_complete = on_complete
+
+    def __iter__(self):
+        yield from self._inner
+        self._on_complete(self._inner.result.raw)
+
+    async def __aiter__(self):
+        async for chunk in aiter_stream(self._inner):
+            yield chunk
+        self._on_complete(self._inner.result.raw)
+
+    @property
+    def result(self):
+        return self._inner.result
+
+
+async def aiter_stream(streaming_output):
+    """
+    异步遍历流式输出：支持 async for 的直接使用；
+    只能同步迭代的（旧版 crewAI）由后台线程迭代，块经队列交给事件循环，事件循环本身不阻塞。
+    """
+    if hasattr(streaming_output, "__aiter__"):
+        async for chunk in streaming_output:
+            yield chunk
+        return
+
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    done = object()
+    stop = threading.Event()
+
+    def pump():
+        try:
+            for chunk in streaming_output:
+                if stop.is_set():
+                    break
+                loop.call_soon_threadsafe(queue.put_nowait, chunk)
+            loop.call_soon_threadsafe(queue.put_nowait, done)
+        except BaseException as e:  # 异常交给消费方抛出
+            loop.call_soon_threadsafe(queue.put_nowait, e)
+
+    worker = threading.Thread(target=pump, name="stream-bridge", daemon=True)
+    worker.start()
+    try:
+        while True:
+            item = await queue.get()
+            if item is done:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+
+
+@lru_cache(maxsize=64)
+def compile_template(template_text: str) -> Template:
+    """编译提示词模板；同一文本只编译一次，编译结果可在多个线程中同时渲染"""
+    return Template(template_text)
+
+
+def bind_working_dir(agent, working_dir) -> None:
+    """把本次运行的工作目录交给 agent 的工具（声明了 _working_dir 的工具把中间文件写到这里）"""
+    for tool in getattr(agent, "tools", None) or []:
+        if hasattr(tool, "_working_dir"):
+            tool._working_dir = str(working_dir) if working_dir is not None else None
+
 
 class PipelineStep:
 
-    def __init__(self, *, agent, template_text: str, expected_output: str, output_file: str):
+    def __init__(self, *, agent, template_text: str, expected_output: str, output_file: str,
+                 checkpoint=None, cache=None, cancel=None, working_dir=None):
         self.agent = agent
         self.template_text = template_text
         self.expected_output = expected_output
         self.output_file = output_file
+        # 可选的 CheckpointStore：输入不变时直接复用上次的结果；
+        # 执行工具的步骤（写测试文件、运行测试）依赖磁盘上的被测代码与测试文件，即使给出也不使用
+        self.checkpoint = None if uses_tools(agent) else checkpoint
+        # 可选的 ResponseCache：相同请求（跨数据集/重试）直接回放缓存的响应；同样不用于执行工具的步骤
+        self.cache = None if uses_tools(agent) else cache
+        # 可选的 CancelToken：取消后不再启动任务，执行中的 agent 在下一个推理步骤停止，测试子进程被结束
+        self.cancel = cancel
+        # 可选的运行工作目录：写测试文件的工具在这里记录 generatedTest.txt 等中间文件，未给出时使用共享目录
+        self.working_dir = working_dir
 
-    def run(self, **kwargs):
+    def _replay(self, raw: str):
+        # 补写 output_file（正常执行时由 Task 写入），然后回放结果
+        if self.output_file:
+            path = Path(self.output_file)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(raw, encoding="utf-8")
+        return ReplayStreamingOutput(raw)
+
+    def _lookup(self, kwargs):
+        """
+        渲染提示词并查找检查点 / 响应缓存。
+        返回 (命中时的回放输出, 或 None；description；检查点 key；缓存 key)。
+        """
+        description = compile_template(self.template_text).render(**kwargs)
+
+        key = None
+        if self.checkpoint is not None:
+            key = step_key(description=description, expected_output=self.expected_output, agent=self.agent)
+            raw = self.checkpoint.get(key)
+            if raw is not None:
+                return self._replay(raw), description, key, None
 
-        template = Template(self.template_text)
-        description = template.render(**kwargs)
+        cache_key = None
+        if self.cache is not None:
+            cache_key = response_key(description=description, expected_output=self.expected_output, agent=self.agent)
+            raw = self.cache.get(cache_key)
+            if raw is not None:
+                if key is not None:
+                    self.checkpoint.put(key, raw, meta={"role": getattr(self.agent, "role", None),
+                                                        "output_file": self.output_file, "source": "cache"})
+                return self._replay(raw), description, key, cache_key
 
+        return None, description, key, cache_key
+
+    def _crew(self, description):
+        # 同一个 agent 可能在不同运行间复用，每次启动前绑定本次的取消标记
+        bind_cancel_token(self.agent, self.cancel)
+        bind_working_dir(self.agent, self.working_dir)
+        install_step_check(self.agent, self.cancel)
         task = Task(
             description=description,
             expected_output=self.expected_output,
@@ -22,13 +186,51 @@ class PipelineStep:
             output_file=self.output_file
         )
 
-        crew = Crew(
+        return Crew(
             agents=[self.agent],
             tasks=[task],
             verbose=False,
             stream=True
         )
 
+    def _recording(self, streaming_output, key, cache_key):
+        if key is None and cache_key is None:
+            return streaming_output
+
+        role = getattr(self.agent, "role", None)
+
+        def _record(raw):
+            if key is not None:
+                self.checkpoint.put(key, raw, meta={"role": role, "output_file": self.output_file})
+            if cache_key is not None:
+                self.cache.put(cache_key, raw)
+
+        return RecordingStreamingOutput(streaming_output, _record)
+
+    def _check_cancelled(self):
+        if self.cancel is not None:
+            self.cancel.check()
+
+    def run(self, **kwargs):
+        self._check_cancelled()
+        replay, description, key, cache_key = self._lookup(kwargs)
+        if replay is not None:
+            return replay
+
         # 启动任务执行
-        streaming_output = crew.kickoff()
-        return streaming_output
+        streaming_output = self._crew(description).kickoff()
+        return self._recording(streaming_output, key, cache_key)
+
+    async def arun(self, **kwargs):
+        """
+        run 的 asyncio 版本：返回的流式输出用 aiter_stream 遍历，遍历结束后同样通过 result.raw 取结果。
+        检查点 / 缓存的读写是小文件 I/O，放到线程池执行。
+        """
+        self._check_cancelled()
+        replay, description, key, cache_key = await asyncio.to_thread(self._lookup, kwargs)
+        if replay is not None:
+            return replay
+
+        # stream=True 时 kickoff_async 返回可 async for 的流式输出；旧版本返回同步迭代器，由 aiter_stream 桥接
+        streaming_output = await self._crew(description).kickoff_async()
+        return self._recording(streaming_output, key, cache_key)
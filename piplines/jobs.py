@@ -0,0 +1,402 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+from typing import Any, AsyncIterable, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from config.paths import MEMORY_DIR, resolve_path
+from tools.cancellation import CancelToken, get_cancel_metrics
+
+# 每次运行的事件日志（<run_id>.jsonl，一行一帧，行号即序号）、状态（<run_id>.json）
+# 与工作目录（<run_id>/，流水线的中间文件）所在目录
+DEFAULT_RUNS_DIR = MEMORY_DIR / "runs"
+
+_RUN_ID_RE = re.compile(r"^[0-9A-Za-z_]+$")
+
+
+class QueueFull(RuntimeError):
+    """排队等待的运行数已达上限"""
+
+
+class PipelineRun:
+    """
+    一次后台运行：状态 + 按序号追加的事件日志。
+    帧的序号从 1 开始，follow(after) 先回放序号大于 after 的帧，再跟随新帧直到运行结束。
+    只在事件循环内使用。
+    """
+
+    FINISHED = ("done", "failed", "interrupted", "cancelled")
+
+    def __init__(self, run_id: str, dataset: str, stages: Optional[List[int]], log_dir: Optional[Path] = None,
+                 created_at: Optional[float] = None, cancel_on_disconnect: bool = False):
+        self.run_id = run_id
+        self.dataset = dataset
+        self.stages = stages
+        self.status = "queued"  # queued | running | done | failed | interrupted | cancelled
+        self.error: Optional[str] = None
+        self.created_at = created_at or time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.events: List[str] = []
+        self._changed = asyncio.Event()
+        self._log_dir = log_dir
+        self._log = None
+        # 取消标记交给流水线；cancel_on_disconnect 时最后一个订阅者断开（宽限期后）即取消运行
+        self.cancel_token = CancelToken()
+        self.cancel_on_disconnect = cancel_on_disconnect
+        self._subscribers = 0
+        self._disconnect_timer: Optional[asyncio.TimerHandle] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in self.FINISHED
+
+    @property
+    def working_dir(self) -> Optional[Path]:
+        """本次运行独占的工作目录（测试计划、测试设计、generatedTest.txt 等），并发运行互不覆盖"""
+        return self._log_dir / self.run_id if self._log_dir is not None else None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "run_id": self.run_id,
+            "dataset": self.dataset,
+            "stages": self.stages,
+            "status": self.status,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "last_event_id": len(self.events),
+            "cancel_on_disconnect": self.cancel_on_disconnect,
+        }
+
+    # ---------- 事件日志 ----------
+
+    def append(self, line: str) -> int:
+        """追加一帧（_pack_msg 产出的 JSON 行），返回它的序号"""
+        if not line.endswith("\n"):
+            line += "\n"
+        self.events.append(line)
+        if self._log is not None:
+            self._log.write(line)
+        self._notify()
+        return len(self.events)
+
+    def _notify(self) -> None:
+        # 唤醒当前所有等待者，之后的等待者使用新的 Event
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def follow(self, after: int = 0) -> AsyncIterator[Tuple[int, str]]:
+        """产出 (序号, 帧)：先回放 after 之后已有的帧，再跟随新帧，运行结束后返回"""
+        seq = max(0, after)
+        while True:
+            while seq < len(self.events):
+                seq += 1
+                yield seq, self.events[seq - 1]
+            if self.finished:
+                return
+            await self._changed.wait()
+
+    # ---------- 状态与持久化 ----------
+
+    def _set_status(self, status: str, error: Optional[str] = None) -> None:
+        self.status = status
+        if error is not None:
+            self.error = error
+        if status == "running":
+            self.started_at = time.time()
+            if self._log_dir is not None:
+                self._log = open(self._log_dir / f"{self.run_id}.jsonl", "a", encoding="utf-8")
+        elif self.finished:
+            self.finished_at = time.time()
+            if self._log is not None:
+                self._log.close()
+                self._log = None
+        self._save_meta()
+        self._notify()
+
+    def _save_meta(self) -> None:
+        if self._log_dir is None:
+            return
+        path = self._log_dir / f"{self.run_id}.json"
+        # 先写临时文件再替换，崩溃时不会留下半个状态文件
+        tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_text(json.dumps(self.to_dict(), ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, log_dir: Path, run_id: str) -> Optional["PipelineRun"]:
+        """从磁盘恢复一次运行（进程重启或已从内存淘汰）；未正常结束的标记为 interrupted"""
+        try:
+            meta = json.loads((log_dir / f"{run_id}.json").read_text(encoding="utf-8"))
+        except (OSError, json.JSONDecodeError):
+            return None
+        run = cls(run_id, meta.get("dataset"), meta.get("stages"), created_at=meta.get("created_at"))
+        run.status = meta.get("status", "interrupted")
+        run.error = meta.get("error")
+        run.started_at = meta.get("started_at")
+        run.finished_at = meta.get("finished_at")
+        try:
+            with open(log_dir / f"{run_id}.jsonl", encoding="utf-8") as f:
+                # 崩溃时最后一行可能不完整，丢弃
+                run.events = [line for line in f if line.endswith("\n")]
+        except OSError:
+            pass
+        if not run.finished:
+            run.status = "interrupted"
+            run.error = run.error or "server stopped before the run finished"
+        return run
+
+
+# 执行一次运行：接收 PipelineRun，返回 JSON 行的异步可迭代对象
+RunFn = Callable[[PipelineRun], AsyncIterable[str]]
+
+
+class JobManager:
+    """
+    后台运行队列：
+    - submit() 立即返回 PipelineRun，运行由 max_concurrent 个 worker 协程依次取出执行，其余排队
+    - 除空闲 worker 能立即执行的之外，排队数达到 max_queued 时 submit() 抛出 QueueFull
+    - 每帧追加到运行的事件日志（内存 + runs_dir 下的 JSONL），客户端断开后可按序号续读
+    - 内存中最多保留 keep 个已结束的运行，更早的按需从磁盘恢复；磁盘上同样只保留最近 keep 个
+    - cancel() 取消排队中或执行中的运行：执行中的 LLM 流不再读取，测试子进程组被结束
+    - 每次运行的中间文件写在各自的工作目录（PipelineRun.working_dir），不同数据集的运行可以并发；
+      同一数据集的运行会往同一个 SUT 写测试文件，依次执行
+    必须在事件循环内使用。
+    """
+
+    def __init__(self, run_fn: RunFn, *, max_concurrent: int = 1, max_queued: int = 16,
+                 runs_dir: str | Path = DEFAULT_RUNS_DIR, keep: int = 100, disconnect_grace_sec: float = 30):
+        self.run_fn = run_fn
+        self.max_concurrent = max(1, int(max_concurrent))
+        self.max_queued = max(0, int(max_queued))
+        self.runs_dir = resolve_path(runs_dir)
+        self.keep = max(1, int(keep))
+        self.disconnect_grace_sec = max(0.0, float(disconnect_grace_sec))
+        self._runs: "OrderedDict[str, PipelineRun]" = OrderedDict()
+        self._queue: "asyncio.Queue[PipelineRun]" = asyncio.Queue()
+        self._workers: List[asyncio.Task] = []
+        self._closing = False
+        # 正在执行运行的数据集，及排在它们之后的同数据集运行（由执行中的 worker 接着执行）
+        self._busy: set = set()
+        self._deferred: Dict[str, List[PipelineRun]] = {}
+
+    def _counts(self) -> Tuple[int, int]:
+        """(执行中, 排队中) 的运行数；排队期间被取消的运行仍留在 asyncio 队列里，不计入"""
+        running = queued = 0
+        for run in self._runs.values():
+            if run.status == "running":
+                running += 1
+            elif run.status == "queued":
+                queued += 1
+        return running, queued
+
+    def submit(self, dataset: str, stages: Optional[List[int]] = None,
+               cancel_on_disconnect: bool = False) -> PipelineRun:
+        running, queued = self._counts()
+        # 空闲的 worker 会立即取走排队的运行，只有超出空闲 worker 的部分才真正在排队
+        idle = max(0, self.max_concurrent - running)
+        if queued - idle >= self.max_queued:
+            raise QueueFull(f"{queued - idle} runs already queued")
+        self.runs_dir.mkdir(parents=True, exist_ok=True)
+        run_id = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+        run = PipelineRun(run_id, dataset, stages, self.runs_dir, cancel_on_disconnect=cancel_on_disconnect)
+        run._save_meta()
+        self._runs[run_id] = run
+        self._queue.put_nowait(run)
+        self._ensure_workers()
+        self._evict()
+        return run
+
+    def get(self, run_id: str) -> Optional[PipelineRun]:
+        run = self._runs.get(run_id)
+        if run is None and _RUN_ID_RE.match(run_id):
+            run = PipelineRun.load(self.runs_dir, run_id)
+            if run is not None:
+                self._runs[run_id] = run
+                self._evict()
+        return run
+
+    def cancel(self, run_id: str, reason: str = "cancel_requested") -> Optional[PipelineRun]:
+        """取消一次运行；不存在时返回 None，已结束的运行原样返回"""
+        run = self.get(run_id)
+        if run is None or run.finished:
+            return run
+        if run.cancel_token.cancel(reason):
+            get_cancel_metrics().record_run(reason)
+        if run.status == "queued":
+            # 仍在队列中：直接结束，worker 取到时跳过
+            run._set_status("cancelled", reason)
+            self._evict()
+        elif run._task is not None:
+            # 取消执行任务：事件循环上等待的 LLM 流与子进程立即结束
+            run._task.cancel()
+        return run
+
+    async def follow(self, run: PipelineRun, after: int = 0) -> AsyncIterator[Tuple[int, str]]:
+        """
+        run.follow 的订阅计数版本：cancel_on_disconnect 的运行在最后一个订阅者断开后，
+        等待 disconnect_grace_sec 秒仍无人重新连接时取消。
+        """
+        run._subscribers += 1
+        if run._disconnect_timer is not None:
+            run._disconnect_timer.cancel()
+            run._disconnect_timer = None
+        frames = run.follow(after)
+        try:
+            async for item in frames:
+                yield item
+        finally:
+            await frames.aclose()
+            run._subscribers -= 1
+            if run._subscribers == 0 and run.cancel_on_disconnect and not run.finished:
+                run._disconnect_timer = asyncio.get_running_loop().call_later(
+                    self.disconnect_grace_sec, self._cancel_abandoned, run)
+
+    def _cancel_abandoned(self, run: PipelineRun) -> None:
+        run._disconnect_timer = None
+        if run._subscribers == 0 and not run.finished:
+            self.cancel(run.run_id, "client_disconnected")
+
+    def list(self) -> List[Dict[str, Any]]:
+        return [run.to_dict() for run in self._runs.values()]
+
+    def stats(self) -> Dict[str, int]:
+        running, queued = self._counts()
+        return {"running": running, "queued": queued,
+                "max_concurrent": self.max_concurrent, "max_queued": self.max_queued}
+
+    # ---------- 执行 ----------
+
+    def _ensure_workers(self) -> None:
+        self._workers = [t for t in self._workers if not t.done()]
+        loop = asyncio.get_running_loop()
+        while len(self._workers) < self.max_concurrent:
+            self._workers.append(loop.create_task(self._worker()))
+
+    async def _worker(self) -> None:
+        while True:
+            run = await self._queue.get()
+            try:
+                if run.finished:  # 排队期间已被取消
+                    continue
+                if run.dataset in self._busy:
+                    # 同数据集的运行正在执行：排到它后面，worker 继续取下一个
+                    self._deferred.setdefault(run.dataset, []).append(run)
+                    continue
+                await self._execute_dataset(run)
+            finally:
+                self._queue.task_done()
+
+    async def _execute_dataset(self, run: PipelineRun) -> None:
+        """执行 run，再依次执行执行期间排到它后面的同数据集运行"""
+        dataset = run.dataset
+        self._busy.add(dataset)
+        try:
+            while run is not None:
+                if not run.finished:  # 等待期间已被取消
+                    await self._execute(run)
+                deferred = self._deferred.get(dataset)
+                run = deferred.pop(0) if deferred else None
+                if not deferred:
+                    self._deferred.pop(dataset, None)
+        finally:
+            self._busy.discard(dataset)
+
+    async def _drive(self, run: PipelineRun) -> None:
+        lines = self.run_fn(run)
+        try:
+            async for line in lines:
+                run.append(line)
+        finally:
+            await lines.aclose()
+
+    async def _execute(self, run: PipelineRun) -> None:
+        run._set_status("running")
+        # 在子任务中执行，cancel() 只取消这一次运行而不影响 worker
+        run._task = asyncio.ensure_future(self._drive(run))
+        try:
+            await run._task
+        except asyncio.CancelledError:
+            if self._closing or not run.cancel_token.cancelled:
+                raise
+            run._set_status("cancelled", run.cancel_token.reason)
+        except Exception:
+            if run.cancel_token.cancelled:
+                run._set_status("cancelled", run.cancel_token.reason)
+            else:
+                run._set_status("failed", traceback.format_exc())
+        else:
+            # 取消后流水线可能照常收尾返回
+            run._set_status("cancelled" if run.cancel_token.cancelled else "done", run.cancel_token.reason)
+        finally:
+            run._task = None
+            if not run.finished:
+                # 被取消（如服务关闭）
+                run._set_status("interrupted", "server stopped before the run finished")
+            self._evict()
+            self._prune_disk()
+
+    def _evict(self) -> None:
+        finished = [k for k, r in self._runs.items() if r.finished]
+        for run_id in finished[:max(0, len(finished) - self.keep)]:
+            del self._runs[run_id]
+
+    def _prune_disk(self) -> None:
+        metas = sorted(self.runs_dir.glob("*.json"), key=lambda p: p.stat().st_mtime)
+        for meta in metas[:max(0, len(metas) - self.keep)]:
+            run = self._runs.get(meta.stem)
+            if run is not None and not run.finished:
+                continue
+            for path in (meta, meta.with_suffix(".jsonl")):
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
+            shutil.rmtree(meta.with_suffix(""), ignore_errors=True)
+
+    async def shutdown(self) -> None:
+        """取消所有 worker；正在执行的运行标记为 interrupted"""
+        self._closing = True
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+
+# 进程级共享的运行队列（首次调用时创建）
+_shared_manager: Optional[JobManager] = None
+_shared_lock = threading.Lock()
+
+
+def get_job_manager(run_fn: Optional[RunFn] = None, cfg: Optional[Dict[str, Any]] = None) -> JobManager:
+    """
+    返回进程级共享的 JobManager；首次调用时必须给出 run_fn，cfg 为配置中的 server 段。
+    """
+    global _shared_manager
+    cfg = cfg or {}
+    with _shared_lock:
+        if _shared_manager is None:
+            if run_fn is None:
+                raise RuntimeError("JobManager is not initialised")
+            _shared_manager = JobManager(
+                run_fn,
+                max_concurrent=cfg.get("max_concurrent_runs", 1),
+                max_queued=cfg.get("max_queued_runs", 16),
+                runs_dir=cfg.get("runs_dir", DEFAULT_RUNS_DIR),
+                keep=cfg.get("keep_runs", 100),
+                disconnect_grace_sec=cfg.get("disconnect_grace_sec", 30),
+            )
+        return _shared_manager
@@ -0,0 +1,162 @@
+from __future__ import annotations
+
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from jinja2 import Template
+
+from piplines.core import bind_working_dir, compile_template
+from tools.cancellation import bind_cancel_token
+
+
+class PromptRegistry:
+    """
+    进程级的提示词缓存：文件内容按 (mtime, size) 缓存，文件被修改后下次读取时自动重新加载；
+    template() 返回编译好的 Jinja 模板（与 PipelineStep 共用同一份编译缓存）。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # 路径 -> ((mtime_ns, size), 内容)
+        self._files: Dict[str, Tuple[Tuple[int, int], str]] = {}
+        self._stats = {"hits": 0, "loads": 0, "reloads": 0}
+
+    def text(self, path: str) -> str:
+        key = os.path.abspath(path)
+        try:
+            st = os.stat(key)
+        except OSError:
+            raise FileNotFoundError(f"未找到文件: {key}") from None
+        version = (st.st_mtime_ns, st.st_size)
+        with self._lock:
+            cached = self._files.get(key)
+            if cached is not None and cached[0] == version:
+                self._stats["hits"] += 1
+                return cached[1]
+        content = Path(key).read_text(encoding="utf-8")
+        with self._lock:
+            self._stats["reloads" if key in self._files else "loads"] += 1
+            self._files[key] = (version, content)
+        return content
+
+    def template(self, path: str) -> Template:
+        return compile_template(self.text(path))
+
+    def preload(self, templates: Iterable[str] = (), texts: Iterable[str] = ()) -> int:
+        """加载并编译模板、加载普通文本；返回文件数"""
+        count = 0
+        for path in templates:
+            self.template(path)
+            count += 1
+        for path in texts:
+            self.text(path)
+            count += 1
+        return count
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._stats, "files": len(self._files)}
+
+
+def _reset(agent: Any) -> None:
+    """归还前清除上一次使用留下的运行期状态：取消标记、工作目录、取消检查回调、工具结果"""
+    bind_cancel_token(agent, None)
+    bind_working_dir(agent, None)
+    callback = getattr(agent, "step_callback", None)
+    if callback is not None and hasattr(callback, "_original"):
+        agent.step_callback = callback._original
+    if isinstance(getattr(agent, "tools_results", None), list):
+        agent.tools_results = []
+
+
+class AgentPool:
+    """
+    按角色复用 agent（连同它的 LLM 客户端与工具实例）：
+    - lease(role) 独占借出一个空闲 agent，没有空闲时用工厂新建；并发的节点拿到的总是不同的实例
+    - 正常结束后清理运行期状态再归还，每个角色最多保留 max_idle 个空闲实例
+    - 异常或取消结束的借用直接丢弃该 agent：crewAI 的同步调用可能仍在后台线程中使用它
+    """
+
+    def __init__(self, factories: Dict[str, Callable[[], Any]], max_idle: int = 8):
+        self.factories = dict(factories)
+        self.max_idle = max(0, int(max_idle))
+        self._lock = threading.Lock()
+        self._idle: Dict[str, List[Any]] = {role: [] for role in self.factories}
+        self._stats = {"created": 0, "reused": 0, "discarded": 0}
+
+    def _checkout(self, role: str) -> Any:
+        if role not in self.factories:
+            raise KeyError(f"unknown agent role: {role}")
+        with self._lock:
+            if self._idle[role]:
+                self._stats["reused"] += 1
+                return self._idle[role].pop()
+            self._stats["created"] += 1
+        return self.factories[role]()
+
+    def _checkin(self, role: str, agent: Any) -> None:
+        _reset(agent)
+        with self._lock:
+            if len(self._idle[role]) < self.max_idle:
+                self._idle[role].append(agent)
+
+    @contextmanager
+    def lease(self, role: str) -> Iterator[Any]:
+        agent = self._checkout(role)
+        try:
+            yield agent
+        except BaseException:
+            with self._lock:
+                self._stats["discarded"] += 1
+            raise
+        self._checkin(role, agent)
+
+    def prewarm(self, counts: Dict[str, int]) -> int:
+        """为每个角色预先创建 agent，直到空闲数达到 counts[role]（不超过 max_idle）；返回新建的数量"""
+        created = 0
+        for role, count in counts.items():
+            with self._lock:
+                missing = min(int(count), self.max_idle) - len(self._idle[role])
+            for _ in range(max(0, missing)):
+                agent = self.factories[role]()
+                with self._lock:
+                    self._stats["created"] += 1
+                    self._idle[role].append(agent)
+                created += 1
+        return created
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._stats, "idle": {role: len(v) for role, v in self._idle.items()}}
+
+
+# 进程级共享实例（首次调用时创建）
+_prompts: Optional[PromptRegistry] = None
+_pool: Optional[AgentPool] = None
+_shared_lock = threading.Lock()
+
+
+def get_prompt_registry() -> PromptRegistry:
+    global _prompts
+    with _shared_lock:
+        if _prompts is None:
+            _prompts = PromptRegistry()
+        return _prompts
+
+
+def get_agent_pool(factories: Optional[Dict[str, Callable[[], Any]]] = None,
+                   cfg: Optional[Dict[str, Any]] = None) -> AgentPool:
+    """
+    返回进程级共享的 AgentPool；首次调用时必须给出 factories，cfg 为配置中的 pipeline.agent_pool 段。
+    """
+    global _pool
+    cfg = cfg or {}
+    with _shared_lock:
+        if _pool is None:
+            if factories is None:
+                raise RuntimeError("AgentPool is not initialised")
+            _pool = AgentPool(factories, max_idle=cfg.get("max_idle", 8))
+        return _pool
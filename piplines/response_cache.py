@@ -0,0 +1,205 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from config.paths import MEMORY_DIR, resolve_path
+
+# 默认磁盘缓存目录
+DEFAULT_CACHE_DIR = MEMORY_DIR / "response_cache"
+
+
+def response_key(*, description: str, expected_output: str, agent) -> str:
+    """按 (模型, base_url, 渲染后的描述, 期望输出, agent 角色/目标) 计算缓存 key"""
+    llm = getattr(agent, "llm", None)
+    payload = {
+        "model": getattr(llm, "model", None),
+        "base_url": getattr(llm, "base_url", None),
+        "description": description,
+        "expected_output": expected_output,
+        "role": getattr(agent, "role", None),
+        "goal": getattr(agent, "goal", None),
+    }
+    blob = json.dumps(payload, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    LLM 响应缓存（需显式开启）：
+    - 内存层：OrderedDict 实现的 LRU，最多 max_entries 条
+    - 磁盘层：每条一个 JSON 文件，总大小超过 max_disk_bytes 时按最近访问时间淘汰
+    - ttl_sec：条目过期时间，None 表示不过期
+    - stats()：命中 / 未命中 / 淘汰计数
+    响应由工具调用的结果决定的步骤（写文件、运行测试）不使用缓存，见 PipelineStep。
+    """
+
+    def __init__(
+            self,
+            *,
+            max_entries: int = 256,
+            disk_dir: Optional[str | Path] = DEFAULT_CACHE_DIR,
+            max_disk_bytes: int = 256 * 1024 * 1024,
+            ttl_sec: Optional[float] = None,
+    ):
+        self.max_entries = max(0, int(max_entries))
+        self.disk_dir = resolve_path(disk_dir) if disk_dir else None
+        self.max_disk_bytes = int(max_disk_bytes)
+        self.ttl_sec = ttl_sec
+        self._memory: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "expired": 0,
+            "memory_evictions": 0,
+            "disk_evictions": 0,
+            "puts": 0,
+        }
+        self._disk_bytes = self._scan_disk_bytes()
+
+    # ---------- 内部工具 ----------
+
+    def _expired(self, created_at: float) -> bool:
+        return self.ttl_sec is not None and time.time() - created_at > self.ttl_sec
+
+    def _disk_path(self, key: str) -> Path:
+        return self.disk_dir / key[:2] / f"{key}.json"
+
+    def _scan_disk_bytes(self) -> int:
+        if not self.disk_dir or not self.disk_dir.exists():
+            return 0
+        return sum(p.stat().st_size for p in self.disk_dir.glob("*/*.json"))
+
+    def _remember(self, key: str, created_at: float, raw: str) -> None:
+        if self.max_entries == 0:
+            return
+        self._memory[key] = (created_at, raw)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self._stats["memory_evictions"] += 1
+
+    def _evict_disk(self) -> None:
+        if self._disk_bytes <= self.max_disk_bytes:
+            return
+        # mtime 作为最近访问时间：命中时会 touch
+        files = sorted(self.disk_dir.glob("*/*.json"), key=lambda p: p.stat().st_mtime)
+        for path in files:
+            if self._disk_bytes <= self.max_disk_bytes:
+                break
+            try:
+                size = path.stat().st_size
+                path.unlink()
+            except OSError:
+                continue
+            self._disk_bytes -= size
+            self._stats["disk_evictions"] += 1
+
+    # ---------- 对外接口 ----------
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            item = self._memory.get(key)
+            if item is not None:
+                created_at, raw = item
+                if not self._expired(created_at):
+                    self._memory.move_to_end(key)
+                    self._stats["memory_hits"] += 1
+                    return raw
+                del self._memory[key]
+                self._stats["expired"] += 1
+
+            if self.disk_dir is not None:
+                path = self._disk_path(key)
+                try:
+                    record = json.loads(path.read_text(encoding="utf-8"))
+                except (OSError, json.JSONDecodeError):
+                    record = None
+                if record is not None:
+                    if self._expired(record["created_at"]):
+                        self._stats["expired"] += 1
+                        try:
+                            self._disk_bytes -= path.stat().st_size
+                            path.unlink()
+                        except OSError:
+                            pass
+                    else:
+                        os.utime(path)
+                        self._remember(key, record["created_at"], record["raw"])
+                        self._stats["disk_hits"] += 1
+                        return record["raw"]
+
+            self._stats["misses"] += 1
+            return None
+
+    def put(self, key: str, raw: str) -> None:
+        created_at = time.time()
+        with self._lock:
+            self._remember(key, created_at, raw)
+            self._stats["puts"] += 1
+            if self.disk_dir is None:
+                return
+            path = self._disk_path(key)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            data = json.dumps({"key": key, "created_at": created_at, "raw": raw}, ensure_ascii=False)
+            old_size = path.stat().st_size if path.exists() else 0
+            tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            tmp.write_text(data, encoding="utf-8")
+            os.replace(tmp, path)
+            self._disk_bytes += path.stat().st_size - old_size
+            self._evict_disk()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            if self.disk_dir is not None:
+                for path in self.disk_dir.glob("*/*.json"):
+                    try:
+                        path.unlink()
+                    except OSError:
+                        pass
+            self._disk_bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits = self._stats["memory_hits"] + self._stats["disk_hits"]
+            total = hits + self._stats["misses"]
+            return {
+                **self._stats,
+                "hits": hits,
+                "hit_rate": hits / total if total else 0.0,
+                "memory_entries": len(self._memory),
+                "disk_bytes": self._disk_bytes,
+            }
+
+
+# 进程级共享缓存（按配置懒加载）
+_shared_cache: Optional[ResponseCache] = None
+_shared_lock = threading.Lock()
+
+
+def get_response_cache(cfg: Optional[Dict[str, Any]] = None) -> Optional[ResponseCache]:
+    """
+    根据配置返回进程级共享缓存；cfg 中 enabled 不为 True 时返回 None（默认关闭）。
+    """
+    global _shared_cache
+    cfg = cfg or {}
+    if not cfg.get("enabled", False):
+        return None
+    with _shared_lock:
+        if _shared_cache is None:
+            _shared_cache = ResponseCache(
+                max_entries=cfg.get("max_entries", 256),
+                disk_dir=cfg.get("dir", DEFAULT_CACHE_DIR),
+                max_disk_bytes=int(cfg.get("max_disk_mb", 256)) * 1024 * 1024,
+                ttl_sec=cfg.get("ttl_sec"),
+            )
+        return _shared_cache
@@ -0,0 +1,356 @@
+from __future__ import annotations
+
+import asyncio
+import queue
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import (Any, AsyncIterable, AsyncIterator, Callable, Dict, Hashable, Iterable, Iterator, List,
+                    Optional, Tuple)
+
+from tools.cancellation import CancelToken, RunCancelled, get_cancel_metrics
+
+# 节点函数：无参调用，返回 (type, data) 帧的可迭代对象（通常是生成器）
+NodeFn = Callable[[], Iterable[Tuple[str, Any]]]
+# 异步节点函数：无参调用，返回 (type, data) 帧的异步可迭代对象（通常是异步生成器）
+AsyncNodeFn = Callable[[], AsyncIterable[Tuple[str, Any]]]
+
+
+@dataclass
+class StageNode:
+    key: Hashable
+    fn: NodeFn
+    deps: List[Hashable] = field(default_factory=list)
+    status: str = "pending"  # pending | running | done | failed | skipped | cancelled
+    error: Optional[str] = None
+    # 是否已真正开始执行（running 只表示已提交）
+    started: bool = False
+
+
+@dataclass(frozen=True)
+class SchedulerEvent:
+    """
+    调度器输出的事件：
+    - kind="start"：节点开始执行
+    - kind="frame"：节点产出的一帧 (type_str, data)
+    - kind="end"：节点结束，status 为 done / failed / skipped / cancelled
+    - kind="tick"：stream(tick_sec=...) 在没有事件时定期输出，key 为 None
+    """
+    kind: str
+    key: Hashable
+    type_str: Optional[str] = None
+    data: Any = None
+    status: Optional[str] = None
+
+
+class StageScheduler:
+    """
+    以 (module, stage) 为节点的 DAG 调度器：
+    - 依赖全部完成的节点立即提交到线程池，全局并发数由 max_concurrency 限制
+    - 所有节点产出的帧汇入同一个队列，stream() 按到达顺序多路复用输出
+    - 节点可以在运行过程中动态添加（例如阶段 1 边生成边派发模块），seal() 之后不再接受新节点
+    - 依赖失败的节点会被跳过
+    - cancel 被取消时，尚未开始的节点直接以 cancelled 结束；执行中的节点在下一次检查时抛出 RunCancelled，
+      同样以 cancelled 结束
+    - max_buffered > 0 时最多缓冲这么多未被读取的帧，消费方（最终是 HTTP 客户端）读得慢时节点暂停产出
+    """
+
+    def __init__(self, max_concurrency: int = 4, cancel: Optional[CancelToken] = None, max_buffered: int = 0):
+        self.max_concurrency = max(1, int(max_concurrency))
+        self._nodes: Dict[Hashable, StageNode] = {}
+        self._events: "queue.Queue[SchedulerEvent]" = queue.Queue()
+        self._lock = threading.RLock()
+        self._sealed = False
+        self._unfinished = 0
+        self._pool = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="stage")
+        self._cancel = cancel
+        self._unregister = cancel.on_cancel(self._on_cancel) if cancel is not None else (lambda: None)
+        self._frame_slots = threading.BoundedSemaphore(max_buffered) if max_buffered > 0 else None
+        self._closed = False
+
+    # ---------- 构图 ----------
+
+    def add_node(self, key: Hashable, fn: NodeFn, deps: Iterable[Hashable] = ()) -> None:
+        with self._lock:
+            if self._sealed:
+                raise RuntimeError(f"Scheduler is sealed, cannot add node {key!r}")
+            if key in self._nodes:
+                raise ValueError(f"Duplicate scheduler node: {key!r}")
+            self._nodes[key] = StageNode(key=key, fn=fn, deps=list(deps))
+            self._unfinished += 1
+            self._schedule_ready()
+
+    def seal(self) -> None:
+        """声明不会再添加节点；依赖了不存在节点的节点会被跳过。"""
+        with self._lock:
+            self._sealed = True
+            for node in self._nodes.values():
+                if node.status == "pending" and any(d not in self._nodes for d in node.deps):
+                    missing = [d for d in node.deps if d not in self._nodes]
+                    self._finish(node, "skipped", f"missing dependencies: {missing!r}")
+            self._schedule_ready()
+            self._events.put(SchedulerEvent(kind="wake", key=None))
+
+    def keys(self, predicate: Callable[[Hashable], bool] = lambda _k: True) -> List[Hashable]:
+        with self._lock:
+            return [k for k in self._nodes if predicate(k)]
+
+    # ---------- 执行 ----------
+
+    def _cancelled(self) -> bool:
+        return self._cancel is not None and self._cancel.cancelled
+
+    def _schedule_ready(self) -> None:
+        for node in self._nodes.values():
+            if node.status != "pending":
+                continue
+            if self._cancelled():
+                self._finish(node, "cancelled", self._cancel.reason)
+                continue
+            dep_nodes = [self._nodes.get(d) for d in node.deps]
+            if any(d is not None and d.status in ("failed", "skipped", "cancelled") for d in dep_nodes):
+                self._finish(node, "skipped", "dependency failed")
+                continue
+            if all(d is not None and d.status == "done" for d in dep_nodes):
+                node.status = "running"
+                self._pool.submit(self._run_node, node)
+
+    def _finish(self, node: StageNode, status: str, error: Optional[str] = None) -> None:
+        node.status = status
+        node.error = error
+        self._unfinished -= 1
+        if status == "cancelled":
+            # 未开始的节点省下了整段执行，执行中的节点省下了剩余部分
+            get_cancel_metrics().record_nodes(skipped=0 if node.started else 1, interrupted=1 if node.started else 0)
+        self._events.put(SchedulerEvent(kind="end", key=node.key, status=status, data=error))
+
+    def _on_cancel(self) -> None:
+        with self._lock:
+            for node in self._nodes.values():
+                if node.status == "pending" or (node.status == "running" and not node.started):
+                    self._finish(node, "cancelled", self._cancel.reason)
+            self._events.put(SchedulerEvent(kind="wake", key=None))
+
+    def _run_node(self, node: StageNode) -> None:
+        with self._lock:
+            # 排队期间已被取消
+            if node.status != "running":
+                return
+            node.started = True
+        self._events.put(SchedulerEvent(kind="start", key=node.key))
+        status, error = "done", None
+        try:
+            for type_str, data in node.fn():
+                self._reserve_frame()
+                self._events.put(SchedulerEvent(kind="frame", key=node.key, type_str=type_str, data=data))
+        except RunCancelled as e:
+            status, error = "cancelled", str(e)
+        except Exception:
+            if self._cancelled():
+                # 取消打断的调用可能以其他异常的形式抛出（如被结束的子进程）
+                status, error = "cancelled", self._cancel.reason
+            else:
+                status, error = "failed", traceback.format_exc()
+        with self._lock:
+            self._finish(node, status, error)
+            # 节点结束后，依赖它的节点可能已经就绪（或需要被跳过）
+            self._schedule_ready()
+
+    def _reserve_frame(self) -> None:
+        """占用一个帧缓冲名额；名额用尽时等待消费方读取（流被关闭或运行被取消时放弃）"""
+        if self._frame_slots is None:
+            return
+        while not self._frame_slots.acquire(timeout=0.1):
+            if self._cancel is not None:
+                self._cancel.check()
+            if self._closed:
+                raise RunCancelled("stream closed")
+
+    def _all_finished(self) -> bool:
+        with self._lock:
+            return self._sealed and self._unfinished == 0
+
+    def stream(self, tick_sec: Optional[float] = None) -> Iterator[SchedulerEvent]:
+        """
+        按到达顺序输出所有节点的事件，直到 seal() 且所有节点结束。
+        tick_sec 给出时，超过该时间没有事件则输出一个 tick 事件（供调用方按时间发出合并的帧）。
+        """
+        try:
+            while True:
+                if self._all_finished() and self._events.empty():
+                    return
+                try:
+                    event = self._events.get(timeout=tick_sec)
+                except queue.Empty:
+                    yield SchedulerEvent(kind="tick", key=None)
+                    continue
+                if event.kind == "wake":
+                    continue
+                if event.kind == "frame" and self._frame_slots is not None:
+                    self._frame_slots.release()
+                yield event
+        finally:
+            self._closed = True
+            self._unregister()
+            # 已排队但未开始的节点不再执行
+            self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def status(self) -> Dict[Hashable, str]:
+        with self._lock:
+            return {k: n.status for k, n in self._nodes.items()}
+
+
+class AsyncStageScheduler:
+    """
+    StageScheduler 的 asyncio 版本，构图接口相同（add_node / seal / keys / status）：
+    - 每个节点是事件循环上的一个任务，全局并发数由信号量限制，不占用线程
+    - stream() 是异步迭代器；迭代被关闭（如客户端断开）时取消所有未完成的节点
+    - cancel 被取消时（可以在其他线程），未开始的节点以 cancelled 结束，执行中的节点任务被取消，
+      等待中的 LLM 流与测试子进程随之结束
+    - max_buffered > 0 时最多缓冲这么多未被读取的帧，消费方读得慢时节点暂停产出
+    必须在事件循环内使用。
+    """
+
+    def __init__(self, max_concurrency: int = 4, cancel: Optional[CancelToken] = None, max_buffered: int = 0):
+        self.max_concurrency = max(1, int(max_concurrency))
+        self._nodes: Dict[Hashable, StageNode] = {}
+        self._events: "asyncio.Queue[SchedulerEvent]" = asyncio.Queue()
+        self._sealed = False
+        self._unfinished = 0
+        self._slots = asyncio.Semaphore(self.max_concurrency)
+        self._tasks: Dict[Hashable, asyncio.Task] = {}
+        self._cancel = cancel
+        self._unregister = lambda: None
+        if cancel is not None:
+            loop = asyncio.get_running_loop()
+            self._unregister = cancel.on_cancel(lambda: loop.call_soon_threadsafe(self._on_cancel))
+        self._frame_slots = asyncio.Semaphore(max_buffered) if max_buffered > 0 else None
+
+    # ---------- 构图 ----------
+
+    def add_node(self, key: Hashable, fn: AsyncNodeFn, deps: Iterable[Hashable] = ()) -> None:
+        if self._sealed:
+            raise RuntimeError(f"Scheduler is sealed, cannot add node {key!r}")
+        if key in self._nodes:
+            raise ValueError(f"Duplicate scheduler node: {key!r}")
+        self._nodes[key] = StageNode(key=key, fn=fn, deps=list(deps))
+        self._unfinished += 1
+        self._schedule_ready()
+
+    def seal(self) -> None:
+        """声明不会再添加节点；依赖了不存在节点的节点会被跳过。"""
+        self._sealed = True
+        for node in self._nodes.values():
+            if node.status == "pending" and any(d not in self._nodes for d in node.deps):
+                missing = [d for d in node.deps if d not in self._nodes]
+                self._finish(node, "skipped", f"missing dependencies: {missing!r}")
+        self._schedule_ready()
+        self._events.put_nowait(SchedulerEvent(kind="wake", key=None))
+
+    def keys(self, predicate: Callable[[Hashable], bool] = lambda _k: True) -> List[Hashable]:
+        return [k for k in self._nodes if predicate(k)]
+
+    # ---------- 执行 ----------
+
+    def _cancelled(self) -> bool:
+        return self._cancel is not None and self._cancel.cancelled
+
+    def _schedule_ready(self) -> None:
+        for node in self._nodes.values():
+            if node.status != "pending":
+                continue
+            if self._cancelled():
+                self._finish(node, "cancelled", self._cancel.reason)
+                continue
+            dep_nodes = [self._nodes.get(d) for d in node.deps]
+            if any(d is not None and d.status in ("failed", "skipped", "cancelled") for d in dep_nodes):
+                self._finish(node, "skipped", "dependency failed")
+                continue
+            if all(d is not None and d.status == "done" for d in dep_nodes):
+                node.status = "running"
+                task = asyncio.get_running_loop().create_task(self._run_node(node))
+                self._tasks[node.key] = task
+                task.add_done_callback(lambda _t, key=node.key: self._tasks.pop(key, None))
+
+    def _finish(self, node: StageNode, status: str, error: Optional[str] = None) -> None:
+        node.status = status
+        node.error = error
+        self._unfinished -= 1
+        if status == "cancelled":
+            get_cancel_metrics().record_nodes(skipped=0 if node.started else 1, interrupted=1 if node.started else 0)
+        self._events.put_nowait(SchedulerEvent(kind="end", key=node.key, status=status, data=error))
+
+    def _on_cancel(self) -> None:
+        for node in self._nodes.values():
+            if node.status == "pending" or (node.status == "running" and not node.started):
+                self._finish(node, "cancelled", self._cancel.reason)
+        # 执行中的节点：取消任务，打断正在等待的 LLM 流或子进程
+        for task in list(self._tasks.values()):
+            task.cancel()
+        self._events.put_nowait(SchedulerEvent(kind="wake", key=None))
+
+    async def _run_node(self, node: StageNode) -> None:
+        status, error = "done", None
+        try:
+            async with self._slots:
+                # 等待名额期间已被取消
+                if node.status != "running":
+                    return
+                node.started = True
+                self._events.put_nowait(SchedulerEvent(kind="start", key=node.key))
+                try:
+                    async for type_str, data in node.fn():
+                        if self._frame_slots is not None:
+                            # 消费方读得慢时在此等待
+                            await self._frame_slots.acquire()
+                        self._events.put_nowait(
+                            SchedulerEvent(kind="frame", key=node.key, type_str=type_str, data=data))
+                except RunCancelled as e:
+                    status, error = "cancelled", str(e)
+                except Exception:
+                    if self._cancelled():
+                        status, error = "cancelled", self._cancel.reason
+                    else:
+                        status, error = "failed", traceback.format_exc()
+        except asyncio.CancelledError:
+            if not self._cancelled() or node.status != "running":
+                raise
+            # 由 cancel 触发的任务取消：节点照常以 cancelled 结束，stream() 继续输出
+            status, error = "cancelled", self._cancel.reason
+        self._finish(node, status, error)
+        # 节点结束后，依赖它的节点可能已经就绪（或需要被跳过）
+        self._schedule_ready()
+
+    def _all_finished(self) -> bool:
+        return self._sealed and self._unfinished == 0
+
+    async def stream(self, tick_sec: Optional[float] = None) -> AsyncIterator[SchedulerEvent]:
+        """
+        按到达顺序输出所有节点的事件，直到 seal() 且所有节点结束。
+        tick_sec 给出时，超过该时间没有事件则输出一个 tick 事件。
+        """
+        try:
+            while True:
+                if self._all_finished() and self._events.empty():
+                    return
+                try:
+                    event = await asyncio.wait_for(self._events.get(), tick_sec)
+                except asyncio.TimeoutError:
+                    yield SchedulerEvent(kind="tick", key=None)
+                    continue
+                if event.kind == "wake":
+                    continue
+                if event.kind == "frame" and self._frame_slots is not None:
+                    self._frame_slots.release()
+                yield event
+        finally:
+            self._unregister()
+            tasks = list(self._tasks.values())
+            for task in tasks:
+                task.cancel()
+            # 等节点处理完取消（如结束子进程）再返回
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def status(self) -> Dict[Hashable, str]:
+        return {k: n.status for k, n in self._nodes.items()}
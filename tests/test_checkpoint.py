@@ -0,0 +1,64 @@
+from types import SimpleNamespace
+
+import pytest
+
+from piplines.checkpoint import CheckpointStore, step_key, uses_tools
+
+
+def _agent(role="Test Designer", model="gpt-4o", tools=()):
+    return SimpleNamespace(role=role, goal="g", backstory="b", tools=list(tools),
+                           llm=SimpleNamespace(model=model, base_url=""))
+
+
+def _key(description="design module A", expected_output="markdown", agent=None):
+    return step_key(description=description, expected_output=expected_output, agent=agent or _agent())
+
+
+def test_key_is_stable_for_identical_inputs():
+    assert _key() == _key()
+
+
+@pytest.mark.parametrize("changed", [
+    dict(description="design module B"),
+    dict(expected_output="json"),
+    dict(agent=_agent(role="Test Architect")),
+    dict(agent=_agent(model="gpt-4o-mini")),
+    dict(agent=_agent(tools=[SimpleNamespace(name="Search")])),
+])
+def test_key_changes_with_any_input(changed):
+    assert _key(**changed) != _key()
+
+
+def test_store_round_trip(tmp_path):
+    store = CheckpointStore(tmp_path)
+    key = _key()
+    assert store.get(key) is None
+    store.put(key, "plan", meta={"role": "r"})
+    assert store.get(key) == "plan"
+    assert CheckpointStore(tmp_path).get(key) == "plan"
+    assert store.get(_key(description="other")) is None
+
+
+def test_relative_root_is_anchored_to_repository(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    store = CheckpointStore("memory/checkpoints")
+    assert store.root.is_absolute()
+    assert not str(store.root).startswith(str(tmp_path))
+
+
+def test_tool_executing_agents_are_detected():
+    assert not uses_tools(_agent())
+    assert uses_tools(_agent(tools=[SimpleNamespace(name="RunTests")]))
+
+
+def test_pipeline_step_skips_checkpoint_for_tool_agents(tmp_path):
+    pytest.importorskip("crewai")
+    pytest.importorskip("jinja2")
+    from piplines.core import PipelineStep
+
+    store = CheckpointStore(tmp_path)
+    plain = PipelineStep(agent=_agent(), template_text="t", expected_output="o", output_file="", checkpoint=store)
+    tooled = PipelineStep(agent=_agent(tools=[SimpleNamespace(name="RunTests")]), template_text="t",
+                          expected_output="o", output_file="", checkpoint=store)
+    assert plain.checkpoint is store
+    assert tooled.checkpoint is None
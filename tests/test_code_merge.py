@@ -0,0 +1,224 @@
+import textwrap
+
+import pytest
+
+from tools.code_merge import MergeError, merge_code, merge_java, merge_python
+
+
+def _src(text):
+    return textwrap.dedent(text).lstrip("\n")
+
+
+PY_OLD = _src('''
+    """doc"""
+    import os
+    from a import b
+
+
+    def test_one():
+        assert 1
+
+
+    class TestX:
+        value = 1
+
+        def test_a(self):
+            assert 1
+
+
+    if __name__ == "__main__":
+        main()
+''')
+
+
+def test_python_replaces_same_name_definitions_and_appends_new_ones():
+    merged = merge_python(PY_OLD, _src('''
+        import os
+        import sys
+        from a import b, c
+
+
+        def test_one():
+            assert 2
+
+
+        def test_two():
+            pass
+
+
+        class TestX:
+            value = 2
+
+            def test_b(self):
+                pass
+    '''))
+    assert merged == _src('''
+        """doc"""
+        import os
+        from a import b
+        import sys
+        from a import c
+
+
+        def test_one():
+            assert 2
+
+
+        class TestX:
+            value = 2
+
+            def test_a(self):
+                assert 1
+
+            def test_b(self):
+                pass
+
+
+        def test_two():
+            pass
+
+
+        if __name__ == "__main__":
+            main()
+    ''')
+
+
+def test_python_identical_statements_are_not_duplicated():
+    old = "import pytest\n\npytestmark = pytest.mark.slow\nprint('setup')\n"
+    assert merge_python(old, old) == old
+
+
+@pytest.mark.parametrize("existing, incoming", [
+    # property 的 getter 与 setter 同名
+    (_src('''
+        class A:
+            @property
+            def x(self):
+                return 1
+
+            @x.setter
+            def x(self, v):
+                self._x = v
+    '''), _src('''
+        class A:
+            @property
+            def x(self):
+                return 2
+
+            @x.setter
+            def x(self, v):
+                self._x = v * 2
+    ''')),
+    # @overload 组
+    ("def f(a):\n    return a\n", _src('''
+        from typing import overload
+
+
+        @overload
+        def f(a: int) -> int: ...
+        @overload
+        def f(a: str) -> str: ...
+        def f(a):
+            return a
+    ''')),
+    # 条件分支中的重定义
+    (_src('''
+        try:
+            import ujson as json
+        except ImportError:
+            import json
+        def load(s):
+            return json.loads(s)
+        def load(s):
+            return json.loads(s or "{}")
+    '''), "def load(s):\n    return s\n"),
+], ids=["property", "overload", "redefinition"])
+def test_python_duplicate_names_refuse_to_merge(existing, incoming):
+    with pytest.raises(MergeError):
+        merge_python(existing, incoming)
+
+
+def test_python_unparsable_input_raises():
+    with pytest.raises(MergeError):
+        merge_python(PY_OLD, "def broken(:\n")
+
+
+JAVA_OLD = _src('''
+    package p;
+
+    import java.util.List;
+
+    public class FooTest {
+        private int n = 1;
+
+        @Test
+        void a() {
+            assert true;
+        }
+
+        void b(int x) {}
+    }
+''')
+
+
+def test_java_merges_members_by_name_and_parameter_types():
+    merged = merge_java(JAVA_OLD, _src('''
+        import java.util.List;
+        import java.util.Map;
+
+        public class FooTest {
+            private int n = 2;
+
+            @Test
+            void a() {
+                assert false;
+            }
+
+            void b(String x) {}
+        }
+
+        class Helper {}
+    '''))
+    assert merged == _src('''
+        package p;
+
+        import java.util.List;
+        import java.util.Map;
+
+        public class FooTest {
+            private int n = 2;
+
+            @Test
+            void a() {
+                assert false;
+            }
+
+            void b(int x) {}
+
+            void b(String x) {}
+        }
+
+        class Helper {}
+    ''')
+
+
+def test_java_member_snippet_goes_into_the_first_type():
+    merged = merge_java(JAVA_OLD, "    @Test\n    void c() {\n        int k = 0;\n    }\n")
+    assert merged.endswith(_src('''
+            void b(int x) {}
+
+            @Test
+            void c() {
+                int k = 0;
+            }
+        }
+    '''))
+    assert merged.count("void a()") == 1
+
+
+def test_merge_code_dispatches_by_extension():
+    assert merge_code("t.py", "x = 1\n", "x = 2\n") == "x = 2\n"
+    with pytest.raises(MergeError):
+        merge_code("t.kt", "", "")
+    with pytest.raises(MergeError):
+        merge_java("// no types here\n", "class A {}")
@@ -0,0 +1,54 @@
+from utils.context_utils import compact_plantuml, slice_class_diagram
+
+DIAGRAM = """\
+@startuml
+skinparam monochrome true
+' 订单相关
+hide empty members
+
+class OrderService {
+  +place(order: Order): Receipt
+}
+class Order
+class Receipt
+class Unrelated
+OrderService --> Order
+Unrelated --> Receipt
+@enduml
+"""
+
+
+def test_compact_drops_noise_inside_plantuml_blocks():
+    assert compact_plantuml(DIAGRAM) == "\n".join([
+        "@startuml",
+        "class OrderService {",
+        "  +place(order: Order): Receipt",
+        "}",
+        "class Order",
+        "class Receipt",
+        "class Unrelated",
+        "OrderService --> Order",
+        "Unrelated --> Receipt",
+        "@enduml",
+    ])
+
+
+def test_compact_keeps_prose_outside_blocks():
+    prose = "show the receipt after payment\n\n'quoted' remarks stay\nscale is configurable"
+    assert compact_plantuml(prose) == prose
+    mixed = "hide nothing here\n@startuml\nhide empty members\nclass A\n@enduml\nshow totals"
+    assert compact_plantuml(mixed) == "hide nothing here\n@startuml\nclass A\n@enduml\nshow totals"
+
+
+def test_slice_keeps_selected_classes_and_direct_dependencies():
+    sliced = slice_class_diagram(DIAGRAM, ["OrderService"])
+    assert "class OrderService {" in sliced
+    assert "class Order" in sliced and "class Receipt" in sliced
+    assert "class Unrelated" not in sliced
+    assert "OrderService --> Order" in sliced
+    assert "Unrelated --> Receipt" not in sliced
+
+
+def test_slice_returns_original_text_when_nothing_matches():
+    assert slice_class_diagram(DIAGRAM, ["Missing"]) == DIAGRAM
+    assert slice_class_diagram("plain text design", ["OrderService"]) == "plain text design"
@@ -0,0 +1,77 @@
+from tools.java_outline import extract_block, extract_outline
+
+
+def _methods(outline):
+    return [(m["class_qualname"], m["name"]) for m in outline["methods"]]
+
+
+def test_annotation_array_arguments_do_not_split_headers():
+    src = (
+        "@SuppressWarnings({\"unchecked\"})\n"
+        "public class Foo {\n"
+        "    @RequestMapping(method = {RequestMethod.GET}, params = @P(x = 1))\n"
+        "    public String get() { return \"\"; }\n"
+        "}\n"
+    )
+    outline = extract_outline(src)
+
+    (foo,) = outline["types"]
+    assert src[foo["start"]:].startswith("@SuppressWarnings")
+    assert src[foo["end"] - 1] == "}"
+    (get,) = outline["methods"]
+    assert get["signature"].endswith("public String get()")
+    assert get["signature"].startswith("@RequestMapping(")
+    assert extract_block(src, get["start"]).endswith("return \"\"; }")
+
+
+def test_braces_inside_call_arguments_are_not_blocks():
+    src = (
+        "class A {\n"
+        "    void run() { pool.submit(() -> { work(); }); for (int i = 0; i < 3; i++) { } }\n"
+        "    void next() { }\n"
+        "}\n"
+    )
+    assert _methods(extract_outline(src)) == [("A", "run"), ("A", "next")]
+
+
+def test_enum_constant_bodies():
+    src = (
+        "enum E {\n"
+        "    A(\"x\") { @Override String label() { return \"a\"; } },\n"
+        "    B { String label() { return \"b\"; } };\n"
+        "    String label() { return \"\"; }\n"
+        "    E() { }\n"
+        "}\n"
+    )
+    outline = extract_outline(src)
+
+    assert [t["qualname"] for t in outline["types"]] == ["E"]
+    assert _methods(outline) == [("E", "label"), ("E", "label"), ("E", "label"), ("E", "E")]
+    assert outline["types"][0]["end"] == len(src.rstrip())
+
+
+def test_annotation_types_and_default_values():
+    src = (
+        "class Outer {\n"
+        "    @interface Ann { String[] value() default {}; int n() default 1; }\n"
+        "    interface I { default void d() { } }\n"
+        "}\n"
+    )
+    outline = extract_outline(src)
+
+    assert [(t["qualname"], t["kind"]) for t in outline["types"]] == [
+        ("Outer", "class"), ("Outer.Ann", "interface"), ("Outer.I", "interface"),
+    ]
+    assert _methods(outline) == [("Outer.I", "d")]
+
+
+def test_literals_and_comments_are_ignored():
+    src = (
+        "class S {\n"
+        "    // void fake() {\n"
+        "    String s = \"{ not a block\";\n"
+        "    char c = '}';\n"
+        "    void real() { }\n"
+        "}\n"
+    )
+    assert _methods(extract_outline(src)) == [("S", "real")]
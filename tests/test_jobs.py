@@ -0,0 +1,151 @@
+import asyncio
+
+import pytest
+
+from piplines.jobs import JobManager, PipelineRun, QueueFull
+
+
+def _frames(n, gate=None):
+    """返回 run_fn：产出 n 帧；给出 gate 时在第一帧之后等待 gate 被设置"""
+
+    async def run_fn(run):
+        for i in range(1, n + 1):
+            yield f'{{"type": "content", "data": "{i}"}}'
+            if gate is not None and i == 1:
+                await gate.wait()
+
+    return run_fn
+
+
+async def _collect(manager, run, after):
+    return [seq async for seq, _ in manager.follow(run, after)]
+
+
+async def _wait_status(run, *statuses):
+    while run.status not in statuses:
+        await asyncio.sleep(0.01)
+
+
+def test_follow_replays_after_last_event_id(tmp_path):
+    async def main():
+        manager = JobManager(_frames(5), runs_dir=tmp_path)
+        run = manager.submit("stock")
+        assert await _collect(manager, run, 0) == [1, 2, 3, 4, 5]
+        assert await _collect(manager, run, 3) == [4, 5]
+        assert await _collect(manager, run, 5) == []
+        await manager.shutdown()
+        return run.run_id
+
+    run_id = asyncio.run(main())
+    # 进程重启后从磁盘恢复的运行同样按序号续读
+    restored = PipelineRun.load(tmp_path, run_id)
+    assert restored.status == "done"
+    assert restored.events[2:] == ['{"type": "content", "data": "3"}\n',
+                                   '{"type": "content", "data": "4"}\n',
+                                   '{"type": "content", "data": "5"}\n']
+
+
+def test_reconnect_during_run_resumes_without_gaps(tmp_path):
+    async def main():
+        gate = asyncio.Event()
+        manager = JobManager(_frames(4, gate), runs_dir=tmp_path)
+        run = manager.submit("stock")
+        first = manager.follow(run, 0)
+        assert (await first.__anext__())[0] == 1
+        await first.aclose()  # 客户端断开，last event id = 1
+        gate.set()
+        assert await _collect(manager, run, 1) == [2, 3, 4]
+        await manager.shutdown()
+
+    asyncio.run(main())
+
+
+def test_failed_run_keeps_its_frames(tmp_path):
+    async def broken(run):
+        yield '{"type": "content", "data": "partial"}'
+        raise RuntimeError("boom")
+
+    async def main():
+        manager = JobManager(broken, runs_dir=tmp_path)
+        run = manager.submit("stock")
+        assert await _collect(manager, run, 0) == [1]
+        assert run.status == "failed" and "boom" in run.error
+        await manager.shutdown()
+
+    asyncio.run(main())
+
+
+def test_zero_queue_accepts_when_a_worker_is_idle(tmp_path):
+    async def main():
+        gate = asyncio.Event()
+        manager = JobManager(_frames(2, gate), max_concurrent=1, max_queued=0, runs_dir=tmp_path)
+        run = manager.submit("stock")
+        await _wait_status(run, "running")
+        with pytest.raises(QueueFull):
+            manager.submit("stock")
+        gate.set()
+        await _wait_status(run, "done")
+        manager.submit("stock")
+        await manager.shutdown()
+
+    asyncio.run(main())
+
+
+def test_cancelled_queued_runs_free_their_place(tmp_path):
+    async def main():
+        gate = asyncio.Event()
+        manager = JobManager(_frames(2, gate), max_concurrent=1, max_queued=1, runs_dir=tmp_path)
+        running = manager.submit("stock")
+        await _wait_status(running, "running")
+        queued = manager.submit("stock")
+        with pytest.raises(QueueFull):
+            manager.submit("stock")
+        manager.cancel(queued.run_id)
+        assert queued.status == "cancelled"
+        assert manager.stats()["queued"] == 0
+        again = manager.submit("stock")
+        gate.set()
+        await _wait_status(again, "done")
+        assert queued.events == []
+        await manager.shutdown()
+
+    asyncio.run(main())
+
+
+def test_runs_get_their_own_working_dir(tmp_path):
+    async def main():
+        manager = JobManager(_frames(1), runs_dir=tmp_path, keep=1)
+        first = manager.submit("stock")
+        await _wait_status(first, "done")
+        second = manager.submit("stock")
+        assert first.working_dir != second.working_dir
+        assert second.working_dir == tmp_path / second.run_id
+        first.working_dir.mkdir()
+        await _wait_status(second, "done")
+        # 超出 keep 的运行连同工作目录一起清理
+        assert not first.working_dir.exists()
+        await manager.shutdown()
+
+    asyncio.run(main())
+
+
+def test_only_runs_of_different_datasets_overlap(tmp_path):
+    async def main():
+        gate = asyncio.Event()
+        manager = JobManager(_frames(2, gate), max_concurrent=2, runs_dir=tmp_path)
+        a = manager.submit("stock")
+        b = manager.submit("stock")
+        c = manager.submit("shop")
+        await _wait_status(c, "running")
+        await _wait_status(a, "running")
+        # 同一数据集的第二个运行等待第一个结束
+        assert b.status == "queued"
+        assert manager.stats() == {"running": 2, "queued": 1, "max_concurrent": 2, "max_queued": 16}
+        manager.cancel(b.run_id)
+        gate.set()
+        await _wait_status(a, "done")
+        await _wait_status(c, "done")
+        assert b.status == "cancelled" and b.events == []
+        await manager.shutdown()
+
+    asyncio.run(main())
@@ -0,0 +1,190 @@
+import itertools
+import os
+import struct
+import threading
+import time
+
+import pytest
+
+from tools import maven_fastpath
+from tools.maven_fastpath import ClasspathCache, class_source_file, prepare_fast
+
+
+def _utf8(text):
+    data = text.encode("utf-8")
+    return b"\x01" + struct.pack(">H", len(data)) + data
+
+
+def fake_class(this_name, source_file=None):
+    """最小的 class 文件：常量池 + 无字段 / 方法 + 可选的 SourceFile 属性"""
+    pool = [_utf8(this_name), b"\x07" + struct.pack(">H", 1), _utf8("java/lang/Object"),
+            b"\x07" + struct.pack(">H", 3), b"\x05" + struct.pack(">q", 0)]  # Long 占两个槽位
+    attrs = b""
+    count = 7
+    if source_file:
+        pool += [_utf8("SourceFile"), _utf8(source_file)]
+        attrs = struct.pack(">HIH", 7, 2, 8)
+        count = 9
+    return (b"\xca\xfe\xba\xbe" + struct.pack(">HHH", 0, 52, count) + b"".join(pool)
+            + struct.pack(">HHHHHH", 0x21, 2, 4, 0, 0, 0)
+            + struct.pack(">H", 1 if source_file else 0) + attrs)
+
+
+def test_class_source_file(tmp_path):
+    path = tmp_path / "Helper.class"
+    path.write_bytes(fake_class("com/x/Helper", "Foo.java"))
+    assert class_source_file(str(path)) == "Foo.java"
+    path.write_bytes(fake_class("com/x/Helper"))
+    assert class_source_file(str(path)) is None
+    path.write_bytes(b"not a class file")
+    assert class_source_file(str(path)) is None
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    """单模块 Maven 项目骨架；javac 被替换为按源文件写出 .class 的桩，记录每次编译的文件"""
+    root = tmp_path / "proj"
+    (root / "src/main/java/com/x").mkdir(parents=True)
+    (root / "src/test/java/com/x").mkdir(parents=True)
+    (root / "target/classes").mkdir(parents=True)
+    (root / "target/test-classes").mkdir(parents=True)
+    (root / "pom.xml").write_text("<project/>")
+    compiled = []
+
+    def fake_javac(sources, out_dir, classpath, source_path, timeout_sec, cancel=None):
+        if not sources:
+            return 0, ""
+        compiled.append(sorted(os.path.relpath(s, source_path) for s in sources))
+        for src in sources:
+            rel = os.path.relpath(src, source_path)[:-len(".java")]
+            dst = os.path.join(out_dir, rel + ".class")
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            with open(dst, "wb") as f:
+                f.write(fake_class(rel, os.path.basename(src)))
+            stamp = os.path.getmtime(src) + 1
+            os.utime(dst, (stamp, stamp))
+        return 0, ""
+
+    monkeypatch.setattr(maven_fastpath, "_javac", fake_javac)
+    monkeypatch.setattr(maven_fastpath, "find_console_launcher", lambda: "launcher.jar")
+    monkeypatch.setattr(maven_fastpath.shutil, "which", lambda name: f"/usr/bin/{name}")
+    return root, compiled
+
+
+class _NoDeps:
+    def get(self, project_path):
+        return []
+
+
+_clock = itertools.count(int(time.time()), 10)
+
+
+def _write(path, text="class X {}"):
+    path.write_text(text)
+    # 每次写入的 mtime 都比之前编译出的 .class 新
+    stamp = next(_clock)
+    os.utime(path, (stamp, stamp))
+
+
+def _prepare(root):
+    build, failed = prepare_fast(str(root), cache=_NoDeps())
+    assert failed is None
+    return build
+
+
+def test_only_changed_test_classes_are_recompiled(project):
+    root, compiled = project
+    _write(root / "src/main/java/com/x/Service.java")
+    _write(root / "src/test/java/com/x/ServiceTest.java")
+    _write(root / "src/test/java/com/x/OtherTest.java")
+    _prepare(root)
+    compiled.clear()
+
+    _write(root / "src/test/java/com/x/ServiceTest.java")
+    _prepare(root)
+    assert compiled == [["com/x/ServiceTest.java"]]
+
+
+def test_main_change_recompiles_everything(project):
+    root, compiled = project
+    _write(root / "src/main/java/com/x/Service.java")
+    _write(root / "src/main/java/com/x/Caller.java")
+    _write(root / "src/test/java/com/x/ServiceTest.java")
+    _prepare(root)
+    compiled.clear()
+
+    _write(root / "src/main/java/com/x/Service.java")
+    _prepare(root)
+    assert compiled == [["com/x/Caller.java", "com/x/Service.java"], ["com/x/ServiceTest.java"]]
+
+
+def test_changed_test_helper_recompiles_all_tests(project):
+    root, compiled = project
+    _write(root / "src/test/java/com/x/Fixtures.java")
+    _write(root / "src/test/java/com/x/ServiceTest.java")
+    _prepare(root)
+    compiled.clear()
+
+    _write(root / "src/test/java/com/x/Fixtures.java")
+    _prepare(root)
+    assert compiled == [["com/x/Fixtures.java", "com/x/ServiceTest.java"]]
+
+
+def test_orphan_classes_are_removed(project):
+    root, compiled = project
+    test_out = root / "target/test-classes/com/x"
+    _write(root / "src/test/java/com/x/KeptTest.java")
+    _prepare(root)
+    # 同一文件中的非 public 顶层类、内部类保留；源文件已删除的测试类及其内部类删除
+    (test_out / "Helper.class").write_bytes(fake_class("com/x/Helper", "KeptTest.java"))
+    (test_out / "KeptTest$1.class").write_bytes(fake_class("com/x/KeptTest$1", "KeptTest.java"))
+    (test_out / "RenamedTest.class").write_bytes(fake_class("com/x/RenamedTest", "RenamedTest.java"))
+    (test_out / "RenamedTest$Inner.class").write_bytes(fake_class("com/x/RenamedTest$Inner", "RenamedTest.java"))
+    (test_out / "Script.class").write_bytes(fake_class("com/x/Script", "Script.kt"))
+    compiled.clear()
+
+    _prepare(root)
+    assert sorted(os.listdir(test_out)) == ["Helper.class", "KeptTest$1.class", "KeptTest.class", "Script.class"]
+    # 有文件被删除时整体重新编译，引用被删除类的测试在编译阶段暴露
+    assert compiled == [["com/x/KeptTest.java"]]
+
+
+def test_generated_sources_count_as_sources(project):
+    root, _ = project
+    gen = root / "target/generated-sources/annotations/com/x"
+    gen.mkdir(parents=True)
+    (gen / "Mapper_Impl.java").write_text("class Mapper_Impl {}")
+    out = root / "target/classes/com/x/Mapper_Impl.class"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_bytes(fake_class("com/x/Mapper_Impl", "Mapper_Impl.java"))
+    _prepare(root)
+    assert out.exists()
+
+
+def test_classpath_resolution_is_locked_per_pom(tmp_path, monkeypatch):
+    slow, fast = tmp_path / "slow", tmp_path / "fast"
+    for p in (slow, fast):
+        p.mkdir()
+        (p / "pom.xml").write_text(f"<project>{p.name}</project>")
+    release = threading.Event()
+    calls = []
+
+    def resolve(project_path):
+        calls.append(os.path.basename(project_path))
+        if project_path == str(slow):
+            release.wait(5)
+        return []
+
+    cache = ClasspathCache(tmp_path / "cache")
+    monkeypatch.setattr(cache, "_resolve", resolve)
+    slow_thread = threading.Thread(target=cache.get, args=(str(slow),))
+    slow_thread.start()
+    while not calls:
+        time.sleep(0.01)
+    started = time.monotonic()
+    assert cache.get(str(fast)) == []
+    assert time.monotonic() - started < 1
+    release.set()
+    slow_thread.join()
+    cache.get(str(slow))
+    assert calls == ["slow", "fast"]
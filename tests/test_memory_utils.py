@@ -0,0 +1,72 @@
+import json
+
+from utils.memory_utils import ModuleStreamParser, parse_module
+
+PLAN = {
+    "project": "shop {with braces} and \"modules\"",
+    "modules": [
+        {
+            "module_id": "M1",
+            "name": "Order \"core\" {v2}",
+            "classes": ["OrderService", "Order"],
+            "responsibility_summary": "path C:\\orders\\ and a ] bracket",
+            "reasons": {"modules": ["nested, not the plan"], "note": "ends with a backslash \\"},
+            "features": [{"name": "place", "methods": ["place"], "requirements": "line1\nline2 \\\" }"}],
+        },
+        {
+            "module_id": "M2",
+            "name": "Payment",
+            "classes": ["PaymentGateway"],
+            "responsibility_summary": "",
+            "reasons": {},
+            "features": [],
+        },
+    ],
+}
+EXPECTED = [parse_module(m) for m in PLAN["modules"]]
+
+
+def _feed_in_chunks(text, size):
+    parser = ModuleStreamParser()
+    got = []
+    for i in range(0, len(text), size):
+        got.extend(parser.feed(text[i:i + size]))
+    return parser, got
+
+
+def test_modules_survive_every_chunk_split():
+    text = json.dumps(PLAN, ensure_ascii=False, indent=2)
+    for size in range(1, 40):
+        parser, got = _feed_in_chunks(text, size)
+        assert got == EXPECTED, size
+        assert parser.modules == EXPECTED
+
+
+def test_escapes_split_across_chunks():
+    text = json.dumps(PLAN, ensure_ascii=False)
+    # 在每个反斜杠之后切开，转义字符落在下一块的开头
+    cuts = [i + 1 for i, ch in enumerate(text) if ch == "\\"]
+    parser = ModuleStreamParser()
+    got = []
+    start = 0
+    for cut in cuts + [len(text)]:
+        got.extend(parser.feed(text[start:cut]))
+        start = cut
+    assert got == EXPECTED
+
+
+def test_markdown_fence_and_trailing_text():
+    text = ("Here is the plan, note the {braces} in prose:\n```json\n"
+            + json.dumps(PLAN, ensure_ascii=False, indent=2)
+            + "\n```\nAnd some closing remarks with {\"modules\": [{\"module_id\": \"X\", \"name\": \"x\"}]}")
+    for size in (1, 7, 64):
+        parser, got = _feed_in_chunks(text, size)
+        assert got == EXPECTED, size
+
+
+def test_modules_are_emitted_as_soon_as_they_close():
+    text = json.dumps(PLAN, ensure_ascii=False)
+    first_end = text.index('"module_id": "M2"')
+    parser = ModuleStreamParser()
+    assert parser.feed(text[:first_end]) == EXPECTED[:1]
+    assert parser.feed(text[first_end:]) == EXPECTED[1:]
@@ -0,0 +1,158 @@
+import textwrap
+
+import pytest
+
+from tools import py_symbol_index, test_preflight
+from tools.test_preflight import validate_files
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    """tmp_path 下的小项目；符号索引写到临时目录，不落到仓库的 memory/ 下"""
+    index_dir = tmp_path / "index"
+    monkeypatch.setattr(test_preflight, "get_symbol_index",
+                        lambda root: py_symbol_index.get_symbol_index(root, index_dir=index_dir))
+    root = tmp_path / "proj"
+    (root / "pm").mkdir(parents=True)
+    (root / "tests").mkdir()
+    (root / "pm" / "__init__.py").write_text(textwrap.dedent("""
+        class Base:
+            def greet(self, name):
+                return name
+
+
+        class Child(Base):
+            def __init__(self, value):
+                self.value = value
+
+
+        def add(a, b=1):
+            return a + b
+    """))
+    return root
+
+
+def _check(root, source):
+    path = root / "tests" / "test_gen.py"
+    path.write_text(textwrap.dedent(source))
+    return [(d["error_type"], d["message"]) for d in validate_files([str(path)], str(root))]
+
+
+def test_object_and_type_attributes_are_not_reported(project):
+    assert _check(project, """
+        import pm
+
+        def test_child():
+            assert pm.Child.mro()[1] is pm.Base
+            assert pm.Child.__subclasses__() == []
+            c = pm.Child(1)
+            assert c.__class__.__name__ == "Child"
+            assert c.greet("x") == "x"
+            assert c.value == 1
+            assert c.__sizeof__() > 0
+    """) == []
+
+
+def test_missing_names_and_arity_are_reported(project):
+    diags = _check(project, """
+        from pm import Child, missing_name
+        import pm
+
+        def test_child():
+            c = Child(1)
+            c.nope()
+            pm.add()
+    """)
+    types = [t for t, _ in diags]
+    assert types.count("ImportError") == 1
+    assert "AttributeError" in types
+    assert "TypeError" in types
+
+
+def test_third_party_names_are_unknown(project):
+    assert _check(project, """
+        import os
+        from collections import OrderedDict
+
+        def test_misc():
+            assert os.path.nonexistent_helper is None
+            OrderedDict().anything()
+    """) == []
+
+
+def _write_module(root, name, source):
+    (root / "pm" / f"{name}.py").write_text(textwrap.dedent(source))
+
+
+def test_dataclass_init_var_is_a_constructor_argument(project):
+    _write_module(project, "models", """
+        from dataclasses import InitVar, dataclass
+        from typing import ClassVar
+
+        @dataclass
+        class P:
+            x: int
+            scale: InitVar[int]
+            registry: ClassVar[dict] = {}
+
+            def __post_init__(self, scale):
+                self.x *= scale
+    """)
+    assert _check(project, """
+        from pm.models import P
+
+        def test_p():
+            assert P(1, 2).x == 2
+    """) == []
+    assert [t for t, _ in _check(project, """
+        from pm.models import P
+
+        def test_p():
+            P(1, 2, 3)
+    """)] == ["TypeError"]
+
+
+def test_classes_with_new_or_without_init_have_unknown_arity(project):
+    _write_module(project, "single", """
+        class Singleton:
+            _instances = {}
+
+            def __new__(cls, name):
+                return cls._instances.setdefault(name, super().__new__(cls))
+
+        class Plain:
+            pass
+    """)
+    assert _check(project, """
+        from pm.single import Plain, Singleton
+
+        def test_singleton():
+            assert Singleton("a") is Singleton("a")
+            Plain()
+    """) == []
+
+
+def test_rebound_functions_have_unknown_arity(project):
+    _write_module(project, "handlers", """
+        import functools
+
+        def handler(a, b):
+            return a + b
+
+        handler = functools.partial(handler, 1)
+
+        def strict(a):
+            return a
+    """)
+    assert _check(project, """
+        from pm.handlers import handler
+
+        def test_handler():
+            assert handler(2) == 3
+    """) == []
+    assert [t for t, _ in _check(project, """
+        from pm import handlers
+
+        def test_strict():
+            handlers.strict()
+    """)] == ["TypeError"]
@@ -0,0 +1,69 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+from tools import py_symbol_index, py_test_worker, sandbox
+from tools.py_test_worker import WarmWorkerPool, sut_fingerprint
+
+pytestmark = pytest.mark.skipif(not py_test_worker.warm_worker_supported(), reason="warm worker needs fork")
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    """tmp_path 下的小项目；符号索引写到临时目录，主机名额只有两个"""
+    index_dir = tmp_path / "index"
+    monkeypatch.setattr(py_test_worker, "get_symbol_index",
+                        lambda root: py_symbol_index.get_symbol_index(root, index_dir=index_dir))
+    monkeypatch.setattr(sandbox, "_SLOTS", sandbox.HostSlots(slots=2, slot_dir=str(tmp_path / "slots")))
+    root = tmp_path / "proj"
+    (root / "pm").mkdir(parents=True)
+    (root / "tests").mkdir()
+    (root / "pm" / "__init__.py").write_text("VALUE = 1\n")
+    (root / "tests" / "test_pm.py").write_text("def test_value():\n    pass\n")
+    return root
+
+
+def test_fingerprint_follows_sut_content_only(project):
+    tests_dir = str(project / "tests")
+    before = sut_fingerprint(str(project), tests_dir)
+    # 只改测试目录、或只 touch 不改内容，worker 不必重建
+    (project / "tests" / "test_pm.py").write_text("def test_value():\n    assert True\n")
+    later = time.time() + 5
+    os.utime(project / "pm" / "__init__.py", (later, later))
+    assert sut_fingerprint(str(project), tests_dir) == before
+    (project / "pm" / "__init__.py").write_text("VALUE = 2\n")
+    assert sut_fingerprint(str(project), tests_dir) != before
+
+
+def test_concurrent_runs_do_not_queue_on_one_worker(project):
+    env = {**os.environ, "PYTHONPATH": str(project)}
+    pool = WarmWorkerPool(sys.executable, str(project), env, [], "fp")
+    script = "import time; time.sleep(1.5)"
+    durations = []
+
+    def run():
+        started = time.monotonic()
+        result = pool.run("timeit", ["-n", "1", "-r", "1", "-s", script, "pass"],
+                          cwd=str(project), env=env, timeout=30)
+        assert result.exit_code == 0 and not result.timed_out
+        durations.append(time.monotonic() - started)
+
+    try:
+        started = time.monotonic()
+        threads = [threading.Thread(target=run) for _ in range(2)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert len(durations) == 2
+        # 两次运行各自 fork，总耗时接近单次而不是两次之和
+        assert time.monotonic() - started < 2.8
+        assert len(pool._idle) == 2
+        # 空闲 worker 被复用，不再启动新进程
+        pool.run("timeit", ["-n", "1", "-r", "1", "pass"], cwd=str(project), env=env, timeout=30)
+        assert len(pool._idle) == 2
+    finally:
+        pool.close()
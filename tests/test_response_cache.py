@@ -0,0 +1,61 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from piplines.response_cache import ResponseCache, response_key
+
+
+def _agent(role="Test Designer", model="gpt-4o", tools=()):
+    return SimpleNamespace(role=role, goal="g", tools=list(tools), llm=SimpleNamespace(model=model, base_url=""))
+
+
+def _key(description="design module A", agent=None):
+    return response_key(description=description, expected_output="markdown", agent=agent or _agent())
+
+
+def test_key_invalidation():
+    assert _key() == _key()
+    assert _key(description="design module B") != _key()
+    assert _key(agent=_agent(model="gpt-4o-mini")) != _key()
+    assert _key(agent=_agent(role="Test Architect")) != _key()
+
+
+def test_memory_lru_eviction():
+    cache = ResponseCache(max_entries=2, disk_dir=None)
+    cache.put("a", "1")
+    cache.put("b", "2")
+    assert cache.get("a") == "1"
+    cache.put("c", "3")
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+    assert cache.stats()["memory_evictions"] == 1
+
+
+def test_disk_tier_survives_restart(tmp_path):
+    ResponseCache(max_entries=4, disk_dir=tmp_path).put("k", "raw")
+    cache = ResponseCache(max_entries=4, disk_dir=tmp_path)
+    assert cache.get("k") == "raw"
+    assert cache.stats()["disk_hits"] == 1
+
+
+def test_expired_entries_are_dropped(tmp_path, monkeypatch):
+    cache = ResponseCache(max_entries=4, disk_dir=tmp_path, ttl_sec=10)
+    cache.put("k", "raw")
+    now = time.time()
+    monkeypatch.setattr("piplines.response_cache.time.time", lambda: now + 60)
+    assert cache.get("k") is None
+    assert not list(tmp_path.glob("*/*.json"))
+
+
+def test_pipeline_step_skips_cache_for_tool_agents(tmp_path):
+    pytest.importorskip("crewai")
+    pytest.importorskip("jinja2")
+    from piplines.core import PipelineStep
+
+    cache = ResponseCache(disk_dir=tmp_path)
+    plain = PipelineStep(agent=_agent(), template_text="t", expected_output="o", output_file="", cache=cache)
+    tooled = PipelineStep(agent=_agent(tools=[SimpleNamespace(name="RunTests")]), template_text="t",
+                          expected_output="o", output_file="", cache=cache)
+    assert plain.cache is cache
+    assert tooled.cache is None
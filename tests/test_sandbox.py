@@ -0,0 +1,62 @@
+import os
+
+import pytest
+
+from tools.sandbox import HostSlots
+
+pytestmark = pytest.mark.skipif(os.name != "posix", reason="host slots use flock")
+
+
+def test_slots_are_exclusive(tmp_path):
+    slots = HostSlots(slots=2, slot_dir=str(tmp_path))
+    first = slots._try_lock()
+    second = slots._try_lock()
+    try:
+        assert first is not None and second is not None
+        assert slots._try_lock() is None
+    finally:
+        slots._unlock(first)
+        slots._unlock(second)
+    with slots.acquire() as queued:
+        assert queued >= 0
+
+
+def test_new_slot_files_ignore_umask(tmp_path):
+    old = os.umask(0o077)
+    try:
+        with HostSlots(slots=1, slot_dir=str(tmp_path)).acquire():
+            pass
+    finally:
+        os.umask(old)
+    assert (tmp_path / "slot_0.lock").stat().st_mode & 0o777 == 0o666
+
+
+def _deny(monkeypatch, names):
+    """模拟其他用户按自己的 umask 创建、本用户无法打开的锁文件"""
+    real_open = os.open
+
+    def fake_open(path, flags, *args):
+        if os.path.basename(path) in names and not flags & os.O_EXCL:
+            raise PermissionError(13, "Permission denied", path)
+        return real_open(path, flags, *args)
+
+    monkeypatch.setattr(os, "open", fake_open)
+
+
+def test_unopenable_slot_files_are_skipped(tmp_path, monkeypatch):
+    (tmp_path / "slot_0.lock").touch()
+    _deny(monkeypatch, {"slot_0.lock"})
+    slots = HostSlots(slots=2, slot_dir=str(tmp_path))
+    with slots.acquire():
+        assert slots.slot_dir == str(tmp_path)
+    assert (tmp_path / "slot_1.lock").exists()
+
+
+def test_falls_back_to_a_per_user_directory(tmp_path, monkeypatch):
+    shared = tmp_path / "slots"
+    shared.mkdir()
+    (shared / "slot_0.lock").touch()
+    _deny(monkeypatch, {"slot_0.lock"})
+    slots = HostSlots(slots=1, slot_dir=str(shared))
+    with slots.acquire():
+        assert slots.slot_dir == f"{shared}_{os.getuid()}"
@@ -0,0 +1,113 @@
+import asyncio
+import threading
+import time
+
+from piplines.scheduler import AsyncStageScheduler, StageScheduler
+
+
+def _node(name, log=None, fail=False, delay=0.0):
+    def fn():
+        if log is not None:
+            log.append(name)
+        time.sleep(delay)
+        yield "content", name
+        if fail:
+            raise RuntimeError(f"{name} broke")
+
+    return fn
+
+
+def _anode(name, fail=False, delay=0.0):
+    async def fn():
+        await asyncio.sleep(delay)
+        yield "content", name
+        if fail:
+            raise RuntimeError(f"{name} broke")
+
+    return fn
+
+
+def _ends(events):
+    return {e.key: e.status for e in events if e.kind == "end"}
+
+
+def test_failure_skips_dependents_transitively():
+    log = []
+    scheduler = StageScheduler(max_concurrency=2)
+    scheduler.add_node(("a", 1), _node("a1", log, fail=True))
+    scheduler.add_node(("a", 2), _node("a2", log), deps=[("a", 1)])
+    scheduler.add_node(("a", 3), _node("a3", log), deps=[("a", 2)])
+    scheduler.add_node(("b", 1), _node("b1", log))
+    scheduler.add_node(("b", 2), _node("b2", log), deps=[("b", 1)])
+    scheduler.seal()
+    events = list(scheduler.stream())
+
+    assert _ends(events) == {("a", 1): "failed", ("a", 2): "skipped", ("a", 3): "skipped",
+                             ("b", 1): "done", ("b", 2): "done"}
+    assert sorted(log) == ["a1", "b1", "b2"]
+    # 失败节点在出错前产出的帧照常输出
+    assert [e.data for e in events if e.kind == "frame" and e.key == ("a", 1)] == ["a1"]
+    assert "a1 broke" in next(e.data for e in events if e.kind == "end" and e.key == ("a", 1))
+
+
+def test_missing_dependency_is_skipped_at_seal():
+    scheduler = StageScheduler()
+    scheduler.add_node("child", _node("child"), deps=["never-added"])
+    scheduler.add_node("other", _node("other"))
+    scheduler.seal()
+    events = list(scheduler.stream())
+    assert _ends(events) == {"child": "skipped", "other": "done"}
+    assert "never-added" in next(e.data for e in events if e.kind == "end" and e.key == "child")
+
+
+def test_nodes_added_while_running_wait_for_their_dependencies():
+    scheduler = StageScheduler(max_concurrency=4)
+    scheduler.add_node("plan", _node("plan", delay=0.05))
+    seen = []
+    for event in scheduler.stream():
+        seen.append((event.kind, event.key))
+        if event.kind == "start" and event.key == "plan":
+            # 阶段 1 边生成边派发：依赖尚未完成的节点先挂起
+            scheduler.add_node("design", _node("design"), deps=["plan"])
+            scheduler.seal()
+    assert seen.index(("end", "plan")) < seen.index(("start", "design"))
+    assert scheduler.status() == {"plan": "done", "design": "done"}
+
+
+def test_concurrency_is_bounded():
+    running, peak = [0], [0]
+    lock = threading.Lock()
+
+    def fn():
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.05)
+        with lock:
+            running[0] -= 1
+        yield "content", None
+
+    scheduler = StageScheduler(max_concurrency=2)
+    for i in range(6):
+        scheduler.add_node(i, fn)
+    scheduler.seal()
+    list(scheduler.stream())
+    assert peak[0] == 2
+
+
+def test_async_failure_skips_dependents_transitively():
+    async def main():
+        scheduler = AsyncStageScheduler(max_concurrency=2)
+        scheduler.add_node(("a", 1), _anode("a1", fail=True))
+        scheduler.add_node(("a", 2), _anode("a2"), deps=[("a", 1)])
+        scheduler.add_node(("a", 3), _anode("a3"), deps=[("a", 2)])
+        scheduler.add_node(("b", 1), _anode("b1", delay=0.01))
+        scheduler.add_node(("b", 2), _anode("b2"), deps=[("b", 1)])
+        scheduler.add_node("orphan", _anode("orphan"), deps=["never-added"])
+        scheduler.seal()
+        return [e async for e in scheduler.stream()]
+
+    events = asyncio.run(main())
+    assert _ends(events) == {("a", 1): "failed", ("a", 2): "skipped", ("a", 3): "skipped",
+                             ("b", 1): "done", ("b", 2): "done", "orphan": "skipped"}
+    assert not any(e.kind == "start" and e.key in (("a", 2), ("a", 3), "orphan") for e in events)
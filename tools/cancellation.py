@@ -0,0 +1,175 @@
+from __future__ import annotations
+
+import os
+import signal
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional
+
+
+class RunCancelled(Exception):
+    """运行已被取消（客户端断开或调用了取消接口）"""
+
+
+class CancelToken:
+    """
+    一次运行的协作式取消标记，可跨线程共享：
+    - 流水线在块与块之间、节点开始前调用 check()，已取消时抛出 RunCancelled
+    - 子进程通过 on_cancel 注册回调，取消时立即结束整个进程组，不必等到下一次检查
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks: Dict[int, Callable[[], None]] = {}
+        self._next_id = 0
+        self.reason: Optional[str] = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self, reason: str = "cancelled") -> bool:
+        """取消并执行所有已注册的回调；重复调用返回 False"""
+        with self._lock:
+            if self._event.is_set():
+                return False
+            self.reason = reason
+            self._event.set()
+            callbacks = list(self._callbacks.values())
+            self._callbacks.clear()
+        for cb in callbacks:
+            try:
+                cb()
+            except Exception:
+                pass
+        return True
+
+    def check(self) -> None:
+        if self._event.is_set():
+            raise RunCancelled(self.reason or "cancelled")
+
+    def on_cancel(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """注册取消回调（已取消时立即执行），返回注销函数"""
+        with self._lock:
+            if not self._event.is_set():
+                self._next_id += 1
+                key = self._next_id
+                self._callbacks[key] = callback
+                return lambda: self._callbacks.pop(key, None)
+        callback()
+        return lambda: None
+
+
+def _kill_group(pgid: int) -> None:
+    try:
+        os.killpg(pgid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+@contextmanager
+def kill_on_cancel(cancel: Optional[CancelToken], pid: int, *, group: bool = True,
+                   timeout: Optional[float] = None) -> Iterator[None]:
+    """
+    上下文内取消时结束子进程（group=True 时结束整个进程组），并计入指标：
+    timeout 给出时，剩余的超时预算记为省下的子进程时间（上限估计）。
+    """
+    if cancel is None:
+        yield
+        return
+    started = time.monotonic()
+
+    def kill():
+        if group and os.name == "posix":
+            _kill_group(pid)
+        else:
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except OSError:
+                pass
+        saved = max(0.0, timeout - (time.monotonic() - started)) if timeout else 0.0
+        get_cancel_metrics().record_kill(saved)
+
+    unregister = cancel.on_cancel(kill)
+    try:
+        yield
+    finally:
+        unregister()
+
+
+def bind_cancel_token(agent: Any, cancel: Optional[CancelToken]) -> None:
+    """把取消标记交给 agent 的工具（声明了 _cancel_token 的工具会在启动子进程时使用它）"""
+    for tool in getattr(agent, "tools", None) or []:
+        if hasattr(tool, "_cancel_token"):
+            tool._cancel_token = cancel
+
+
+class CancelMetrics:
+    """
+    取消带来的节省（进程内累计）：
+    - runs：被取消的运行数（按原因）
+    - nodes_skipped：取消时尚未开始、因此不再执行的 (模块, 阶段) 节点数
+    - nodes_interrupted：执行到一半被中断的节点数（LLM 流不再读取）
+    - process_groups_killed：被提前结束的测试子进程（组）数
+    - subprocess_sec_saved：被结束的子进程剩余的超时预算之和（上限估计）
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._runs: Dict[str, int] = {}
+        self._counters = {"nodes_skipped": 0, "nodes_interrupted": 0, "process_groups_killed": 0}
+        self._sec_saved = 0.0
+
+    def record_run(self, reason: str) -> None:
+        with self._lock:
+            self._runs[reason] = self._runs.get(reason, 0) + 1
+
+    def record_nodes(self, skipped: int = 0, interrupted: int = 0) -> None:
+        with self._lock:
+            self._counters["nodes_skipped"] += skipped
+            self._counters["nodes_interrupted"] += interrupted
+
+    def record_kill(self, sec_saved: float = 0.0) -> None:
+        with self._lock:
+            self._counters["process_groups_killed"] += 1
+            self._sec_saved += sec_saved
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "runs": dict(self._runs),
+                **self._counters,
+                "subprocess_sec_saved": round(self._sec_saved, 1),
+            }
+
+
+_METRICS: Optional[CancelMetrics] = None
+_METRICS_LOCK = threading.Lock()
+
+
+def get_cancel_metrics() -> CancelMetrics:
+    global _METRICS
+    with _METRICS_LOCK:
+        if _METRICS is None:
+            _METRICS = CancelMetrics()
+        return _METRICS
+
+
+def install_step_check(agent: Any, cancel: Optional[CancelToken]) -> None:
+    """
+    设置 agent 的 step_callback：crewAI 在每个推理步骤之后调用它，已取消时抛出 RunCancelled，
+    本次 kickoff 不再发起新的 LLM 调用。agent 原有的 step_callback 照常调用；重复安装只替换取消检查。
+    """
+    if cancel is None or not hasattr(agent, "step_callback"):
+        return
+    original = getattr(agent.step_callback, "_original", agent.step_callback)
+
+    def step_callback(*args, **kwargs):
+        cancel.check()
+        if original is not None:
+            return original(*args, **kwargs)
+
+    step_callback._original = original
+    agent.step_callback = step_callback
@@ -0,0 +1,417 @@
+from __future__ import annotations
+
+import ast
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from tools.java_outline import extract_outline, mask_java
+
+
+class MergeError(ValueError):
+    """已有内容或新内容无法解析，调用方应退回到追加写入"""
+
+
+# 一次编辑：[start, end) 替换为 text；start == end 时为插入
+_Edit = Tuple[int, int, str]
+
+
+def _apply_edits(items: List[Any], edits: List[_Edit]) -> List[Any]:
+    """
+    从后往前应用编辑（行列表或字符列表均可）。
+    同一位置既有替换又有插入时先做替换，插入内容落在替换内容之前；
+    同一位置的多个插入按登记顺序排列。
+    """
+    out = list(items)
+    order = sorted(range(len(edits)), key=lambda i: (edits[i][0], edits[i][0] != edits[i][1], i), reverse=True)
+    for i in order:
+        start, end, text = edits[i]
+        out[start:end] = text
+    return out
+
+
+def _reindent(lines: List[str], old: str, new: str) -> List[str]:
+    if old == new:
+        return lines
+    return [new + line[len(old):] if line.startswith(old) else line for line in lines]
+
+
+# ---------- Python ----------
+
+def _py_span(lines: List[str], node: ast.stmt) -> Tuple[int, int]:
+    """语句所在行区间 [start, end)（0 基），包含装饰器与紧贴其上的注释行"""
+    start = min([node.lineno] + [d.lineno for d in getattr(node, "decorator_list", [])]) - 1
+    while start > 0:
+        prev = lines[start - 1].strip()
+        # 文件头的 shebang / 编码声明不属于任何定义
+        if not prev.startswith("#") or (start <= 2 and (prev.startswith("#!") or "coding" in prev)):
+            break
+        start -= 1
+    return start, node.end_lineno
+
+
+def _is_main_guard(node: ast.stmt) -> bool:
+    return (isinstance(node, ast.If) and isinstance(node.test, ast.Compare)
+            and isinstance(node.test.left, ast.Name) and node.test.left.id == "__name__")
+
+
+def _py_key(node: ast.stmt, index: int) -> Tuple:
+    """同 key 的语句视为同一定义：新内容替换旧内容"""
+    if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+        return ("def", node.name)
+    if isinstance(node, (ast.Assign, ast.AnnAssign)):
+        targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+        if all(isinstance(t, ast.Name) for t in targets):
+            return ("assign", tuple(t.id for t in targets))
+    if index == 0 and isinstance(node, ast.Expr) and isinstance(node.value, ast.Constant) \
+            and isinstance(node.value.value, str):
+        return ("docstring",)
+    if _is_main_guard(node):
+        return ("main",)
+    return ("stmt", ast.dump(node))
+
+
+def _import_keys(node: ast.stmt) -> List[Tuple[Tuple, str]]:
+    """把 import 语句拆成逐个名字：(key, 单独成行的 import 文本)"""
+    out = []
+    for alias in node.names:
+        name = alias.name + (f" as {alias.asname}" if alias.asname else "")
+        if isinstance(node, ast.Import):
+            out.append((("import", alias.name, alias.asname), f"import {name}"))
+        else:
+            module = "." * node.level + (node.module or "")
+            out.append((("from", module, alias.name, alias.asname), f"from {module} import {name}"))
+    return out
+
+
+def _missing_imports(old_body: List[ast.stmt], new_body: List[ast.stmt]) -> Tuple[List[str], List[str]]:
+    """返回 (缺失的 __future__ 导入, 缺失的其他导入) 文本；同一模块的多个名字合并成一行"""
+    have = {key for node in old_body if isinstance(node, (ast.Import, ast.ImportFrom))
+            for key, _ in _import_keys(node)}
+    future: List[str] = []
+    grouped: Dict[str, List[str]] = {}
+    for node in new_body:
+        if not isinstance(node, (ast.Import, ast.ImportFrom)):
+            continue
+        for key, text in _import_keys(node):
+            if key in have:
+                continue
+            have.add(key)
+            if key[0] == "import":
+                grouped.setdefault(text, [])
+            elif key[1] == "__future__":
+                future.append(text)
+            else:
+                grouped.setdefault(key[1], []).append(text.split(" import ", 1)[1])
+    lines = [head if not names else f"from {head} import {', '.join(names)}" for head, names in grouped.items()]
+    return future, lines
+
+
+def _unique_keys(keys: List[Tuple], what: str) -> None:
+    """
+    同一序列中 key 重复（property 的 getter / setter、@overload 组、条件分支中的重定义）时
+    无法确定新旧定义的对应关系，抛出 MergeError 让调用方退回到追加写入
+    """
+    seen = set()
+    for key in keys:
+        if key[0] in ("stmt", "other"):
+            continue
+        if key in seen:
+            raise MergeError(f"{what} defines {key[1:]!r} more than once")
+        seen.add(key)
+
+
+def _merge_members(old_lines: List[str], new_lines: List[str],
+                   old_body: List[ast.stmt], new_body: List[ast.stmt],
+                   insert_at: int, top_level: bool) -> List[_Edit]:
+    """按 key 合并语句序列：同名替换（类按成员递归合并），新的追加到 insert_at"""
+    old_keys = [_py_key(node, i) for i, node in enumerate(old_body)]
+    _unique_keys(old_keys, "existing code")
+    _unique_keys([_py_key(node, i) for i, node in enumerate(new_body)], "new code")
+    old_by_key = dict(zip(old_keys, old_body))
+    old_indent = " " * old_body[0].col_offset if old_body else ""
+    edits: List[_Edit] = []
+    appended: List[str] = []
+    sep = ["", ""] if top_level else [""]
+    for i, node in enumerate(new_body):
+        if isinstance(node, (ast.Import, ast.ImportFrom)) and top_level:
+            continue
+        key = _py_key(node, i)
+        if key == ("docstring",):
+            continue
+        start, end = _py_span(new_lines, node)
+        text = _reindent(new_lines[start:end], " " * node.col_offset, old_indent)
+        old = old_by_key.get(key)
+        if old is None:
+            appended.extend(sep + text)
+        elif key[0] == "stmt":
+            continue
+        elif isinstance(old, ast.ClassDef) and isinstance(node, ast.ClassDef):
+            edits.extend(_merge_members(old_lines, new_lines, old.body, node.body,
+                                        _py_span(old_lines, old)[1], top_level=False))
+        else:
+            o_start, o_end = _py_span(old_lines, old)
+            edits.append((o_start, o_end, text))
+    if appended:
+        edits.append((insert_at, insert_at, appended))
+    return edits
+
+
+def merge_python(existing: str, incoming: str) -> str:
+    """
+    把 incoming 合并进 existing：
+    - import 逐名去重，缺失的补在已有 import 之后（__future__ 放在文件头部）
+    - 同名的函数 / 类 / 变量赋值原位替换；同名类按成员（方法、类属性）合并
+    - 新定义追加在末尾（位于 `if __name__ == "__main__":` 之前）；完全相同的其他语句不重复
+    任一方无法解析、或同一作用域内有同名定义（property setter、@overload 等）时抛出 MergeError。
+    """
+    try:
+        old_tree = ast.parse(existing)
+        new_tree = ast.parse(incoming)
+    except SyntaxError as e:
+        raise MergeError(f"cannot parse: {e}") from e
+    old_lines = existing.splitlines()
+    new_lines = incoming.splitlines()
+    old_body = old_tree.body
+
+    # 插入位置：import 区末尾；文件末尾（或 main 守卫之前）
+    future_at = 0
+    if old_body and _py_key(old_body[0], 0) == ("docstring",):
+        future_at = old_body[0].end_lineno
+    imports_at = future_at
+    for node in old_body:
+        if isinstance(node, ast.ImportFrom) and node.module == "__future__":
+            future_at = imports_at = node.end_lineno
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            imports_at = node.end_lineno
+    tail_at = len(old_lines)
+    if old_body and _is_main_guard(old_body[-1]):
+        tail_at = _py_span(old_lines, old_body[-1])[0]
+        while tail_at > 0 and not old_lines[tail_at - 1].strip():
+            tail_at -= 1
+
+    edits: List[_Edit] = []
+    future, imports = _missing_imports(old_body, new_tree.body)
+    if future:
+        edits.append((future_at, future_at, future))
+    if imports:
+        edits.append((imports_at, imports_at, imports if imports_at else imports + [""]))
+    edits.extend(_merge_members(old_lines, new_lines, old_body, new_tree.body, tail_at, top_level=True))
+
+    merged = "\n".join(_apply_edits(old_lines, edits)).strip("\n") + "\n"
+    try:
+        ast.parse(merged)
+    except SyntaxError as e:
+        raise MergeError(f"merged result does not parse: {e}") from e
+    return merged
+
+
+# ---------- Java ----------
+
+_JAVA_IMPORT_RE = re.compile(r"^[ \t]*import\s+(static\s+)?([\w.]+(?:\s*\.\s*\*)?)\s*;[^\n]*\n?", re.MULTILINE)
+_JAVA_PACKAGE_RE = re.compile(r"^[ \t]*package\s+[\w.]+\s*;[^\n]*\n?", re.MULTILINE)
+_JAVA_TYPE_KW_RE = re.compile(r"\b(class|interface|enum|record)\s+\w+")
+_JAVA_IDENT_RE = re.compile(r"[A-Za-z_$][\w$]*")
+_JAVA_ANNOTATION_RE = re.compile(r"@\s*[\w.]+(\s*\([^()]*\))?")
+_WRAPPER = "__MergeSnippet__"
+
+
+def _java_imports(masked: str) -> List[Tuple[str, int, int]]:
+    """import 语句：(规范化的导入名, start, end)"""
+    out = []
+    for m in _JAVA_IMPORT_RE.finditer(masked):
+        key = ("static " if m.group(1) else "") + re.sub(r"\s+", "", m.group(2))
+        out.append((key, m.start(), m.end()))
+    return out
+
+
+def _java_params(signature: str) -> str:
+    """方法签名 -> 参数类型列表（去掉参数名与修饰），用于区分重载"""
+    inner = signature[signature.find("(") + 1:signature.rfind(")")]
+    types, depth, cur = [], 0, ""
+    for ch in inner + ",":
+        if ch == "," and depth == 0:
+            param = _JAVA_ANNOTATION_RE.sub(" ", cur).replace("final ", " ").strip()
+            if param:
+                types.append(re.sub(r"\s+", "", param.rsplit(None, 1)[0] if " " in param else param))
+            cur = ""
+            continue
+        depth += ch == "<"
+        depth -= ch == ">"
+        cur += ch
+    return ",".join(types)
+
+
+def _with_leading_comment(content: str, masked: str, floor: int, start: int) -> int:
+    """把紧贴在成员之前的注释 / Javadoc 计入成员范围"""
+    region = content[floor:start]
+    if not region.strip():
+        return start
+    return floor + len(region) - len(region.lstrip())
+
+
+def _line_indent(content: str, pos: int) -> str:
+    line_start = content.rfind("\n", 0, pos) + 1
+    return re.match(r"[ \t]*", content[line_start:]).group()
+
+
+def _java_body(masked: str, type_rec: Dict[str, Any]) -> Tuple[int, int]:
+    kw = _JAVA_TYPE_KW_RE.search(masked, type_rec["start"])
+    return masked.index("{", kw.end()) + 1, type_rec["end"] - 1
+
+
+def _java_members(content: str, masked: str, outline: Dict[str, Any],
+                  type_rec: Dict[str, Any]) -> List[Tuple[Tuple, int, int]]:
+    """类体的直接成员：(key, start, end)；方法按 名字+参数类型，嵌套类型按名字，字段按变量名"""
+    qual = type_rec["qualname"]
+    body_start, body_end = _java_body(masked, type_rec)
+    spans: List[Tuple[Tuple, int, int]] = []
+    for mt in outline["methods"]:
+        if mt["class_qualname"] == qual:
+            spans.append((("method", mt["name"], _java_params(mt["signature"])), mt["start"], mt["end"]))
+    for t in outline["types"]:
+        if t["qualname"] == f"{qual}.{t['name']}":
+            spans.append((("type", t["name"]), t["start"], t["end"]))
+    spans.sort(key=lambda s: s[1])
+
+    # 成员之间的空隙里是字段、初始化块等：按顶层 ; 或独立的 {...} 切分
+    members: List[Tuple[Tuple, int, int]] = []
+    cursor = body_start
+    for span in spans + [(None, body_end, body_end)]:
+        depth, stmt = 0, cursor
+        for pos in range(cursor, span[1]):
+            ch = masked[pos]
+            if ch == "{":
+                depth += 1
+            elif ch == "}":
+                depth -= 1
+                if depth == 0 and "=" not in masked[stmt:pos].split("{", 1)[0]:
+                    members.append(_java_statement(content, masked, stmt, pos + 1))
+                    stmt = pos + 1
+            elif ch == ";" and depth == 0:
+                members.append(_java_statement(content, masked, stmt, pos + 1))
+                stmt = pos + 1
+        if span[0] is not None:
+            members.append((span[0], _with_leading_comment(content, masked, stmt, span[1]), span[2]))
+            cursor = span[2]
+    return [m for m in members if m[0] is not None]
+
+
+def _java_statement(content: str, masked: str, floor: int, end: int) -> Tuple[Optional[Tuple], int, int]:
+    text = masked[floor:end]
+    if not text.strip() or not text.strip(" \t\r\n;"):
+        return None, floor, end
+    start = floor + len(text) - len(text.lstrip())
+    start = _with_leading_comment(content, masked, floor, start)
+    head = _JAVA_ANNOTATION_RE.sub(" ", masked[floor:end]).split("=", 1)[0]
+    if "{" not in head and "(" not in head:
+        names = _JAVA_IDENT_RE.findall(head)
+        if names:
+            return ("field", names[-1]), start, end
+    return ("other", " ".join(content[start:end].split())), start, end
+
+
+def _top_types(outline: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [t for t in outline["types"] if "." not in t["qualname"]]
+
+
+def _merge_java_type(existing: str, ex_masked: str, ex_outline: Dict[str, Any], ex_type: Dict[str, Any],
+                     incoming: str, in_masked: str, in_outline: Dict[str, Any], in_type: Dict[str, Any]) -> List[_Edit]:
+    old_members = _java_members(existing, ex_masked, ex_outline, ex_type)
+    new_members = _java_members(incoming, in_masked, in_outline, in_type)
+    _unique_keys([m[0] for m in old_members], "existing code")
+    _unique_keys([m[0] for m in new_members], "new code")
+    old = {key: (start, end) for key, start, end in old_members}
+    body_start, body_end = _java_body(ex_masked, ex_type)
+    member_indent = None
+    for _, start, _ in old_members[:1]:
+        member_indent = _line_indent(existing, start)
+    if member_indent is None:
+        member_indent = _line_indent(existing, ex_type["start"]) + "    "
+
+    edits: List[_Edit] = []
+    appended: List[str] = []
+    for key, start, end in new_members:
+        # 成员起点之前的缩进不在切片内，只需调整后续行
+        first, *rest = incoming[start:end].split("\n")
+        text = "\n".join([first] + _reindent(rest, _line_indent(incoming, start), member_indent))
+        if key in old:
+            o_start, o_end = old[key]
+            if key[0] != "other":
+                edits.append((o_start, o_end, text))
+            continue
+        appended.append(member_indent + text)
+    if appended:
+        tail = body_start + len(existing[body_start:body_end].rstrip())
+        gap = "\n\n" if tail > body_start else "\n"
+        edits.append((tail, tail, gap + "\n\n".join(appended)))
+    return edits
+
+
+def merge_java(existing: str, incoming: str) -> str:
+    """
+    把 incoming 合并进 existing：
+    - import 去重，缺失的补在已有 import 之后
+    - 同名顶层类型按成员合并：同名方法（按参数类型区分重载）、嵌套类型、字段原位替换，新成员追加到类体末尾
+    - 新的顶层类型追加在文件末尾
+    incoming 只有成员片段（没有类型声明）时合并进 existing 的第一个顶层类型。
+    """
+    ex_masked = mask_java(existing)
+    ex_outline = extract_outline(existing)
+    ex_types = _top_types(ex_outline)
+    if not ex_types:
+        raise MergeError("existing Java file declares no type")
+
+    in_masked = mask_java(incoming)
+    new_imports = _java_imports(in_masked)
+    # 去掉 import / package 后再解析，片段可以整体包进一个临时类
+    body = incoming
+    for m in sorted(list(_JAVA_IMPORT_RE.finditer(in_masked)) + list(_JAVA_PACKAGE_RE.finditer(in_masked)),
+                    key=lambda m: m.start(), reverse=True):
+        body = body[:m.start()] + body[m.end():]
+    in_outline = extract_outline(body)
+    if not _top_types(in_outline):
+        body = f"class {_WRAPPER} {{\n{body}\n}}\n"
+        in_outline = extract_outline(body)
+    body_masked = mask_java(body)
+
+    edits: List[_Edit] = []
+    by_name = {t["name"]: t for t in ex_types}
+    appended: List[str] = []
+    for in_type in _top_types(in_outline):
+        target = ex_types[0] if in_type["name"] == _WRAPPER else by_name.get(in_type["name"])
+        if target is None:
+            appended.append(body[in_type["start"]:in_type["end"]])
+            continue
+        edits.extend(_merge_java_type(existing, ex_masked, ex_outline, target,
+                                      body, body_masked, in_outline, in_type))
+    if appended:
+        edits.append((len(existing.rstrip()), len(existing.rstrip()), "\n\n" + "\n\n".join(appended)))
+
+    have = {key for key, _, _ in _java_imports(ex_masked)}
+    missing = []
+    for key, start, end in new_imports:
+        if key not in have:
+            have.add(key)
+            missing.append(incoming[start:end].strip())
+    if missing:
+        ex_import_spans = _java_imports(ex_masked)
+        if ex_import_spans:
+            at, text = ex_import_spans[-1][2], "\n".join(missing) + "\n"
+        else:
+            pkg = _JAVA_PACKAGE_RE.search(ex_masked)
+            at, text = (pkg.end(), "\n" + "\n".join(missing) + "\n") if pkg else (0, "\n".join(missing) + "\n\n")
+        if at and existing[at - 1] != "\n":
+            text = "\n" + text
+        edits.append((at, at, text))
+
+    merged = "".join(_apply_edits(list(existing), [(s, e, list(t)) for s, e, t in edits]))
+    return merged.rstrip("\n") + "\n"
+
+
+def merge_code(path: str, existing: str, incoming: str) -> str:
+    """按扩展名选择合并方式；不支持的语言抛出 MergeError"""
+    if path.endswith(".py"):
+        return merge_python(existing, incoming)
+    if path.endswith(".java"):
+        return merge_java(existing, incoming)
+    raise MergeError(f"no merge support for {path}")
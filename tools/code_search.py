@@ -1,12 +1,13 @@
 import re
-import ast
-import re
 from pathlib import Path
 from typing import Type, List, Dict, Any, Literal
 
 from crewai.tools import BaseTool
 from pydantic import BaseModel, Field
 
+from tools.java_outline import extract_block, get_java_index
+from tools.py_symbol_index import get_symbol_index, infer_module_name
+
 
 class CodeSearchInput(BaseModel):
     """输入 schema：要检索的符号名/类型、根目录、以及一些检索参数。"""
@@ -30,6 +31,7 @@ class CodeSearchTool(BaseTool):
     代码搜索工具：
     - 在指定目录递归扫描 .py 文件
     - 使用 AST 精确定位 class / function 定义
+    - 定义信息保存在持久化索引中（memory/code_index），只对变化的文件重新解析
     - 返回：源码片段、所在文件、起止行、模块名（包名）
     """
     name: str = "code_search"
@@ -38,6 +40,9 @@ class CodeSearchTool(BaseTool):
         "Returns source code and module/package path."
     )
     args_schema: Type[BaseModel] = CodeSearchInput
+    # 运维配置（config.yaml 的 tools.code_search），不在 args_schema 中：
+    # 索引冷启动时的解析进程数（0 表示使用 CPU 核数，1 表示串行）
+    workers: int = 0
 
     def _run(
             self,
@@ -70,101 +75,56 @@ class CodeSearchTool(BaseTool):
                 n = name if case_sensitive else name.lower()
                 return n == q
 
-        # 收集结果
+        # 增量刷新索引：只有 mtime/size 变化的文件才会重新读取和解析
+        index = get_symbol_index(root)
+        files = index.refresh(file_glob, workers=self.workers)
+        hits = index.lookup(
+            files,
+            _match,
+            kind=kind,
+            include_private=include_private,
+            max_results=max_results,
+            max_file_size_kb=max_file_size_kb,
+        )
+        index.save()
+
+        # 收集结果：只读取命中的文件来切片源码
         results: List[Dict[str, Any]] = []
-
-        # 遍历文件
-        for py_file in root.glob(file_glob):
-            if not py_file.is_file():
-                continue
-
-            # 大文件跳过（加速）
-            try:
-                size_kb = py_file.stat().st_size / 1024.0
-                if size_kb > max_file_size_kb:
-                    continue
-            except OSError:
-                continue
-
-            # 读取源码
-            try:
-                text = py_file.read_text(encoding="utf-8")
-            except UnicodeDecodeError:
-                # 尝试宽松编码（可按需扩展）
+        lines_cache: Dict[str, List[str]] = {}
+        for hit in hits:
+            py_file = root / hit["rel_file"]
+            lines = lines_cache.get(hit["rel_file"])
+            if lines is None:
                 try:
                     text = py_file.read_text(encoding="utf-8", errors="ignore")
                 except Exception:
                     continue
-            except Exception:
-                continue
-
-            # 解析 AST
-            try:
-                tree = ast.parse(text, filename=str(py_file))
-            except SyntaxError:
-                continue
-
-            # 为 end_lineno 做兼容（py>=3.8 通常都有；缺失则后面降级）
-            lines = text.splitlines(keepends=True)
-
-            # 遍历定义
-            for node in ast.walk(tree):
-                if len(results) >= max_results:
-                    break
-
-                # 过滤类型
-                is_func = isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef))
-                is_cls = isinstance(node, ast.ClassDef)
-
-                if kind == "function" and not is_func:
-                    continue
-                if kind == "class" and not is_cls:
-                    continue
-                if kind == "any" and not (is_func or is_cls):
-                    continue
-
-                name = getattr(node, "name", None)
-                if not name:
-                    continue
-
-                if not include_private and name.startswith("_"):
-                    continue
-
-                if not _match(name):
-                    continue
-
-                # 取行号范围（1-based）
-                start = getattr(node, "lineno", None)
-                end = getattr(node, "end_lineno", None)
-
-                # end_lineno 可能缺失：降级为只取起始行到起始行+1（尽量不炸）
-                if start is None:
-                    continue
-                if end is None:
-                    end = start
-
-                # 加上下文
-                ctx = max(0, int(snippet_context_lines))
-                start_idx = max(1, start - ctx)
-                end_idx = min(len(lines), end + ctx)
-
-                snippet = "".join(lines[start_idx - 1: end_idx])
-
-                # 计算模块名（包名）
-                module_name = self._infer_module_name(root, py_file)
-
-                results.append(
-                    {
-                        "symbol": name,
-                        "kind": "class" if is_cls else "function",
-                        "module": module_name,  # e.g. hone.utils.csv_utils
-                        "file": str(py_file),  # 绝对路径
-                        "rel_file": str(py_file.relative_to(root)),
-                        "start_line": start,
-                        "end_line": end,
-                        "snippet": snippet,
-                    }
-                )
+                lines = text.splitlines(keepends=True)
+                lines_cache[hit["rel_file"]] = lines
+
+            start = hit["start_line"]
+            end = hit["end_line"]
+
+            # 加上下文
+            ctx = max(0, int(snippet_context_lines))
+            start_idx = max(1, start - ctx)
+            end_idx = min(len(lines), end + ctx)
+
+            snippet = "".join(lines[start_idx - 1: end_idx])
+
+            results.append(
+                {
+                    "symbol": hit["name"],
+                    "qualname": hit["qualname"],
+                    "kind": hit["kind"],
+                    "module": hit["module"],  # e.g. hone.utils.csv_utils
+                    "file": str(py_file),  # 绝对路径
+                    "rel_file": str(Path(hit["rel_file"])),
+                    "start_line": start,
+                    "end_line": end,
+                    "snippet": snippet,
+                }
+            )
 
         # 输出结果（JSON 字符串，便于下游 Agent 解析）
         import json
@@ -179,24 +139,8 @@ class CodeSearchTool(BaseTool):
 
     @staticmethod
     def _infer_module_name(root: Path, file_path: Path) -> str:
-        """
-        尝试从文件路径推断模块名（包名）：
-        - 相对于 root 的相对路径
-        - 去掉 .py
-        - 将路径分隔符替换成 '.'
-        - 如果是 __init__.py，则模块名是目录名（例如 hone/utils/__init__.py -> hone.utils）
-        """
-        rel = file_path.resolve().relative_to(root.resolve())
-        parts = list(rel.parts)
-
-        if parts[-1] == "__init__.py":
-            parts = parts[:-1]  # 包本身
-        else:
-            parts[-1] = parts[-1].removesuffix(".py")
-
-        # 过滤掉空 parts
-        parts = [p for p in parts if p]
-        return ".".join(parts)
+        """推断模块名（包名），逻辑见 tools.py_symbol_index.infer_module_name"""
+        return infer_module_name(root, file_path)
 
 
 from pydantic import BaseModel, Field
@@ -247,89 +191,59 @@ class SearchJavaCodeTool(BaseTool):
             response["error"] = f"Directory not found: {root_dir}"
             return json.dumps(response, ensure_ascii=False)
 
-        flags = re.IGNORECASE if ignore_case else 0
-
-        if search_type == "class":
-            pattern = rf"\b(class|interface|enum)\s+{re.escape(query)}\b"
-        elif search_type == "method":
-            pattern = rf"""
-                ^\s*
-                (public|protected|private|\s)*
-                [\w\<\>\[\]]+\s+
-                {re.escape(query)}
-                \s*\([^;]*\)
-                \s*\{{ 
-            """
-        else:
+        if search_type not in ("class", "method"):
             response["error"] = "search_type must be 'class' or 'method'"
             return json.dumps(response, ensure_ascii=False)
 
-        regex = re.compile(pattern, flags | re.MULTILINE | re.VERBOSE)
-
-        for root, _, files in os.walk(root_dir):
-            for file in files:
-                if not file.endswith(".java"):
-                    continue
-
-                path = os.path.join(root, file)
+        # 大纲索引：只有 mtime/size 变化的文件会被重新解析，查询直接命中索引
+        index = get_java_index(root_dir)
+        index.refresh()
+        hits = index.lookup(search_type, query, ignore_case=ignore_case, max_results=max_results)
+        index.save()
+
+        contents: Dict[str, str] = {}
+        for hit in hits:
+            path = os.path.join(index.root, hit["rel_file"])
+            content = contents.get(path)
+            if content is None:
                 try:
                     with open(path, "r", encoding="utf-8", errors="ignore") as f:
                         content = f.read()
                 except Exception:
                     continue
+                contents[path] = content
 
-                for match in regex.finditer(content):
-                    block = self._extract_block(content, match.start())
-                    if not block:
-                        continue
-
-                    info = {
-                        "file": path,
-                        "code": block,
-                    }
+            block = self._extract_block(content, hit["start"], path)
+            if not block:
+                continue
 
-                    if search_type == "class":
-                        info["class_name"] = query
-                    else:
-                        info["method_name"] = query
-                        info["class_name"] = self._infer_class_name(content, match.start())
-                        info["signature"] = block.split("{", 1)[0].strip()
+            info = {
+                "file": path,
+                "code": block,
+                "package": hit["package"],
+            }
 
-                    response["results"].append(info)
+            if search_type == "class":
+                info["class_name"] = hit["name"]
+                info["qualified_name"] = hit["qualname"]
+                info["kind"] = hit["kind"]
+            else:
+                info["method_name"] = hit["name"]
+                info["class_name"] = hit["class_name"]
+                info["qualified_class_name"] = hit["class_qualname"]
+                info["signature"] = hit["signature"]
 
-                    if len(response["results"]) >= max_results:
-                        response["success"] = True
-                        return json.dumps(response, ensure_ascii=False)
+            response["results"].append(info)
 
         response["success"] = len(response["results"]) > 0
         return json.dumps(response, ensure_ascii=False)
 
-    def _extract_block(self, content: str, start_index: int) -> Optional[str]:
-        brace_count = 0
-        in_block = False
-        buf = []
-
-        for ch in content[start_index:]:
-            buf.append(ch)
-            if ch == "{":
-                brace_count += 1
-                in_block = True
-            elif ch == "}":
-                brace_count -= 1
-
-            if in_block and brace_count == 0:
-                return "".join(buf).strip()
-
-        return None
-
-    def _infer_class_name(self, content: str, pos: int) -> Optional[str]:
+    def _extract_block(self, content: str, start_index: int, path: Optional[str] = None) -> Optional[str]:
         """
-        从方法位置向前推断所属类名（简单但实用）
+        截取 start_index 处开始的定义块。
+        括号匹配忽略字符串 / 字符 / 文本块 / 注释中的括号；匹配表按文件版本缓存，重复截取只需切片。
         """
-        prefix = content[:pos]
-        matches = re.findall(r"\bclass\s+(\w+)", prefix)
-        return matches[-1] if matches else None
-
+        return extract_block(content, start_index, path)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,414 @@
+from __future__ import annotations
+
+import bisect
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set
+
+from config.paths import MEMORY_DIR, resolve_path
+
+# 索引格式版本：结构变更时递增，旧索引会被整体丢弃重建
+INDEX_VERSION = 4
+
+# 默认索引存放目录（与 Python 符号索引共用）
+DEFAULT_INDEX_DIR = MEMORY_DIR / "code_index"
+
+_TYPE_DECL_RE = re.compile(r"\b(class|interface|enum|record)\s+(\w+)")
+_PACKAGE_RE = re.compile(r"^\s*package\s+([\w.]+)\s*;", re.MULTILINE)
+# @interface 是注解类型的声明，不是注解
+_ANNOTATION_NAME_RE = re.compile(r"@\s*(?!interface\b)[\w.]+\s*")
+_METHOD_NAME_RE = re.compile(r"(\w+)\s*\(")
+# 注解类型元素的默认值：String[] value() default {};
+_ANNOTATION_DEFAULT_RE = re.compile(r"\)\s*default\b")
+# 引用到的类型名：按 Java 命名习惯，首字母大写的标识符
+_TYPE_REF_RE = re.compile(r"\b[A-Z][\w$]*")
+
+# 看起来像方法调用/声明，但实际是控制语句或表达式的关键字
+_NON_METHOD_WORDS = {
+    "if", "for", "while", "switch", "catch", "synchronized", "try",
+    "do", "else", "return", "new", "throw", "assert", "finally",
+}
+
+
+def mask_java(content: str) -> str:
+    """
+    将注释、字符串字面量（含文本块）、字符字面量替换为空格（换行保留），返回等长字符串。
+    这样在掩码文本上做正则和括号匹配时，不会被字面量/注释里的 { } 干扰，偏移量仍与原文一致。
+    """
+    parts: List[str] = []
+    n = len(content)
+    i = 0
+    last = 0
+    while i < n:
+        ch = content[i]
+        if ch == "/" and content.startswith("//", i):
+            j = content.find("\n", i)
+            j = n if j == -1 else j
+        elif ch == "/" and content.startswith("/*", i):
+            j = content.find("*/", i + 2)
+            j = n if j == -1 else j + 2
+        elif ch == '"' and content.startswith('"""', i):
+            # 文本块：直到下一个未转义的 """
+            j = i + 3
+            while j < n and not content.startswith('"""', j):
+                j += 2 if content[j] == "\\" else 1
+            j = min(j + 3, n)
+        elif ch == '"' or ch == "'":
+            j = i + 1
+            while j < n and content[j] != ch and content[j] != "\n":
+                j += 2 if content[j] == "\\" else 1
+            j = min(j + 1, n)
+        else:
+            i += 1
+            continue
+        # 直接切片拼接，避免逐字符 append
+        parts.append(content[last:i])
+        parts.append(re.sub(r"[^\n]", " ", content[i:j]))
+        last = i = j
+    parts.append(content[last:])
+    return "".join(parts)
+
+
+class BraceTable:
+    """
+    整个文件的括号匹配表：open_offsets 有序，pairs 为 { 偏移 -> 对应 } 偏移。
+    基于掩码文本一次性计算，字面量/注释中的括号不参与匹配；
+    圆括号内的 {（注解数组参数、实参里的 lambda / 匿名类）不会是定义块的开始，不计入 open_offsets。
+    """
+
+    __slots__ = ("open_offsets", "pairs")
+
+    def __init__(self, masked: str):
+        pairs: Dict[int, int] = {}
+        opens: List[int] = []
+        stack: List[int] = []
+        paren = 0
+        for m in re.finditer(r"[{}()]", masked):
+            pos = m.start()
+            ch = m.group()
+            if ch == "(":
+                paren += 1
+            elif ch == ")":
+                paren = max(0, paren - 1)
+            elif ch == "{":
+                stack.append(pos)
+                if paren == 0:
+                    opens.append(pos)
+            elif stack:
+                pairs[stack.pop()] = pos
+        self.open_offsets = opens
+        self.pairs = pairs
+
+    def block_end(self, start_index: int) -> Optional[int]:
+        """返回 start_index 之后第一个 { 所对应的 } 之后的偏移；不存在或未闭合返回 None。"""
+        k = bisect.bisect_left(self.open_offsets, start_index)
+        if k >= len(self.open_offsets):
+            return None
+        close = self.pairs.get(self.open_offsets[k])
+        return None if close is None else close + 1
+
+
+# 按文件版本缓存的括号表：key 为 (path, mtime_ns, size)
+_BRACE_CACHE: "OrderedDict[tuple, BraceTable]" = OrderedDict()
+_BRACE_CACHE_MAX = 256
+_BRACE_CACHE_LOCK = threading.Lock()
+
+
+def get_brace_table(content: str, path: Optional[str] = None) -> BraceTable:
+    """
+    获取文件的括号匹配表。传入 path 时按 (path, mtime_ns, size) 缓存，文件变化后自动失效。
+    """
+    key = None
+    if path is not None:
+        try:
+            st = os.stat(path)
+            key = (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+        except OSError:
+            key = None
+    if key is not None:
+        with _BRACE_CACHE_LOCK:
+            table = _BRACE_CACHE.get(key)
+            if table is not None:
+                _BRACE_CACHE.move_to_end(key)
+                return table
+
+    table = BraceTable(mask_java(content))
+    if key is not None:
+        with _BRACE_CACHE_LOCK:
+            _BRACE_CACHE[key] = table
+            while len(_BRACE_CACHE) > _BRACE_CACHE_MAX:
+                _BRACE_CACHE.popitem(last=False)
+    return table
+
+
+def extract_block(content: str, start_index: int, path: Optional[str] = None) -> Optional[str]:
+    """从 start_index 开始截取到第一个 { 对应的 } 为止的代码块（直接切片）。"""
+    end = get_brace_table(content, path).block_end(start_index)
+    if end is None:
+        return None
+    return content[start_index:end].strip()
+
+
+def strip_annotations(header: str) -> str:
+    """去掉（掩码后的）声明头部中的注解，包括带嵌套括号的参数，如 @A(b = @C(1), d = {E.F})"""
+    parts: List[str] = []
+    last = 0
+    for m in _ANNOTATION_NAME_RE.finditer(header):
+        if m.start() < last:
+            continue
+        end = m.end()
+        if header.startswith("(", end):
+            depth = 0
+            for j in range(end, len(header)):
+                if header[j] == "(":
+                    depth += 1
+                elif header[j] == ")":
+                    depth -= 1
+                    if depth == 0:
+                        end = j + 1
+                        break
+            else:
+                end = len(header)
+        parts.append(header[last:m.start()])
+        parts.append(" ")
+        last = end
+    parts.append(header[last:])
+    return "".join(parts)
+
+
+def extract_outline(content: str) -> Dict[str, Any]:
+    """
+    一遍扫描提取 Java 文件大纲：
+    - package
+    - types：class / interface / enum / record（含嵌套，qualname 形如 Outer.Inner）
+    - methods：方法与构造器（含重载），记录所属类、签名
+    - refs：引用到的类型名（首字母大写的标识符，含 import），用于类依赖分析
+    所有 start / end 都是原文中的字符偏移，content[start:end] 即完整定义。
+    """
+    masked = mask_java(content)
+    pkg = _PACKAGE_RE.search(masked)
+
+    types: List[Dict[str, Any]] = []
+    methods: List[Dict[str, Any]] = []
+    # 栈元素：(kind, record)；kind 为 type / method / block / constant（枚举常量体，record 为所属枚举）
+    stack: List[tuple] = []
+    # 仍处于常量列表部分（第一个顶层 ; 之前）的枚举体所在的栈下标
+    enum_constants: Set[int] = set()
+    stmt_start = 0
+    # 圆括号深度：括号内的 { } ;（注解数组参数、实参里的 lambda、for 头部）不参与声明划分
+    paren = 0
+
+    for m in re.finditer(r"[{};()]", masked):
+        pos = m.start()
+        ch = m.group()
+        if ch == "(":
+            paren += 1
+            continue
+        if ch == ")":
+            paren = max(0, paren - 1)
+            continue
+        if paren:
+            continue
+        if ch == ";":
+            enum_constants.discard(len(stack) - 1)
+            stmt_start = pos + 1
+            continue
+        if ch == "}":
+            if stack:
+                kind, rec = stack.pop()
+                enum_constants.discard(len(stack))
+                if rec is not None and kind != "constant":
+                    rec["end"] = pos + 1
+            stmt_start = pos + 1
+            continue
+
+        # ch == "{"：根据从上一个语句边界到这里的头部判断声明类型
+        raw_header = masked[stmt_start:pos]
+        lead = len(raw_header) - len(raw_header.lstrip())
+        start = stmt_start + lead
+        header = strip_annotations(raw_header)
+        parent = stack[-1] if stack else None
+        in_type_body = parent is None or parent[0] in ("type", "constant")
+
+        entry = ("block", None)
+        type_match = _TYPE_DECL_RE.search(header)
+        if parent is not None and len(stack) - 1 in enum_constants:
+            # 枚举常量体 A("x") { ... }：其中的方法归属于枚举本身
+            entry = ("constant", parent[1])
+        elif in_type_body and type_match and "(" not in header.split(type_match.group(0), 1)[0]:
+            outer = [r["name"] for k, r in stack if k == "type"]
+            rec = {
+                "name": type_match.group(2),
+                "qualname": ".".join(outer + [type_match.group(2)]),
+                "kind": type_match.group(1),
+                "start": start,
+                "end": None,
+            }
+            types.append(rec)
+            entry = ("type", rec)
+        elif (parent is not None and parent[0] in ("type", "constant") and "=" not in header
+              and "->" not in header and not _ANNOTATION_DEFAULT_RE.search(header)):
+            name_match = _METHOD_NAME_RE.search(header)
+            if name_match and name_match.group(1) not in _NON_METHOD_WORDS:
+                owner = parent[1]
+                rec = {
+                    "name": name_match.group(1),
+                    "class_name": owner["name"],
+                    "class_qualname": owner["qualname"],
+                    "signature": " ".join(content[start:pos].split()),
+                    "start": start,
+                    "end": None,
+                }
+                methods.append(rec)
+                entry = ("method", rec)
+
+        stack.append(entry)
+        if entry[0] == "type" and entry[1]["kind"] == "enum":
+            enum_constants.add(len(stack) - 1)
+        stmt_start = pos + 1
+
+    return {
+        "package": pkg.group(1) if pkg else None,
+        "types": [t for t in types if t["end"] is not None],
+        "methods": [mt for mt in methods if mt["end"] is not None],
+        "refs": sorted(set(_TYPE_REF_RE.findall(masked))),
+    }
+
+
+class JavaOutlineIndex:
+    """
+    针对单个 Java 项目根目录的持久化大纲索引：
+    - 每个 .java 文件记录 mtime / size / sha1 / 大纲
+    - refresh() 只重新解析 mtime/size 变化的文件
+    - lookup() 在索引上查找 class / method，命中后才读取文件切片
+    """
+
+    def __init__(self, root: str | Path, index_dir: str | Path = DEFAULT_INDEX_DIR):
+        self.root = Path(root).expanduser().resolve()
+        root_key = hashlib.sha1(str(self.root).encode("utf-8")).hexdigest()[:16]
+        self.index_path = resolve_path(index_dir) / f"java_{root_key}.json"
+        self._files: Dict[str, Dict[str, Any]] = {}
+        self._dirty = False
+        self._lock = threading.RLock()
+        self._load()
+
+    # ---------- 持久化 ----------
+
+    def _load(self) -> None:
+        if not self.index_path.exists():
+            return
+        try:
+            raw = json.loads(self.index_path.read_text(encoding="utf-8"))
+        except (OSError, json.JSONDecodeError):
+            return
+        if raw.get("version") != INDEX_VERSION or raw.get("root") != str(self.root):
+            return
+        self._files = raw.get("files", {})
+
+    def save(self) -> None:
+        with self._lock:
+            if not self._dirty:
+                return
+            self.index_path.parent.mkdir(parents=True, exist_ok=True)
+            payload = {"version": INDEX_VERSION, "root": str(self.root), "files": self._files}
+            tmp = self.index_path.with_suffix(f".{os.getpid()}.tmp")
+            tmp.write_text(json.dumps(payload, ensure_ascii=False), encoding="utf-8")
+            os.replace(tmp, self.index_path)
+            self._dirty = False
+
+    # ---------- 增量更新 ----------
+
+    def refresh(self) -> List[str]:
+        """扫描所有 .java 文件并增量更新索引，返回文件相对路径列表（按遍历顺序）。"""
+        with self._lock:
+            seen: List[str] = []
+            for dirpath, _, files in os.walk(self.root):
+                for file in files:
+                    if not file.endswith(".java"):
+                        continue
+                    path = Path(dirpath) / file
+                    try:
+                        st = path.stat()
+                    except OSError:
+                        continue
+                    rel = path.relative_to(self.root).as_posix()
+                    seen.append(rel)
+                    entry = self._files.get(rel)
+                    if entry and entry["mtime_ns"] == st.st_mtime_ns and entry["size"] == st.st_size:
+                        continue
+                    try:
+                        data = path.read_bytes()
+                    except OSError:
+                        continue
+                    self._files[rel] = {
+                        "mtime_ns": st.st_mtime_ns,
+                        "size": st.st_size,
+                        "sha1": hashlib.sha1(data).hexdigest(),
+                        # 与文本模式读取一致（统一换行符），保证字符偏移与 code_search 读取的内容对应
+                        "outline": extract_outline(
+                            data.decode("utf-8", errors="ignore").replace("\r\n", "\n").replace("\r", "\n")
+                        ),
+                    }
+                    self._dirty = True
+
+            seen_set = set(seen)
+            for rel in list(self._files):
+                if rel not in seen_set:
+                    del self._files[rel]
+                    self._dirty = True
+            return seen
+
+    # ---------- 查询 ----------
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """返回文件 -> {package, sha1, types(顶层类型名), refs} 的快照，供类依赖分析使用"""
+        with self._lock:
+            return {
+                rel: {
+                    "package": entry["outline"]["package"],
+                    "sha1": entry["sha1"],
+                    "types": [t["name"] for t in entry["outline"]["types"] if "." not in t["qualname"]],
+                    "refs": entry["outline"]["refs"],
+                }
+                for rel, entry in self._files.items()
+            }
+
+    def lookup(self, search_type: str, query: str, *, ignore_case: bool = True,
+               max_results: int = 5) -> List[Dict[str, Any]]:
+        """
+        查找 class（含 interface / enum / record）或 method 定义，返回带 rel_file 与 package 的索引记录。
+        """
+        q = query.lower() if ignore_case else query
+        key = "types" if search_type == "class" else "methods"
+        out: List[Dict[str, Any]] = []
+        with self._lock:
+            for rel, entry in self._files.items():
+                outline = entry["outline"]
+                for rec in outline[key]:
+                    name = rec["name"].lower() if ignore_case else rec["name"]
+                    if name != q:
+                        continue
+                    out.append({**rec, "rel_file": rel, "package": outline["package"]})
+                    if len(out) >= max_results:
+                        return out
+        return out
+
+
+# 进程内缓存：同一个项目根目录只加载一次索引
+_INDEXES: Dict[str, JavaOutlineIndex] = {}
+_INDEXES_LOCK = threading.Lock()
+
+
+def get_java_index(root: str | Path, index_dir: str | Path = DEFAULT_INDEX_DIR) -> JavaOutlineIndex:
+    key = f"{Path(root).expanduser().resolve()}|{resolve_path(index_dir)}"
+    with _INDEXES_LOCK:
+        idx = _INDEXES.get(key)
+        if idx is None:
+            idx = JavaOutlineIndex(root, index_dir=index_dir)
+            _INDEXES[key] = idx
+        return idx
@@ -0,0 +1,594 @@
+from __future__ import annotations
+
+import glob
+import hashlib
+import json
+import os
+import re
+import shutil
+import struct
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from config.paths import MEMORY_DIR, resolve_path
+from tools.cancellation import CancelToken
+from tools.output_capture import run_captured
+from tools.sandbox import JAVA_DUMP_SIGNAL, java_test_limits, sandboxed_run
+from tools.test_reports import parse_junit_xml
+from tools.test_shards import DurationStore, plan_shards
+
+# 按 pom.xml 哈希缓存的测试 classpath
+DEFAULT_CACHE_DIR = MEMORY_DIR / "maven_cache"
+
+# 按测试类记录的历史耗时，用于分片
+DEFAULT_JUNIT_DURATIONS_PATH = MEMORY_DIR / "junit_durations.json"
+
+# JUnit Platform 控制台启动器：优先使用环境变量，否则在本地仓库中查找
+LAUNCHER_ENV = "JUNIT_CONSOLE_LAUNCHER"
+_LAUNCHER_GLOB = os.path.join(
+    os.path.expanduser("~"), ".m2", "repository", "org", "junit", "platform",
+    "junit-platform-console-standalone", "*", "junit-platform-console-standalone-*.jar",
+)
+
+def junit_timeout_config(per_test_timeout_sec: Optional[int]) -> Dict[str, str]:
+    """
+    JUnit Jupiter 逐用例超时配置：超时用例在独立线程中被放弃并记为失败（同时打印线程转储），
+    其余用例继续运行。旧版本 Jupiter 会忽略不认识的参数。
+    """
+    if not per_test_timeout_sec:
+        return {}
+    return {
+        "junit.jupiter.execution.timeout.default": f"{int(per_test_timeout_sec)}s",
+        "junit.jupiter.execution.timeout.thread.mode.default": "SEPARATE_THREAD",
+        "junit.jupiter.execution.timeout.thread.dump.enabled": "true",
+    }
+
+
+# 与 Surefire 默认 includes 一致：Test*、*Test、*Tests、*TestCase
+_DEFAULT_INCLUDE = r"^(.*\.)?(Test\w*|\w*Tests?|\w*TestCase)$"
+
+
+class FastPathUnavailable(RuntimeError):
+    """快速路径不适用（多模块、缓存无法解析、缺少启动器等），调用方应退回到 mvn test"""
+
+
+@dataclass
+class FastRunResult:
+    command: List[str]
+    exit_code: Optional[int]
+    stdout: str
+    stderr: str
+    # compile：javac 编译失败；test：测试已运行
+    phase: str = "test"
+    cases: List[Dict[str, Any]] = field(default_factory=list)
+    timed_out: bool = False
+    duration: float = 0.0
+    # 输出超出内存缓冲时的完整日志
+    log_file: Optional[str] = None
+
+
+def _mvn_cmd() -> str:
+    return "mvn.cmd" if os.name == "nt" else "mvn"
+
+
+def _pom_hash(pom_path: str) -> str:
+    with open(pom_path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+class ClasspathCache:
+    """
+    测试 classpath 缓存：key 为 pom.xml 内容哈希，首次通过离线的
+    `mvn dependency:build-classpath` 从本地仓库解析；pom 变化或依赖 jar 丢失时失效。
+    解析按 pom 加锁：同一个 pom 只解析一次，其他项目不必等待。
+    """
+
+    def __init__(self, cache_dir: str | Path = DEFAULT_CACHE_DIR):
+        self.cache_dir = resolve_path(cache_dir)
+        # 只保护 _mem 与 _locks 两个字典，不在持有时执行 mvn
+        self._lock = threading.Lock()
+        self._locks: Dict[str, threading.Lock] = {}
+        self._mem: Dict[str, List[str]] = {}
+
+    def _path(self, project_path: str, pom_hash: str) -> Path:
+        proj = hashlib.sha1(os.path.abspath(project_path).encode("utf-8")).hexdigest()[:16]
+        return self.cache_dir / f"cp_{proj}_{pom_hash[:16]}.json"
+
+    @staticmethod
+    def _valid(entries: List[str]) -> bool:
+        return all(os.path.exists(p) for p in entries)
+
+    def get(self, project_path: str) -> List[str]:
+        pom_hash = _pom_hash(os.path.join(project_path, "pom.xml"))
+        path = self._path(project_path, pom_hash)
+        key = str(path)
+        with self._lock:
+            entries = self._mem.get(key)
+            if entries is not None and self._valid(entries):
+                return entries
+            pom_lock = self._locks.setdefault(key, threading.Lock())
+        with pom_lock:
+            with self._lock:
+                entries = self._mem.get(key)
+            if entries is None:
+                try:
+                    entries = json.loads(path.read_text(encoding="utf-8"))["classpath"]
+                except (OSError, ValueError, KeyError):
+                    entries = None
+            if entries is None or not self._valid(entries):
+                entries = self._resolve(project_path)
+                path.parent.mkdir(parents=True, exist_ok=True)
+                tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+                tmp.write_text(json.dumps({"pom_sha1": pom_hash, "classpath": entries}), encoding="utf-8")
+                os.replace(tmp, path)
+            with self._lock:
+                self._mem[key] = entries
+            return entries
+
+    @staticmethod
+    def _resolve(project_path: str) -> List[str]:
+        fd, out_file = tempfile.mkstemp(prefix="mate_cp_", suffix=".txt")
+        os.close(fd)
+        cmd = [_mvn_cmd(), "-o", "-q", "dependency:build-classpath",
+               "-Dmdep.includeScope=test", f"-Dmdep.outputFile={out_file}"]
+        try:
+            proc = subprocess.run(cmd, cwd=project_path, capture_output=True, text=True,
+                                  encoding="utf-8", errors="replace", timeout=300)
+            if proc.returncode != 0:
+                raise FastPathUnavailable(f"offline classpath resolution failed (exit {proc.returncode})")
+            with open(out_file, "r", encoding="utf-8") as f:
+                raw = f.read().strip()
+        except (OSError, subprocess.TimeoutExpired) as e:
+            raise FastPathUnavailable(f"offline classpath resolution failed: {e}") from e
+        finally:
+            try:
+                os.unlink(out_file)
+            except OSError:
+                pass
+        return [p for p in raw.split(os.pathsep) if p]
+
+
+_CACHE: Optional[ClasspathCache] = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_classpath_cache() -> ClasspathCache:
+    global _CACHE
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            _CACHE = ClasspathCache()
+        return _CACHE
+
+
+def find_console_launcher() -> Optional[str]:
+    path = os.environ.get(LAUNCHER_ENV)
+    if path and os.path.isfile(path):
+        return path
+    jars = [j for j in glob.glob(_LAUNCHER_GLOB) if not j.endswith(("-sources.jar", "-javadoc.jar"))]
+    if not jars:
+        return None
+
+    def version_key(jar: str) -> Tuple:
+        ver = os.path.basename(os.path.dirname(jar))
+        return tuple(int(x) if x.isdigit() else 0 for x in re.split(r"[.-]", ver))
+
+    return max(jars, key=version_key)
+
+
+def _java_sources(src_dir: str) -> Iterator[str]:
+    for root, _, files in os.walk(src_dir):
+        for name in files:
+            if name.endswith(".java"):
+                yield os.path.join(root, name)
+
+
+def _stale_sources(src_dir: str, out_dir: str) -> List[str]:
+    """源文件比对应 .class 新（或 .class 不存在）的 .java 文件"""
+    stale = []
+    for src in _java_sources(src_dir):
+        rel = os.path.relpath(src, src_dir)[:-len(".java")] + ".class"
+        try:
+            if os.path.getmtime(os.path.join(out_dir, rel)) >= os.path.getmtime(src):
+                continue
+        except OSError:
+            pass
+        stale.append(src)
+    return sorted(stale)
+
+
+# 常量池各类型条目的长度（不含 CONSTANT_Utf8）；Long / Double 占两个槽位
+_CP_SIZES = {3: 5, 4: 5, 5: 9, 6: 9, 7: 3, 8: 3, 9: 5, 10: 5, 11: 5, 12: 5,
+             15: 4, 16: 3, 17: 5, 18: 5, 19: 3, 20: 3}
+
+
+def class_source_file(path: str) -> Optional[str]:
+    """读取 .class 的 SourceFile 属性（javac -g 与 Maven 默认都会写入）；读不出时返回 None"""
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+    if data[:4] != b"\xca\xfe\xba\xbe":
+        return None
+    try:
+        count = struct.unpack_from(">H", data, 8)[0]
+        pos, i = 10, 1
+        utf8: Dict[int, bytes] = {}
+        while i < count:
+            tag = data[pos]
+            if tag == 1:
+                length = struct.unpack_from(">H", data, pos + 1)[0]
+                utf8[i] = data[pos + 3:pos + 3 + length]
+                pos += 3 + length
+            elif tag in _CP_SIZES:
+                pos += _CP_SIZES[tag]
+                i += 1 if tag in (5, 6) else 0
+            else:
+                return None
+            i += 1
+        # access_flags、this_class、super_class，然后是接口表
+        pos += 6
+        pos += 2 + 2 * struct.unpack_from(">H", data, pos)[0]
+        # 字段表与方法表：每项 6 字节头部 + 属性表
+        for _ in range(2):
+            members = struct.unpack_from(">H", data, pos)[0]
+            pos += 2
+            for _ in range(members):
+                attrs = struct.unpack_from(">H", data, pos + 6)[0]
+                pos += 8
+                for _ in range(attrs):
+                    pos += 6 + struct.unpack_from(">I", data, pos + 2)[0]
+        attrs = struct.unpack_from(">H", data, pos)[0]
+        pos += 2
+        for _ in range(attrs):
+            name_index, length = struct.unpack_from(">HI", data, pos)
+            if utf8.get(name_index) == b"SourceFile":
+                value = utf8.get(struct.unpack_from(">H", data, pos + 6)[0])
+                return value.decode("utf-8", errors="replace") if value is not None else None
+            pos += 6 + length
+    except (struct.error, IndexError):
+        return None
+    return None
+
+
+def _remove_orphans(out_dir: str, src_roots: List[str]) -> List[str]:
+    """
+    删除源文件已不存在（被删除或改名）的 .class，返回删除的文件。
+    外部类名对应的 .java 存在时保留；否则按 SourceFile 属性判断（同一文件中的非 public 顶层类）。
+    SourceFile 读不出或不是 .java（Kotlin / Groovy 等）时保留。
+    """
+    removed = []
+    for root, _, files in os.walk(out_dir):
+        rel_dir = os.path.relpath(root, out_dir)
+
+        def has_source(name: str) -> bool:
+            return any(os.path.isfile(os.path.join(src, rel_dir, name)) for src in src_roots)
+
+        for name in files:
+            if not name.endswith(".class"):
+                continue
+            if has_source(name[:-len(".class")].split("$", 1)[0] + ".java"):
+                continue
+            path = os.path.join(root, name)
+            source = class_source_file(path)
+            if source is None or not source.endswith(".java") or has_source(source):
+                continue
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+            removed.append(path)
+    return removed
+
+
+def _is_test_class(java_file: str) -> bool:
+    return re.match(_DEFAULT_INCLUDE, os.path.basename(java_file)[:-len(".java")]) is not None
+
+
+def _sync_resources(res_dir: str, out_dir: str) -> None:
+    """只复制比输出目录新的资源文件（不做 Maven 过滤替换）"""
+    for root, _, files in os.walk(res_dir):
+        for name in files:
+            src = os.path.join(root, name)
+            dst = os.path.join(out_dir, os.path.relpath(src, res_dir))
+            try:
+                if os.path.getmtime(dst) >= os.path.getmtime(src):
+                    continue
+            except OSError:
+                pass
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            shutil.copy2(src, dst)
+
+
+def _javac(sources: List[str], out_dir: str, classpath: List[str], source_path: str,
+           timeout_sec: int, cancel: Optional[CancelToken] = None) -> Tuple[int, str]:
+    if not sources:
+        return 0, ""
+    os.makedirs(out_dir, exist_ok=True)
+    # 文件列表较长时通过 @argfile 传入，避免命令行超长
+    fd, argfile = tempfile.mkstemp(prefix="mate_javac_", suffix=".txt")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write("\n".join(f'"{s}"' if " " in s else s for s in sources))
+    cmd = ["javac", "-encoding", "UTF-8", "-g", "-parameters", "-nowarn",
+           "-d", out_dir, "-cp", os.pathsep.join(classpath), "-sourcepath", source_path, f"@{argfile}"]
+    try:
+        captured = run_captured(cmd, timeout=timeout_sec, log_prefix="javac", cancel=cancel)
+    finally:
+        os.unlink(argfile)
+    if captured.timed_out:
+        return 1, f"javac timed out after {timeout_sec}s"
+    output = captured.stdout + captured.stderr
+    if captured.log_file:
+        output += f"\n(full javac output: {captured.log_file})"
+    return captured.returncode, output
+
+
+def _class_name(java_file: str, src_dir: str) -> str:
+    rel = os.path.relpath(java_file, src_dir)[:-len(".java")]
+    return rel.replace(os.sep, ".")
+
+
+def _class_index(test_src: str) -> Dict[str, List[str]]:
+    """简单类名 -> 全限定名列表（按 Maven 目录约定由路径推出包名）"""
+    by_simple: Dict[str, List[str]] = {}
+    for root, _, files in os.walk(test_src):
+        for name in sorted(files):
+            if name.endswith(".java"):
+                fqn = _class_name(os.path.join(root, name), test_src)
+                by_simple.setdefault(name[:-len(".java")], []).append(fqn)
+    return by_simple
+
+
+def _wildcard_regex(cls: str) -> str:
+    regex = re.escape(cls.replace("/", ".")).replace(r"\*\*\.", r"(.*\.)?").replace(r"\*\*", ".*")
+    regex = regex.replace(r"\*", r"[\w$]*").replace(r"\?", r"[\w$]")
+    return rf"^(.*\.)?{regex}$"
+
+
+def _split_selection(test_selection: str):
+    """逐项拆分 -Dtest：返回 (类名或通配符, 方法列表)；不支持的写法抛出 FastPathUnavailable"""
+    for item in (s.strip() for s in test_selection.split(",")):
+        if not item:
+            continue
+        if item.startswith("!"):
+            raise FastPathUnavailable("exclusion patterns are only supported by surefire")
+        cls, _, methods = item.partition("#")
+        method_list = [m for m in methods.split("+") if m] if methods else []
+        if any(ch in m for m in method_list for ch in "*?"):
+            raise FastPathUnavailable("method wildcards are only supported by surefire")
+        if method_list and any(ch in cls for ch in "*?"):
+            raise FastPathUnavailable("method filters with class wildcards are only supported by surefire")
+        # 不含通配符的路径写法（com/x/MyTest）等价于全限定名
+        if not any(ch in cls for ch in "*?"):
+            cls = cls.replace("/", ".")
+        yield cls, method_list
+
+
+def _selectors(test_selection: Optional[str], test_src: str, test_out: str) -> List[str]:
+    """
+    将 Maven -Dtest 语法转换为控制台启动器的选择参数：
+    - Class / com.x.Class / Class#m1+m2 → --select-class / --select-method
+    - 带通配符的写法 → 扫描 test-classes 并按类名正则过滤
+    简单类名找不到对应源文件时抛出 FastPathUnavailable。
+    """
+    if not test_selection:
+        return ["--scan-class-path", test_out, "--include-classname", _DEFAULT_INCLUDE]
+
+    by_simple = _class_index(test_src)
+    args: List[str] = []
+    patterns: List[str] = []
+    for cls, methods in _split_selection(test_selection):
+        if any(ch in cls for ch in "*?"):
+            patterns.append(_wildcard_regex(cls))
+            continue
+        if "." in cls:
+            fqns = [cls]
+        else:
+            fqns = by_simple.get(cls, [])
+            if not fqns:
+                raise FastPathUnavailable(f"test class not found in sources: {cls}")
+        for fqn in fqns:
+            args += _unit_selectors(fqn, methods)
+    if patterns:
+        args += ["--scan-class-path", test_out, "--include-classname", "|".join(patterns)]
+    return args
+
+
+def _unit_selectors(fqn: str, methods: List[str]) -> List[str]:
+    if not methods:
+        return ["--select-class", fqn]
+    return [a for m in methods for a in ("--select-method", f"{fqn}#{m}")]
+
+
+def resolve_test_classes(test_selection: Optional[str], test_src: str) -> Dict[str, List[str]]:
+    """
+    将 -Dtest 展开为具体的测试类：全限定名 -> 方法列表（空列表表示整个类）。
+    通配符与默认 includes 都按源码中的类匹配，用于按类分片。
+    """
+    by_simple = _class_index(test_src)
+    all_fqns = [fqn for fqns in by_simple.values() for fqn in fqns]
+    units: Dict[str, List[str]] = {}
+    if not test_selection:
+        for fqn in sorted(all_fqns):
+            if re.match(_DEFAULT_INCLUDE, fqn):
+                units[fqn] = []
+        return units
+
+    for cls, methods in _split_selection(test_selection):
+        if any(ch in cls for ch in "*?"):
+            regex = re.compile(_wildcard_regex(cls))
+            fqns = sorted(f for f in all_fqns if regex.match(f))
+        elif "." in cls:
+            fqns = [cls]
+        else:
+            fqns = by_simple.get(cls, [])
+            if not fqns:
+                raise FastPathUnavailable(f"test class not found in sources: {cls}")
+        for fqn in fqns:
+            if fqn in units and (not units[fqn] or not methods):
+                units[fqn] = []
+            else:
+                units.setdefault(fqn, []).extend(methods)
+    return units
+
+
+@dataclass
+class FastBuild:
+    """增量编译完成后的运行环境"""
+    project_path: str
+    launcher: str
+    classpath: List[str]
+    test_src: str
+    test_out: str
+
+
+def prepare_fast(project_path: str, *, timeout_sec: int = 600, cache: Optional[ClasspathCache] = None,
+                 cancel: Optional[CancelToken] = None) -> Tuple[Optional[FastBuild], Optional[FastRunResult]]:
+    """
+    检查快速路径的前提并增量编译。
+    返回 (FastBuild, None)；javac 失败时返回 (None, 编译失败结果)；不适用时抛出 FastPathUnavailable。
+    """
+    pom = os.path.join(project_path, "pom.xml")
+    with open(pom, "r", encoding="utf-8", errors="ignore") as f:
+        if "<modules>" in f.read():
+            raise FastPathUnavailable("multi-module projects are run through maven")
+
+    main_src = os.path.join(project_path, "src", "main", "java")
+    test_src = os.path.join(project_path, "src", "test", "java")
+    main_out = os.path.join(project_path, "target", "classes")
+    test_out = os.path.join(project_path, "target", "test-classes")
+    # 从未完整构建过的项目先走一次 mvn（生成资源、注解处理结果等）
+    if not os.path.isdir(main_out) or not os.path.isdir(test_src):
+        raise FastPathUnavailable("project has not been built by maven yet")
+
+    launcher = find_console_launcher()
+    if launcher is None:
+        raise FastPathUnavailable("junit-platform-console-standalone not found")
+    if shutil.which("java") is None or shutil.which("javac") is None:
+        raise FastPathUnavailable("java/javac not found in PATH")
+
+    deps = (cache or get_classpath_cache()).get(project_path)
+
+    # 主代码的 .class 也可能来自 Maven 生成的源码（注解处理器等），判断孤儿时一并作为源码目录
+    generated = sorted(glob.glob(os.path.join(project_path, "target", "generated-sources", "*")))
+    compile_log = []
+    main_changed = False
+    for src, out, cp, roots in (
+        (main_src, main_out, [main_out, *deps], [main_src, *generated]),
+        (test_src, test_out, [test_out, main_out, *deps], [test_src]),
+    ):
+        if not os.path.isdir(src):
+            continue
+        is_test = src == test_src
+        # 删除的 / 改名的源文件留下的 .class 不会再被覆盖，测试类会被 --scan-class-path 照常运行
+        orphans = _remove_orphans(out, roots)
+        stale = _stale_sources(src, out)
+        # 只编译变化的文件时，依赖它们的类不会重新编译，签名变化要到运行时才以 NoSuchMethodError 出现：
+        # - 主代码有变化或有文件被删除：主代码与测试全部重新编译
+        # - 测试目录中变化的不只是测试类（基类、工具类）：测试全部重新编译
+        if orphans or (is_test and main_changed) or (not is_test and stale) \
+                or (is_test and not all(_is_test_class(f) for f in stale)):
+            stale = sorted(_java_sources(src))
+        if not is_test:
+            main_changed = bool(stale)
+        code, output = _javac(stale, out, cp, src, timeout_sec, cancel)
+        compile_log.append(output)
+        if code != 0:
+            return None, FastRunResult(["javac", *stale], code, "".join(compile_log), "", phase="compile")
+        res_dir = os.path.join(os.path.dirname(src), "resources")
+        if os.path.isdir(res_dir):
+            _sync_resources(res_dir, out)
+
+    return FastBuild(project_path, launcher, [test_out, main_out, *deps], test_src, test_out), None
+
+
+def launch(build: FastBuild, selectors: List[str], *, timeout_sec: int = 600,
+           per_test_timeout_sec: Optional[int] = None, cancel: Optional[CancelToken] = None) -> FastRunResult:
+    """用控制台启动器在受控的独立 JVM 中运行选中的测试（见 tools/sandbox.py），并读取其 XML 报告"""
+    reports = tempfile.mkdtemp(prefix="mate_junit_reports_")
+    cmd = [
+        "java", "-jar", build.launcher,
+        "--disable-banner", "--disable-ansi-colors", "--details=tree",
+        "--class-path", os.pathsep.join(build.classpath),
+        "--reports-dir", reports,
+        *(f"--config={k}={v}" for k, v in junit_timeout_config(per_test_timeout_sec).items()),
+        *selectors,
+    ]
+    start = time.monotonic()
+    try:
+        captured = sandboxed_run(cmd, cwd=build.project_path, timeout=timeout_sec,
+                                 limits=java_test_limits(timeout_sec), dump_signal=JAVA_DUMP_SIGNAL,
+                                 log_prefix="junit_launcher", cancel=cancel)
+        result = FastRunResult(cmd, captured.returncode, captured.stdout, captured.stderr,
+                               timed_out=captured.timed_out, log_file=captured.log_file)
+        result.duration = time.monotonic() - start
+        for xml in sorted(glob.glob(os.path.join(reports, "*.xml"))):
+            result.cases.extend(parse_junit_xml(xml))
+    finally:
+        shutil.rmtree(reports, ignore_errors=True)
+    return result
+
+
+def run_fast(project_path: str, test_selection: Optional[str] = None, *, timeout_sec: int = 600,
+             per_test_timeout_sec: Optional[int] = None, cache: Optional[ClasspathCache] = None,
+             cancel: Optional[CancelToken] = None) -> FastRunResult:
+    """
+    跳过 Maven 生命周期运行测试：
+    1. 从缓存取测试 classpath（pom 变化时离线重新解析）
+    2. javac 增量编译比 .class 新的测试类；主代码或测试辅助类变化时整体重新编译，删除源文件已不存在的 .class；
+       并同步变化的资源文件
+    3. 通过 JUnit Platform 控制台启动器运行选中的测试类，读取其 XML 报告
+    不满足条件时抛出 FastPathUnavailable；cancel 被取消时结束 javac / JVM 并抛出 RunCancelled。
+    """
+    test_src = os.path.join(project_path, "src", "test", "java")
+    test_out = os.path.join(project_path, "target", "test-classes")
+    # 先解析选择，避免不支持的写法白白编译一次
+    selectors = _selectors(test_selection, test_src, test_out)
+    build, failed = prepare_fast(project_path, timeout_sec=timeout_sec, cache=cache, cancel=cancel)
+    if failed is not None:
+        return failed
+    return launch(build, selectors, timeout_sec=timeout_sec, per_test_timeout_sec=per_test_timeout_sec,
+                  cancel=cancel)
+
+
+def run_fast_sharded(project_path: str, test_selection: Optional[str], shards: int, *,
+                     timeout_sec: int = 600, per_test_timeout_sec: Optional[int] = None,
+                     cache: Optional[ClasspathCache] = None,
+                     durations: Optional[DurationStore] = None,
+                     cancel: Optional[CancelToken] = None) -> Dict[str, Any]:
+    """
+    编译一次后，将选中的测试类按历史耗时分成若干片，每片一个 JVM 并发运行。
+    返回 {"compile": FastRunResult|None, "shards": [FastRunResult...], "plan": [[类名...]...]}。
+    """
+    test_src = os.path.join(project_path, "src", "test", "java")
+    units = resolve_test_classes(test_selection, test_src)
+    if not units:
+        raise FastPathUnavailable("no test classes matched the selection")
+    build, failed = prepare_fast(project_path, timeout_sec=timeout_sec, cache=cache, cancel=cancel)
+    if failed is not None:
+        return {"compile": failed, "shards": [], "plan": []}
+
+    durations = durations or DurationStore(DEFAULT_JUNIT_DURATIONS_PATH)
+    plan = plan_shards(list(units), shards, durations)
+
+    def run_one(classes: List[str]) -> FastRunResult:
+        selectors = [a for fqn in classes for a in _unit_selectors(fqn, units[fqn])]
+        return launch(build, selectors, timeout_sec=timeout_sec, per_test_timeout_sec=per_test_timeout_sec,
+                      cancel=cancel)
+
+    with ThreadPoolExecutor(max_workers=len(plan)) as pool:
+        results = list(pool.map(run_one, plan))
+
+    # 按类累计耗时，供下次分片使用
+    per_class: Dict[str, float] = {}
+    for r in results:
+        for case in r.cases:
+            per_class[case["classname"]] = per_class.get(case["classname"], 0.0) + case["time"]
+    durations.update({k: round(v, 3) for k, v in per_class.items() if k in units and v > 0})
+    return {"compile": None, "shards": results, "plan": plan}
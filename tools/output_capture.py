@@ -0,0 +1,350 @@
+from __future__ import annotations
+
+import asyncio
+import glob
+import os
+import shutil
+import signal
+import subprocess
+import tempfile
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from tools.cancellation import CancelToken, RunCancelled, kill_on_cancel
+
+# 内存中每个输出流最多保留的开头 / 结尾字节数；超出部分只写入磁盘日志
+DEFAULT_HEAD_BYTES = 16 * 1024
+DEFAULT_TAIL_BYTES = 64 * 1024
+
+# 单个流写入磁盘的上限；再多的输出直接丢弃并在日志中注明
+SPILL_MAX_BYTES = 64 * 1024 * 1024
+
+# 每个前缀保留的完整输出日志数，更早的自动删除
+SPILL_KEEP = 20
+
+_READ_CHUNK = 64 * 1024
+
+
+class BoundedCapture:
+    """
+    单个输出流的有界捕获：内存中只保留开头 head_bytes 与结尾 tail_bytes。
+    总量超过两者之和时，完整内容（从头开始）转存到临时文件，之后边读边写。
+    """
+
+    def __init__(self, head_bytes: int = DEFAULT_HEAD_BYTES, tail_bytes: int = DEFAULT_TAIL_BYTES):
+        self.head_bytes = head_bytes
+        self.tail_bytes = tail_bytes
+        self.total_bytes = 0
+        self._head = bytearray()
+        self._tail = bytearray()
+        self._spill = None
+        self.spill_path: Optional[str] = None
+        self._spilled_bytes = 0
+
+    @property
+    def truncated(self) -> bool:
+        return self.total_bytes > self.head_bytes + self.tail_bytes
+
+    def write(self, chunk: bytes) -> None:
+        if not chunk:
+            return
+        if self._spill is None and self.total_bytes + len(chunk) > self.head_bytes + self.tail_bytes:
+            # 丢弃中间部分之前先把已有内容落盘，保证日志完整
+            fd, self.spill_path = tempfile.mkstemp(prefix="mate_capture_", suffix=".log")
+            self._spill = os.fdopen(fd, "wb")
+            self._spill_write(bytes(self._head) + bytes(self._tail))
+        if self._spill is not None:
+            self._spill_write(chunk)
+        self.total_bytes += len(chunk)
+
+        room = self.head_bytes - len(self._head)
+        if room > 0:
+            self._head += chunk[:room]
+            chunk = chunk[room:]
+        if chunk:
+            self._tail += chunk
+            if len(self._tail) > self.tail_bytes:
+                del self._tail[:len(self._tail) - self.tail_bytes]
+
+    def _spill_write(self, data: bytes) -> None:
+        if self._spilled_bytes >= SPILL_MAX_BYTES:
+            return
+        data = data[:SPILL_MAX_BYTES - self._spilled_bytes]
+        self._spill.write(data)
+        self._spilled_bytes += len(data)
+        if self._spilled_bytes >= SPILL_MAX_BYTES:
+            self._spill.write(f"\n... (output beyond {SPILL_MAX_BYTES} bytes discarded) ...\n".encode("utf-8"))
+
+    def close(self) -> None:
+        if self._spill is not None:
+            self._spill.close()
+            self._spill = None
+
+    def text(self) -> str:
+        """有界文本：未截断时为完整内容，否则为 开头 + 省略标记 + 结尾"""
+        head = bytes(self._head).decode("utf-8", "replace")
+        if not self.truncated:
+            return head + bytes(self._tail).decode("utf-8", "replace")
+        omitted = self.total_bytes - len(self._head) - len(self._tail)
+        return (f"{head}\n... ({omitted} bytes omitted, see log_file) ...\n"
+                + bytes(self._tail).decode("utf-8", "replace"))
+
+    def copy_to(self, out) -> None:
+        """把完整内容写入已打开的二进制文件"""
+        if self.spill_path is None:
+            out.write(bytes(self._head) + bytes(self._tail))
+            return
+        with open(self.spill_path, "rb") as f:
+            shutil.copyfileobj(f, out)
+
+    def discard(self) -> None:
+        self.close()
+        if self.spill_path is not None:
+            try:
+                os.unlink(self.spill_path)
+            except OSError:
+                pass
+            self.spill_path = None
+
+
+def _prune(log_dir: str, prefix: str, keep: int) -> None:
+    logs = sorted(glob.glob(os.path.join(log_dir, f"{prefix}_*.log")), key=os.path.getmtime)
+    for old in logs[:-keep] if keep > 0 else logs:
+        try:
+            os.unlink(old)
+        except OSError:
+            pass
+
+
+def finalize_log(captures: Sequence[Tuple[str, BoundedCapture]], prefix: str, log_dir: str = "log",
+                 header: str = "", force: bool = False, keep: int = SPILL_KEEP) -> Optional[str]:
+    """
+    有任一流被截断（或 force）时，把各流的完整内容按 `--- LABEL ---` 分段写入 log 目录，
+    并按前缀只保留最近 keep 份；返回日志路径，否则返回 None。临时转存文件随后删除。
+    """
+    try:
+        if not force and not any(cap.truncated for _, cap in captures):
+            return None
+        log_dir = os.path.join(os.getcwd(), log_dir)
+        os.makedirs(log_dir, exist_ok=True)
+        file_time = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        path = os.path.join(log_dir, f"{prefix}_{file_time}.log")
+        with open(path, "wb") as out:
+            if header:
+                out.write(header.encode("utf-8"))
+            for label, cap in captures:
+                cap.close()
+                out.write(f"--- {label} ---\n".encode("utf-8"))
+                cap.copy_to(out)
+                out.write(b"\n")
+        _prune(log_dir, prefix, keep)
+        return path
+    finally:
+        for _, cap in captures:
+            cap.discard()
+
+
+@dataclass
+class CapturedRun:
+    returncode: Optional[int]
+    stdout: str
+    stderr: str
+    timed_out: bool
+    log_file: Optional[str]
+    stdout_bytes: int
+    stderr_bytes: int
+    # 等待主机级运行名额的时间（见 tools/sandbox.py）
+    queued_sec: float = 0.0
+
+
+def _pump(pipe, capture: BoundedCapture) -> None:
+    fd = pipe.fileno()
+    try:
+        while True:
+            chunk = os.read(fd, _READ_CHUNK)
+            if not chunk:
+                break
+            capture.write(chunk)
+    except OSError:
+        pass
+    finally:
+        pipe.close()
+
+
+def _signal_group(pgid: int, sig: int) -> None:
+    try:
+        os.killpg(pgid, sig)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def run_captured(cmd: List[str], *, cwd: Optional[str] = None, env: Optional[Dict[str, str]] = None,
+                 timeout: Optional[float] = None, log_prefix: str = "subprocess",
+                 head_bytes: int = DEFAULT_HEAD_BYTES, tail_bytes: int = DEFAULT_TAIL_BYTES,
+                 log_dir: str = "log", new_group: bool = False, dump_signal: Optional[int] = None,
+                 dump_grace_sec: float = 2.0, cancel: Optional[CancelToken] = None) -> CapturedRun:
+    """
+    替代 subprocess.run(capture_output=True)：两个线程边读边写入有界缓冲，
+    内存占用与输出量无关；输出超出缓冲时完整内容写入 log 目录（log_file）。
+    超时后杀掉进程并返回 timed_out=True（不抛异常），已读到的输出照常返回。
+    new_group=True 时进程在独立进程组中运行，超时先发 dump_signal（若给出）再结束整组，
+    正常退出后也会清理组内残留的后代进程。
+    cancel 被取消时立即结束进程（组），丢弃输出并抛出 RunCancelled。
+    """
+    if cancel is not None:
+        cancel.check()
+    out_cap = BoundedCapture(head_bytes, tail_bytes)
+    err_cap = BoundedCapture(head_bytes, tail_bytes)
+    new_group = new_group and os.name == "posix"
+    proc = subprocess.Popen(cmd, cwd=cwd, env=env, stdin=subprocess.DEVNULL,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, start_new_session=new_group)
+    readers = [
+        threading.Thread(target=_pump, args=(proc.stdout, out_cap), daemon=True),
+        threading.Thread(target=_pump, args=(proc.stderr, err_cap), daemon=True),
+    ]
+    for t in readers:
+        t.start()
+    timed_out = False
+    try:
+        with kill_on_cancel(cancel, proc.pid, group=new_group, timeout=timeout):
+            proc.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        timed_out = True
+        if new_group and dump_signal is not None:
+            _signal_group(proc.pid, dump_signal)
+            try:
+                proc.wait(timeout=dump_grace_sec)
+            except subprocess.TimeoutExpired:
+                pass
+        if new_group:
+            _signal_group(proc.pid, signal.SIGKILL)
+        else:
+            proc.kill()
+        proc.wait()
+    finally:
+        if new_group:
+            _signal_group(proc.pid, signal.SIGKILL)
+        # 子进程派生的后代可能仍持有管道，读线程最多再等一会儿
+        for t in readers:
+            t.join(timeout=5)
+
+    if cancel is not None and cancel.cancelled:
+        out_cap.discard()
+        err_cap.discard()
+        raise RunCancelled(cancel.reason or "cancelled")
+    return _captured_run(cmd, None if timed_out else proc.returncode, timed_out, out_cap, err_cap,
+                         log_prefix, log_dir)
+
+
+def _captured_run(cmd: List[str], returncode: Optional[int], timed_out: bool, out_cap: BoundedCapture,
+                  err_cap: BoundedCapture, log_prefix: str, log_dir: str) -> CapturedRun:
+    stdout, stderr = out_cap.text(), err_cap.text()
+    header = f"=== Command: {' '.join(cmd)} ===\n=== Exit Code: {returncode} ===\n"
+    log_file = finalize_log([("STDOUT", out_cap), ("STDERR", err_cap)], log_prefix, log_dir, header)
+    return CapturedRun(
+        returncode=returncode,
+        stdout=stdout,
+        stderr=stderr,
+        timed_out=timed_out,
+        log_file=log_file,
+        stdout_bytes=out_cap.total_bytes,
+        stderr_bytes=err_cap.total_bytes,
+    )
+
+
+async def _apump(stream: asyncio.StreamReader, capture: BoundedCapture) -> None:
+    try:
+        while True:
+            chunk = await stream.read(_READ_CHUNK)
+            if not chunk:
+                break
+            capture.write(chunk)
+    except (OSError, ValueError):
+        pass
+
+
+async def arun_captured(cmd: List[str], *, cwd: Optional[str] = None, env: Optional[Dict[str, str]] = None,
+                        timeout: Optional[float] = None, log_prefix: str = "subprocess",
+                        head_bytes: int = DEFAULT_HEAD_BYTES, tail_bytes: int = DEFAULT_TAIL_BYTES,
+                        log_dir: str = "log", new_group: bool = False, dump_signal: Optional[int] = None,
+                        dump_grace_sec: float = 2.0, cancel: Optional[CancelToken] = None) -> CapturedRun:
+    """
+    run_captured 的 asyncio 版本：子进程与输出读取都在事件循环上进行，不占用线程。
+    语义与 run_captured 相同；协程被取消时同样结束子进程（new_group 时结束整组）后再抛出。
+    """
+    if cancel is not None:
+        cancel.check()
+    out_cap = BoundedCapture(head_bytes, tail_bytes)
+    err_cap = BoundedCapture(head_bytes, tail_bytes)
+    new_group = new_group and os.name == "posix"
+    proc = await asyncio.create_subprocess_exec(
+        *cmd, cwd=cwd, env=env, stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, start_new_session=new_group,
+    )
+    readers = [
+        asyncio.ensure_future(_apump(proc.stdout, out_cap)),
+        asyncio.ensure_future(_apump(proc.stderr, err_cap)),
+    ]
+    timed_out = False
+    finished = False
+    try:
+        with kill_on_cancel(cancel, proc.pid, group=new_group, timeout=timeout):
+            await asyncio.wait_for(proc.wait(), timeout)
+        finished = True
+    except asyncio.TimeoutError:
+        timed_out = True
+        if new_group and dump_signal is not None:
+            _signal_group(proc.pid, dump_signal)
+            try:
+                await asyncio.wait_for(proc.wait(), dump_grace_sec)
+            except asyncio.TimeoutError:
+                pass
+        if new_group:
+            _signal_group(proc.pid, signal.SIGKILL)
+        elif proc.returncode is None:
+            proc.kill()
+        await proc.wait()
+        finished = True
+    finally:
+        if new_group:
+            _signal_group(proc.pid, signal.SIGKILL)
+        elif proc.returncode is None:
+            # 只有被取消时才会走到这里
+            proc.kill()
+        # 子进程派生的后代可能仍持有管道，读取最多再等一会儿
+        _, pending = await asyncio.wait(readers, timeout=5)
+        for t in pending:
+            t.cancel()
+        if not finished:
+            out_cap.discard()
+            err_cap.discard()
+
+    if cancel is not None and cancel.cancelled:
+        out_cap.discard()
+        err_cap.discard()
+        raise RunCancelled(cancel.reason or "cancelled")
+    return _captured_run(cmd, None if timed_out else proc.returncode, timed_out, out_cap, err_cap,
+                         log_prefix, log_dir)
+
+
+def capture_files(paths: Sequence[Tuple[str, str]], log_prefix: str, *,
+                  head_bytes: int = DEFAULT_HEAD_BYTES, tail_bytes: int = DEFAULT_TAIL_BYTES,
+                  log_dir: str = "log") -> Tuple[List[str], Optional[str]]:
+    """
+    以有界方式读取已写入磁盘的输出文件（如常驻 worker 的 stdout / stderr 重定向文件）：
+    返回 (各文件的有界文本, 完整日志路径或 None)。
+    """
+    captures: List[Tuple[str, BoundedCapture]] = []
+    for label, path in paths:
+        cap = BoundedCapture(head_bytes, tail_bytes)
+        try:
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(_READ_CHUNK), b""):
+                    cap.write(chunk)
+        except OSError:
+            pass
+        captures.append((label, cap))
+    texts = [cap.text() for _, cap in captures]
+    return texts, finalize_log(captures, log_prefix, log_dir)
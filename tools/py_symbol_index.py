@@ -0,0 +1,575 @@
+from __future__ import annotations
+
+import ast
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from config.paths import MEMORY_DIR, resolve_path
+
+# 索引格式版本：结构变更时递增，旧索引会被整体丢弃重建
+INDEX_VERSION = 4
+
+# 默认索引存放目录（仓库 memory/ 下，与 working_memory 同级）
+DEFAULT_INDEX_DIR = MEMORY_DIR / "code_index"
+
+# 待解析文件数低于该阈值时串行解析（进程池启动本身有开销）
+PARALLEL_MIN_FILES = 64
+
+
+def _file_sha1(data: bytes) -> str:
+    return hashlib.sha1(data).hexdigest()
+
+
+def infer_module_name(root: Path, file_path: Path) -> str:
+    """
+    尝试从文件路径推断模块名（包名）：
+    - 相对于 root 的相对路径
+    - 去掉 .py
+    - 将路径分隔符替换成 '.'
+    - 如果是 __init__.py，则模块名是目录名（例如 hone/utils/__init__.py -> hone.utils）
+    """
+    rel = file_path.resolve().relative_to(root.resolve())
+    parts = list(rel.parts)
+
+    if parts[-1] == "__init__.py":
+        parts = parts[:-1]  # 包本身
+    else:
+        parts[-1] = parts[-1].removesuffix(".py")
+
+    # 过滤掉空 parts
+    parts = [p for p in parts if p]
+    return ".".join(parts)
+
+
+def _parse(text: str, filename: str) -> Optional[ast.Module]:
+    try:
+        return ast.parse(text, filename=filename)
+    except (SyntaxError, ValueError):
+        return None
+
+
+# 不改变函数签名的装饰器；其他装饰器可能改写签名，参数信息记为未知
+_TRANSPARENT_DECORATORS = {
+    "staticmethod", "classmethod", "abstractmethod", "wraps", "lru_cache", "cache", "override",
+}
+
+
+def _decorator_name(node: ast.expr) -> str:
+    if isinstance(node, ast.Call):
+        node = node.func
+    if isinstance(node, ast.Attribute):
+        return node.attr
+    if isinstance(node, ast.Name):
+        return node.id
+    return ""
+
+
+def _dotted(node: ast.expr) -> Optional[str]:
+    if isinstance(node, ast.Name):
+        return node.id
+    if isinstance(node, ast.Attribute):
+        base = _dotted(node.value)
+        return f"{base}.{node.attr}" if base else None
+    return None
+
+
+def _params(fn: ast.AST, drop_first: bool) -> Dict[str, Any]:
+    """函数调用约定：位置参数（含必填个数）、*args、仅关键字参数、**kwargs"""
+    a = fn.args
+    pos = [p.arg for p in a.posonlyargs + a.args]
+    n_posonly = len(a.posonlyargs)
+    required = len(pos) - len(a.defaults)
+    if drop_first and pos:
+        pos = pos[1:]
+        n_posonly = max(0, n_posonly - 1)
+        required = max(0, required - 1)
+    kwonly = [p.arg for p in a.kwonlyargs]
+    return {
+        "positional": pos,
+        "posonly": n_posonly,
+        "required": max(0, required),
+        "vararg": a.vararg is not None,
+        "kwonly": kwonly,
+        "kwonly_required": [p.arg for p, d in zip(a.kwonlyargs, a.kw_defaults) if d is None],
+        "varkw": a.kwarg is not None,
+    }
+
+
+def _function_params(fn: ast.AST, in_class: bool) -> Optional[Dict[str, Any]]:
+    names = [_decorator_name(d) for d in fn.decorator_list]
+    if any(n not in _TRANSPARENT_DECORATORS for n in names):
+        return None
+    return _params(fn, drop_first=in_class and "staticmethod" not in names)
+
+
+def _class_info(cls: ast.ClassDef) -> Dict[str, Any]:
+    """
+    类的成员名（方法、类属性、self.xxx 赋值、嵌套类）、基类表达式，以及构造调用约定：
+    - 自身定义了 __init__（且没有 __new__）：按 __init__ 计算
+    - 不带参数的 @dataclass 且没有基类：按注解字段计算（含 InitVar，不含 ClassVar）
+    其余情况（定义了 __new__、没有 __init__、继承来的构造、元类、其他装饰器或 dataclass 参数）记为未知。
+    """
+    members: Dict[str, None] = {}
+    init = None
+    for node in cls.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            members[node.name] = None
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and node.name == "__init__":
+                init = node
+        elif isinstance(node, ast.Assign):
+            for target in node.targets:
+                for sub in ast.walk(target):
+                    if isinstance(sub, ast.Name):
+                        members[sub.id] = None
+        elif isinstance(node, ast.AnnAssign) and isinstance(node.target, ast.Name):
+            members[node.target.id] = None
+    for fn in cls.body:
+        if not isinstance(fn, (ast.FunctionDef, ast.AsyncFunctionDef)) or not fn.args.args:
+            continue
+        self_name = fn.args.args[0].arg
+        for sub in ast.walk(fn):
+            if (isinstance(sub, ast.Attribute) and isinstance(sub.ctx, ast.Store)
+                    and isinstance(sub.value, ast.Name) and sub.value.id == self_name):
+                members[sub.attr] = None
+
+    bases = [_dotted(b) or "?" for b in cls.bases]
+    decorators = [_decorator_name(d) for d in cls.decorator_list]
+    real_bases = [b for b in bases if b != "object"]
+    params: Optional[Dict[str, Any]] = None
+    # dataclass(init=False, kw_only=True, ...) 会改变生成的 __init__
+    configured = any(isinstance(d, ast.Call) and (d.args or d.keywords) for d in cls.decorator_list)
+    if cls.keywords or configured or any(d != "dataclass" for d in decorators) or "__new__" in members:
+        params = None
+    elif init is not None:
+        params = _function_params(init, in_class=True)
+    elif "dataclass" in decorators and not real_bases:
+        fields = []
+        for node in cls.body:
+            if isinstance(node, ast.AnnAssign) and isinstance(node.target, ast.Name):
+                ann = _dotted(node.annotation.value if isinstance(node.annotation, ast.Subscript) else node.annotation)
+                kind = ann.split(".")[-1] if ann else ""
+                if kind == "KW_ONLY":
+                    # 之后的字段只能按关键字传入，不再推断
+                    fields = None
+                    break
+                if kind == "ClassVar":
+                    continue
+                # InitVar 不是字段，但仍是 __init__ 的参数
+                fields.append((node.target.id, node.value is not None))
+        if fields is not None:
+            required = 0
+            for _, has_default in fields:
+                if has_default:
+                    break
+                required += 1
+            params = {"positional": [f for f, _ in fields], "posonly": 0, "required": required,
+                      "vararg": False, "kwonly": [], "kwonly_required": [], "varkw": False}
+    return {
+        "members": list(members),
+        "bases": bases,
+        # 自定义 __getattr__ / 元类 / 装饰器都可能动态添加属性
+        "open_members": bool(cls.keywords or decorators and decorators != ["dataclass"]
+                             or "__getattr__" in members or "__getattribute__" in members),
+        "params": params,
+    }
+
+
+def _definitions(tree: ast.Module) -> List[Dict[str, Any]]:
+    # 先递归一遍计算限定名（Outer.Inner.method）
+    qualnames: Dict[int, str] = {}
+    in_class: Dict[int, bool] = {}
+
+    def _visit(node: ast.AST, prefix: str) -> None:
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                qn = f"{prefix}.{child.name}" if prefix else child.name
+                qualnames[id(child)] = qn
+                in_class[id(child)] = isinstance(node, ast.ClassDef)
+                _visit(child, qn)
+            else:
+                _visit(child, prefix)
+
+    _visit(tree, "")
+
+    symbols: List[Dict[str, Any]] = []
+    for node in ast.walk(tree):
+        is_func = isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef))
+        is_cls = isinstance(node, ast.ClassDef)
+        if not (is_func or is_cls):
+            continue
+        start = getattr(node, "lineno", None)
+        if start is None:
+            continue
+        end = getattr(node, "end_lineno", None) or start
+        rec = {
+            "name": node.name,
+            "qualname": qualnames.get(id(node), node.name),
+            "kind": "class" if is_cls else "function",
+            "start_line": start,
+            "end_line": end,
+        }
+        if is_cls:
+            rec.update(_class_info(node))
+        else:
+            rec["params"] = _function_params(node, in_class.get(id(node), False))
+        symbols.append(rec)
+    return symbols
+
+
+def extract_definitions(text: str, filename: str = "<unknown>") -> Optional[List[Dict[str, Any]]]:
+    """
+    解析源码，返回所有 class / function 定义（按 ast.walk 顺序，与旧实现的返回顺序一致）。
+    语法错误返回 None。
+    """
+    tree = _parse(text, filename)
+    return None if tree is None else _definitions(tree)
+
+
+def extract_imports(tree: ast.Module, module: str, is_package: bool) -> List[str]:
+    """
+    收集文件中（含函数体内）导入的绝对模块名，相对导入按 module 解析。
+    `from a.b import c` 同时记录 a.b 与 a.b.c（c 可能是子模块）。
+    """
+    base = module.split(".") if module else []
+    if not is_package:
+        base = base[:-1]
+    names: Dict[str, None] = {}
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                names[alias.name] = None
+        elif isinstance(node, ast.ImportFrom):
+            if node.level:
+                if node.level - 1 > len(base):
+                    continue
+                parts = base[:len(base) - (node.level - 1)]
+                target = ".".join(parts + ([node.module] if node.module else []))
+            else:
+                target = node.module or ""
+            if target:
+                names[target] = None
+            for alias in node.names:
+                if alias.name != "*":
+                    names[f"{target}.{alias.name}" if target else alias.name] = None
+    return list(names)
+
+
+def extract_exports(tree: ast.Module, module: str, is_package: bool) -> Dict[str, Any]:
+    """
+    模块顶层绑定的名字：name -> "def" / "class" / "var" / "import:<绝对模块名>[:<名字>]"。
+    存在 `import *` 或模块级 __getattr__ 时 open 为 True（无法静态确定全部名字）。
+    def / class 的名字若还有其他绑定（如 `f = functools.partial(f, 1)`、条件分支中的重定义），
+    最终绑定的对象无法静态确定，记为 "var"。
+    """
+    base = module.split(".") if module else []
+    if not is_package:
+        base = base[:-1]
+    names: Dict[str, str] = {}
+    bindings: Dict[str, int] = {}
+    is_open = False
+
+    def _count(name: str) -> None:
+        bindings[name] = bindings.get(name, 0) + 1
+
+    def _bind_target(target: ast.AST) -> None:
+        for sub in ast.walk(target):
+            if isinstance(sub, ast.Name):
+                _count(sub.id)
+                names.setdefault(sub.id, "var")
+
+    # 只看模块顶层，以及 if / try / with 块（条件导入、兼容性分支）
+    stack = list(tree.body)
+    while stack:
+        node = stack.pop(0)
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            _count(node.name)
+            names[node.name] = "def"
+            if node.name == "__getattr__":
+                is_open = True
+        elif isinstance(node, ast.ClassDef):
+            _count(node.name)
+            names[node.name] = "class"
+        elif isinstance(node, ast.Import):
+            for alias in node.names:
+                if alias.asname:
+                    _count(alias.asname)
+                    names[alias.asname] = f"import:{alias.name}"
+                else:
+                    top = alias.name.split(".")[0]
+                    _count(top)
+                    names.setdefault(top, f"import:{top}")
+        elif isinstance(node, ast.ImportFrom):
+            if node.level:
+                if node.level - 1 > len(base):
+                    continue
+                parts = base[:len(base) - (node.level - 1)]
+                target = ".".join(parts + ([node.module] if node.module else []))
+            else:
+                target = node.module or ""
+            for alias in node.names:
+                if alias.name == "*":
+                    is_open = True
+                    continue
+                _count(alias.asname or alias.name)
+                names[alias.asname or alias.name] = f"import:{target}:{alias.name}"
+        elif isinstance(node, (ast.Assign, ast.AugAssign, ast.AnnAssign)):
+            for target in (node.targets if isinstance(node, ast.Assign) else [node.target]):
+                _bind_target(target)
+        elif isinstance(node, (ast.For, ast.AsyncFor, ast.With, ast.AsyncWith)):
+            if isinstance(node, (ast.For, ast.AsyncFor)):
+                _bind_target(node.target)
+            else:
+                for item in node.items:
+                    if item.optional_vars is not None:
+                        _bind_target(item.optional_vars)
+            stack.extend(node.body)
+        elif isinstance(node, (ast.If, ast.While)):
+            stack.extend(node.body + node.orelse)
+        elif isinstance(node, ast.Try) or type(node).__name__ == "TryStar":
+            stack.extend(node.body + node.orelse + node.finalbody)
+            for handler in node.handlers:
+                if handler.name:
+                    _count(handler.name)
+                    names.setdefault(handler.name, "var")
+                stack.extend(handler.body)
+        elif isinstance(node, ast.Expr):
+            # 海象运算符等在表达式中绑定的名字
+            for sub in ast.walk(node):
+                if isinstance(sub, ast.NamedExpr) and isinstance(sub.target, ast.Name):
+                    _count(sub.target.id)
+                    names.setdefault(sub.target.id, "var")
+    for name, kind in names.items():
+        if kind in ("def", "class") and bindings.get(name, 0) > 1:
+            names[name] = "var"
+    return {"names": names, "open": is_open}
+
+
+def _parse_chunk(root: str, items: List[Tuple[str, int, int]]) -> List[Optional[Dict[str, Any]]]:
+    """
+    读取并解析一批文件（可在子进程中执行）。
+    每个元素为 (相对路径, mtime_ns, size)，返回对应的索引记录；读取失败返回 None。
+    """
+    root_path = Path(root)
+    out: List[Optional[Dict[str, Any]]] = []
+    for rel, mtime_ns, size in items:
+        path = root_path / rel
+        try:
+            data = path.read_bytes()
+        except OSError:
+            out.append(None)
+            continue
+        text = data.decode("utf-8", errors="ignore")
+        module = infer_module_name(root_path, path)
+        tree = _parse(text, str(path))
+        out.append({
+            "mtime_ns": mtime_ns,
+            "size": size,
+            "sha1": _file_sha1(data),
+            "module": module,
+            "symbols": _definitions(tree) if tree is not None else [],
+            "imports": extract_imports(tree, module, path.name == "__init__.py") if tree is not None else [],
+            "exports": (extract_exports(tree, module, path.name == "__init__.py") if tree is not None
+                        else {"names": {}, "open": True}),
+            # 在本文件中被赋值过的属性名（obj.attr = ...），对象可能在类定义之外被添加属性
+            "attr_stores": sorted({
+                n.attr for n in ast.walk(tree) if isinstance(n, ast.Attribute) and isinstance(n.ctx, ast.Store)
+            }) if tree is not None else [],
+            "syntax_error": tree is None,
+        })
+    return out
+
+
+class PySymbolIndex:
+    """
+    针对单个 sut_root 的持久化符号索引：
+    - 每个文件记录 mtime / size / sha1 / 模块名 / 定义列表（含参数、类成员） / 导入的模块 / 顶层导出的名字
+    - refresh() 只重新解析 mtime/size 变化且内容哈希变化的文件
+    - lookup() 直接在索引上做精确 / 正则 / 大小写不敏感匹配
+    """
+
+    def __init__(self, root: str | Path, index_dir: str | Path = DEFAULT_INDEX_DIR):
+        self.root = Path(root).expanduser().resolve()
+        root_key = hashlib.sha1(str(self.root).encode("utf-8")).hexdigest()[:16]
+        self.index_path = resolve_path(index_dir) / f"py_{root_key}.json"
+        self._files: Dict[str, Dict[str, Any]] = {}
+        self._dirty = False
+        self._lock = threading.RLock()
+        self._load()
+
+    # ---------- 持久化 ----------
+
+    def _load(self) -> None:
+        if not self.index_path.exists():
+            return
+        try:
+            raw = json.loads(self.index_path.read_text(encoding="utf-8"))
+        except (OSError, json.JSONDecodeError):
+            return
+        if raw.get("version") != INDEX_VERSION or raw.get("root") != str(self.root):
+            return
+        self._files = raw.get("files", {})
+
+    def save(self) -> None:
+        with self._lock:
+            if not self._dirty:
+                return
+            self.index_path.parent.mkdir(parents=True, exist_ok=True)
+            payload = {"version": INDEX_VERSION, "root": str(self.root), "files": self._files}
+            # 先写临时文件再替换，避免并发读到半个文件
+            tmp = self.index_path.with_suffix(f".{os.getpid()}.tmp")
+            tmp.write_text(json.dumps(payload, ensure_ascii=False), encoding="utf-8")
+            os.replace(tmp, self.index_path)
+            self._dirty = False
+
+    # ---------- 增量更新 ----------
+
+    def _apply_record(self, rel: str, rec: Optional[Dict[str, Any]]) -> None:
+        if rec is None:
+            self._files.pop(rel, None)
+            return
+        old = self._files.get(rel)
+        if old and old.get("sha1") == rec["sha1"]:
+            # 只是 touch 过，内容未变：更新 stat 即可
+            old["mtime_ns"] = rec["mtime_ns"]
+            old["size"] = rec["size"]
+            return
+        self._files[rel] = rec
+
+    def refresh(self, file_glob: str = "**/*.py", workers: int = 0,
+                skip_dirs: Optional[Iterable[str]] = None) -> List[str]:
+        """
+        根据 file_glob 扫描文件并增量更新索引，返回本次 glob 命中的相对路径列表（按 glob 顺序）。
+
+        :param workers: 解析进程数；0 表示使用 CPU 核数，1 表示串行
+        :param skip_dirs: 跳过路径中包含这些目录名的文件（如 .venv、__pycache__）
+        """
+        skip = set(skip_dirs or ())
+        with self._lock:
+            seen: List[str] = []
+            changed: List[Tuple[str, int, int]] = []
+            for py_file in self.root.glob(file_glob):
+                if skip and skip.intersection(py_file.relative_to(self.root).parts[:-1]):
+                    continue
+                try:
+                    st = py_file.stat()
+                except OSError:
+                    continue
+                if not py_file.is_file():
+                    continue
+                rel = py_file.relative_to(self.root).as_posix()
+                seen.append(rel)
+                entry = self._files.get(rel)
+                if entry and entry.get("mtime_ns") == st.st_mtime_ns and entry.get("size") == st.st_size:
+                    continue
+                changed.append((rel, st.st_mtime_ns, st.st_size))
+
+            if changed:
+                for rel, rec in zip((c[0] for c in changed), self._parse_many(changed, workers)):
+                    self._apply_record(rel, rec)
+                self._dirty = True
+
+            # 清理已删除的文件（只清理不在磁盘上的，避免不同 glob 互相抹掉）
+            seen_set = set(seen)
+            for rel in list(self._files):
+                if rel not in seen_set and not (self.root / rel).is_file():
+                    del self._files[rel]
+                    self._dirty = True
+            return seen
+
+    def _parse_many(self, changed: List[Tuple[str, int, int]], workers: int) -> List[Optional[Dict[str, Any]]]:
+        """
+        解析变化的文件，结果顺序与 changed 一致。
+        冷启动（大量文件）时按块分发到进程池，否则在当前进程串行解析。
+        """
+        workers = workers if workers > 0 else (os.cpu_count() or 1)
+        root = str(self.root)
+        if workers <= 1 or len(changed) < PARALLEL_MIN_FILES:
+            return _parse_chunk(root, changed)
+
+        # 每个 worker 分到若干块，兼顾负载均衡与进程间通信开销
+        chunk_size = max(8, len(changed) // (workers * 4))
+        chunks = [changed[i:i + chunk_size] for i in range(0, len(changed), chunk_size)]
+        results: List[Optional[Dict[str, Any]]] = []
+        try:
+            with ProcessPoolExecutor(max_workers=min(workers, len(chunks))) as pool:
+                # map 保证结果按提交顺序返回，合并结果是确定的
+                for part in pool.map(_parse_chunk, [root] * len(chunks), chunks):
+                    results.extend(part)
+        except (OSError, RuntimeError):
+            # 进程池不可用（受限环境等）时退化为串行
+            return _parse_chunk(root, changed)
+        return results
+
+    # ---------- 查询 ----------
+
+    def module_table(self) -> Dict[str, Dict[str, Any]]:
+        """模块名 -> 索引记录（附 rel_file），供静态检查解析导入；记录只读"""
+        with self._lock:
+            return {entry["module"]: {**entry, "rel_file": rel} for rel, entry in self._files.items()}
+
+    def snapshot(self, files: Optional[Iterable[str]] = None) -> Dict[str, Dict[str, Any]]:
+        """返回文件 -> {module, sha1, imports} 的快照（不含定义列表），供依赖分析使用"""
+        with self._lock:
+            rels = self._files.keys() if files is None else [f for f in files if f in self._files]
+            return {
+                rel: {
+                    "module": self._files[rel]["module"],
+                    "sha1": self._files[rel]["sha1"],
+                    "imports": self._files[rel].get("imports", []),
+                }
+                for rel in rels
+            }
+
+    def lookup(
+            self,
+            files: List[str],
+            match: Callable[[str], bool],
+            *,
+            kind: str = "any",
+            include_private: bool = True,
+            max_results: int = 10,
+            max_file_size_kb: int = 1024,
+    ) -> List[Dict[str, Any]]:
+        """
+        在给定文件集合内查找匹配的定义，返回索引记录（不含源码片段）。
+        """
+        out: List[Dict[str, Any]] = []
+        with self._lock:
+            for rel in files:
+                entry = self._files.get(rel)
+                if not entry:
+                    continue
+                if entry["size"] / 1024.0 > max_file_size_kb:
+                    continue
+                for sym in entry["symbols"]:
+                    if len(out) >= max_results:
+                        return out
+                    if kind != "any" and sym["kind"] != kind:
+                        continue
+                    name = sym["name"]
+                    if not include_private and name.startswith("_"):
+                        continue
+                    if not match(name):
+                        continue
+                    out.append({**sym, "rel_file": rel, "module": entry["module"]})
+        return out
+
+
+# 进程内缓存：同一个 sut_root 只加载一次索引
+_INDEXES: Dict[str, PySymbolIndex] = {}
+_INDEXES_LOCK = threading.Lock()
+
+
+def get_symbol_index(root: str | Path, index_dir: str | Path = DEFAULT_INDEX_DIR) -> PySymbolIndex:
+    key = f"{Path(root).expanduser().resolve()}|{resolve_path(index_dir)}"
+    with _INDEXES_LOCK:
+        idx = _INDEXES.get(key)
+        if idx is None:
+            idx = PySymbolIndex(root, index_dir=index_dir)
+            _INDEXES[key] = idx
+        return idx
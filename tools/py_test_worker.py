@@ -0,0 +1,308 @@
+from __future__ import annotations
+
+import ast
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from tools.cancellation import CancelToken, RunCancelled, kill_on_cancel
+from tools.output_capture import capture_files
+from tools.py_symbol_index import get_symbol_index
+from tools.sandbox import ResourceLimits, get_host_slots
+
+# 常驻 worker 脚本（在目标解释器中运行）
+_FORKSERVER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pytest_forkserver.py")
+
+# 扫描 SUT 导入时跳过的目录
+_SKIP_DIRS = {".git", "__pycache__", ".venv", "venv", ".tox", ".pytest_cache", "node_modules", "build", "dist"}
+
+# 最多预导入多少个第三方模块
+MAX_PRELOAD = 64
+
+
+def warm_worker_supported() -> bool:
+    """fork 仅在 POSIX 上可用"""
+    return hasattr(os, "fork") and os.name == "posix"
+
+
+class WarmWorkerError(RuntimeError):
+    """常驻 worker 不可用（启动失败、协议错误等），调用方应退回到冷启动子进程"""
+
+
+@dataclass
+class WarmRunResult:
+    exit_code: Optional[int]
+    stdout: str
+    stderr: str
+    timed_out: bool
+    # 输出超出内存缓冲时的完整日志
+    log_file: Optional[str] = None
+
+
+def _iter_sut_files(project_root: str, exclude_dir: Optional[str]):
+    exclude_dir = os.path.abspath(exclude_dir) if exclude_dir else None
+    for root, dirs, files in os.walk(project_root):
+        dirs[:] = [d for d in dirs if d not in _SKIP_DIRS and os.path.join(root, d) != exclude_dir]
+        for name in files:
+            if name.endswith(".py"):
+                yield os.path.join(root, name)
+
+
+def sut_fingerprint(project_root: str, exclude_dir: Optional[str] = None, refresh: bool = True) -> str:
+    """
+    SUT 源文件的 (路径, sha1) 指纹；SUT 变化后 worker 需要重建。
+    基于符号索引：refresh 只按 mtime/size 增量更新，调用方本轮已刷新过索引时可传 refresh=False 跳过扫描。
+    """
+    index = get_symbol_index(project_root)
+    if refresh:
+        index.refresh("**/*.py", skip_dirs=_SKIP_DIRS)
+        index.save()
+    excluded = None
+    if exclude_dir:
+        rel_dir = os.path.relpath(os.path.abspath(exclude_dir), os.path.abspath(project_root))
+        if rel_dir != "." and not rel_dir.startswith(".."):
+            excluded = Path(rel_dir).as_posix() + "/"
+    h = hashlib.sha1()
+    for rel, rec in sorted(index.snapshot().items()):
+        if excluded and rel.startswith(excluded):
+            continue
+        h.update(f"{rel}|{rec['sha1']}\n".encode("utf-8"))
+    return h.hexdigest()
+
+
+def discover_heavy_imports(project_root: str, exclude_dir: Optional[str] = None) -> List[str]:
+    """
+    收集 SUT 顶层导入的第三方模块（不属于项目自身的顶层包），供 worker 预导入。
+    只导入第三方依赖，不导入 SUT 本身，避免 SUT 的导入副作用在 fork 前发生。
+    """
+    local = set()
+    for entry in os.listdir(project_root):
+        full = os.path.join(project_root, entry)
+        if entry.endswith(".py"):
+            local.add(entry[:-3])
+        elif os.path.isdir(full):
+            local.add(entry)
+
+    stdlib = getattr(sys, "stdlib_module_names", set())
+    found: Dict[str, None] = {}
+    for path in _iter_sut_files(project_root, exclude_dir):
+        try:
+            with open(path, "r", encoding="utf-8", errors="ignore") as f:
+                tree = ast.parse(f.read())
+        except (OSError, SyntaxError, ValueError):
+            continue
+        for node in tree.body:
+            names = []
+            if isinstance(node, ast.Import):
+                names = [a.name for a in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+                names = [node.module]
+            for name in names:
+                top = name.split(".")[0]
+                if top in local or top in stdlib or top == "__future__":
+                    continue
+                found[top] = None
+    return list(found)[:MAX_PRELOAD]
+
+
+class WarmWorker:
+    """
+    单个常驻 worker 进程：启动时预导入 pytest 与 SUT 的第三方依赖，
+    之后每次运行由 worker fork 一个干净的子进程执行。协议是一问一答，同一时刻只处理一个请求，
+    并发运行由 WarmWorkerPool 分配不同的 worker。
+    """
+
+    def __init__(self, python_executable: str, project_root: str, env: Dict[str, str],
+                 preload: List[str], fingerprint: str):
+        self.fingerprint = fingerprint
+        try:
+            self._proc = subprocess.Popen(
+                [python_executable, _FORKSERVER, json.dumps(preload)],
+                cwd=project_root,
+                env=env,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                text=True,
+                bufsize=1,
+            )
+            ready = json.loads(self._proc.stdout.readline() or "{}")
+        except (OSError, ValueError) as e:
+            raise WarmWorkerError(f"failed to start warm worker: {e}") from e
+        if not ready.get("ready"):
+            self.close()
+            raise WarmWorkerError("warm worker did not become ready")
+        self.has_pytest = bool(ready.get("pytest"))
+        self.preloaded = ready.get("preloaded", [])
+
+    @property
+    def alive(self) -> bool:
+        return self._proc.poll() is None
+
+    def run(self, module: str, args: List[str], *, cwd: str, env: Dict[str, str], timeout: float,
+            limits: Optional[ResourceLimits] = None, dump_signal: Optional[int] = None,
+            cancel: Optional[CancelToken] = None) -> WarmRunResult:
+        """执行一次请求；调用方保证同一 worker 上没有并发请求（见 WarmWorkerPool）"""
+        if not self.alive:
+            raise WarmWorkerError("warm worker exited")
+        fd_out, out_path = tempfile.mkstemp(prefix="mate_out_", suffix=".log")
+        fd_err, err_path = tempfile.mkstemp(prefix="mate_err_", suffix=".log")
+        os.close(fd_out)
+        os.close(fd_err)
+        try:
+            req = {
+                "module": module,
+                "args": args,
+                "cwd": cwd,
+                "env": env,
+                "timeout": timeout,
+                "stdout_path": out_path,
+                "stderr_path": err_path,
+                "rlimits": limits.rlimits() if limits is not None else {},
+                "dump_signal": dump_signal,
+            }
+            try:
+                self._proc.stdin.write(json.dumps(req) + "\n")
+                self._proc.stdin.flush()
+                started = json.loads(self._proc.stdout.readline() or "{}")
+                if "pid" not in started:
+                    raise WarmWorkerError("warm worker did not start the test process")
+                # 取消时直接结束测试进程组，worker 收回子进程后照常回报，可以继续复用
+                with kill_on_cancel(cancel, started["pid"], timeout=timeout):
+                    resp = json.loads(self._proc.stdout.readline() or "{}")
+            except (OSError, ValueError) as e:
+                raise WarmWorkerError(f"warm worker protocol error: {e}") from e
+            if "timed_out" not in resp:
+                raise WarmWorkerError("warm worker returned no result")
+            if cancel is not None and cancel.cancelled:
+                raise RunCancelled(cancel.reason or "cancelled")
+            (stdout, stderr), log_file = capture_files(
+                [("STDOUT", out_path), ("STDERR", err_path)], "pytest_run")
+            return WarmRunResult(resp["exit_code"], stdout, stderr, resp["timed_out"], log_file)
+        finally:
+            for path in (out_path, err_path):
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+
+    def close(self) -> None:
+        try:
+            self._proc.stdin.close()
+        except OSError:
+            pass
+        try:
+            self._proc.wait(timeout=2)
+        except subprocess.TimeoutExpired:
+            self._proc.kill()
+
+
+class WarmWorkerPool:
+    """
+    同一项目（同一解释器、PYTHONPATH、SUT 指纹）的一组常驻 worker。
+    每次运行先占主机名额，再取一个空闲 worker，没有空闲的就新启动一个；
+    因此并发运行各自 fork，不会在同一个 worker 上排队，worker 数量不超过同时占用的主机名额。
+    """
+
+    def __init__(self, python_executable: str, project_root: str, env: Dict[str, str],
+                 preload: List[str], fingerprint: str):
+        self.fingerprint = fingerprint
+        self._spawn_args = (python_executable, project_root, env, preload, fingerprint)
+        self._lock = threading.Lock()
+        self._closed = False
+        # 首个 worker 同步启动：启动失败直接报给调用方，并用它确认 pytest 是否可用
+        first = WarmWorker(*self._spawn_args)
+        self.has_pytest = first.has_pytest
+        self.preloaded = first.preloaded
+        self._idle: List[WarmWorker] = [first]
+
+    @property
+    def alive(self) -> bool:
+        with self._lock:
+            return not self._closed and (not self._idle or any(w.alive for w in self._idle))
+
+    def _checkout(self) -> WarmWorker:
+        with self._lock:
+            if self._closed:
+                raise WarmWorkerError("warm worker pool closed")
+            while self._idle:
+                worker = self._idle.pop()
+                if worker.alive:
+                    return worker
+                worker.close()
+        return WarmWorker(*self._spawn_args)
+
+    def _checkin(self, worker: WarmWorker) -> None:
+        with self._lock:
+            if not self._closed and worker.alive:
+                self._idle.append(worker)
+                return
+        worker.close()
+
+    def run(self, module: str, args: List[str], *, cwd: str, env: Dict[str, str], timeout: float,
+            limits: Optional[ResourceLimits] = None, dump_signal: Optional[int] = None,
+            cancel: Optional[CancelToken] = None) -> WarmRunResult:
+        # 先占主机名额再取 worker：排队只发生在主机名额上，拿到名额后总有 worker 可用
+        with get_host_slots().acquire(cancel=cancel):
+            worker = self._checkout()
+            try:
+                result = worker.run(module, args, cwd=cwd, env=env, timeout=timeout, limits=limits,
+                                    dump_signal=dump_signal, cancel=cancel)
+            except RunCancelled:
+                self._checkin(worker)
+                raise
+            except BaseException:
+                # 协议出错后收发可能已错位，不再复用
+                worker.close()
+                raise
+            self._checkin(worker)
+            return result
+
+    def close(self) -> None:
+        """关闭空闲 worker；正在运行的 worker 在归还时关闭，不打断进行中的测试"""
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for worker in idle:
+            worker.close()
+
+
+# 进程内 worker 池：key 为 (解释器, 项目根目录, PYTHONPATH)
+_WORKERS: Dict[Tuple[str, str, str], WarmWorkerPool] = {}
+_WORKERS_LOCK = threading.Lock()
+
+
+def get_warm_worker(python_executable: str, project_root: str, env: Dict[str, str],
+                    tests_dir: Optional[str] = None, index_fresh: bool = False) -> WarmWorkerPool:
+    """
+    获取（必要时创建或重建）项目的常驻 worker 池。SUT 源文件变化时旧池会被关闭重建。
+
+    :param index_fresh: 调用方本轮已刷新过该项目的符号索引（如影响分析），指纹计算不再重复扫描
+    """
+    key = (python_executable, os.path.abspath(project_root), env.get("PYTHONPATH", ""))
+    fingerprint = sut_fingerprint(project_root, tests_dir, refresh=not index_fresh)
+    with _WORKERS_LOCK:
+        pool = _WORKERS.get(key)
+        if pool is not None and (pool.fingerprint != fingerprint or not pool.alive):
+            pool.close()
+            pool = None
+            del _WORKERS[key]
+        if pool is None:
+            preload = discover_heavy_imports(project_root, tests_dir)
+            pool = WarmWorkerPool(python_executable, project_root, env, preload, fingerprint)
+            _WORKERS[key] = pool
+        return pool
+
+
+def shutdown_warm_workers() -> None:
+    with _WORKERS_LOCK:
+        for pool in _WORKERS.values():
+            pool.close()
+        _WORKERS.clear()
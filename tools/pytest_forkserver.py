@@ -0,0 +1,158 @@
+"""
+常驻测试 worker（由 tools/py_test_worker.py 在目标解释器中启动，不依赖本仓库的其他模块）。
+
+启动参数：argv[1] 为 JSON 数组，列出需要预先导入的模块（pytest 总会被预导入）。
+协议：stdin / 原 stdout 上逐行收发 JSON。
+  启动完成： {"ready": true, "pytest": bool, "preloaded": [...]}
+  请求：    {"module": "pytest"|"unittest", "args": [...], "cwd": str, "env": {...},
+             "timeout": float, "stdout_path": str, "stderr_path": str,
+             "rlimits": {"RLIMIT_*": int}, "dump_signal": int|null}
+  已启动：  {"pid": int}（测试进程的 pid，同时是其进程组 id，调用方取消时可直接结束整组）
+  响应：    {"exit_code": int|null, "timed_out": bool}
+每个请求 fork 出一个干净的子进程执行 `python -m <module> <args>`，
+子进程继承已导入的模块，因此省去了解释器启动和依赖导入的时间。
+子进程在独立进程组中运行并设置 rlimit；超时先发 dump_signal 打印栈再结束整组，正常退出后也清理残留的后代进程。
+"""
+import importlib
+import json
+import os
+import resource
+import runpy
+import signal
+import sys
+import time
+
+
+def _preload(names):
+    loaded = []
+    for name in names:
+        try:
+            importlib.import_module(name)
+            loaded.append(name)
+        except BaseException:
+            # 预导入只是优化，失败的模块留给测试进程自己导入
+            pass
+    return loaded
+
+
+def _run_child(req):
+    # 子进程：独立进程组，便于超时时整组终止
+    os.setpgid(0, 0)
+    _apply_rlimits(req.get("rlimits") or {})
+    os.chdir(req["cwd"])
+    os.environ.clear()
+    os.environ.update(req["env"])
+
+    # 模拟 `python -m`：sys.path[0] 为 cwd，并加入 PYTHONPATH
+    extra = [p for p in req["env"].get("PYTHONPATH", "").split(os.pathsep) if p]
+    sys.path[:] = [req["cwd"], *extra] + [p for p in sys.path[1:] if p not in extra]
+
+    # 子进程不能读到 worker 的协议管道
+    null_fd = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(null_fd, 0)
+    out_fd = os.open(req["stdout_path"], os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    err_fd = os.open(req["stderr_path"], os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    os.dup2(out_fd, 1)
+    os.dup2(err_fd, 2)
+    sys.stdout = os.fdopen(1, "w", buffering=1, closefd=False)
+    sys.stderr = os.fdopen(2, "w", buffering=1, closefd=False)
+
+    code = 0
+    try:
+        sys.argv = [req["module"], *req["args"]]
+        runpy.run_module(req["module"], run_name="__main__", alter_sys=True)
+    except SystemExit as e:
+        code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+    except BaseException:
+        import traceback
+        traceback.print_exc()
+        code = 1
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        except BaseException:
+            pass
+    os._exit(code)
+
+
+def _apply_rlimits(limits):
+    for name, value in limits.items():
+        res = getattr(resource, name, None)
+        if res is None:
+            continue
+        soft, hard = resource.getrlimit(res)
+        if hard != resource.RLIM_INFINITY:
+            value = min(value, hard)
+        try:
+            resource.setrlimit(res, (value, hard))
+        except (ValueError, OSError):
+            pass
+
+
+def _killpg(pid, sig):
+    try:
+        os.killpg(pid, sig)
+    except OSError:
+        pass
+
+
+def _poll(pid, deadline):
+    delay = 0.002
+    while True:
+        done, status = os.waitpid(pid, os.WNOHANG)
+        if done:
+            return status
+        if time.monotonic() >= deadline:
+            return None
+        time.sleep(delay)
+        delay = min(delay * 2, 0.05)
+
+
+def _wait(pid, timeout, dump_signal=None):
+    status = _poll(pid, time.monotonic() + timeout)
+    if status is not None:
+        # 测试进程已退出，清理它留下的后代进程
+        _killpg(pid, signal.SIGKILL)
+        return os.waitstatus_to_exitcode(status), False
+    if dump_signal:
+        # 先让进程打印栈（PYTHONFAULTHANDLER），给它一点时间写完
+        _killpg(pid, dump_signal)
+        if _poll(pid, time.monotonic() + 2) is not None:
+            _killpg(pid, signal.SIGKILL)
+            return None, True
+    _killpg(pid, signal.SIGKILL)
+    os.waitpid(pid, 0)
+    return None, True
+
+
+def main():
+    preload = json.loads(sys.argv[1]) if len(sys.argv) > 1 else []
+
+    # 协议使用原始 stdout；之后 fd 1 指向 stderr，避免预导入时的打印污染协议
+    proto = os.fdopen(os.dup(1), "w", buffering=1)
+    os.dup2(2, 1)
+
+    has_pytest = bool(_preload(["pytest"]))
+    loaded = _preload(preload)
+    proto.write(json.dumps({"ready": True, "pytest": has_pytest, "preloaded": loaded}) + "\n")
+
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        req = json.loads(line)
+        pid = os.fork()
+        if pid == 0:
+            _run_child(req)
+        try:
+            # 父进程也设置一次，保证回报 pid 时进程组已经存在
+            os.setpgid(pid, pid)
+        except OSError:
+            pass
+        proto.write(json.dumps({"pid": pid}) + "\n")
+        exit_code, timed_out = _wait(pid, float(req.get("timeout", 60)), req.get("dump_signal"))
+        proto.write(json.dumps({"exit_code": exit_code, "timed_out": timed_out}) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+"""
+pytest 逐用例超时插件（通过 `-p mate_test_timeout` 加载，不依赖本仓库的其他模块）。
+
+单个用例运行超过 MATE_TEST_TIMEOUT 秒时，faulthandler 把所有线程的栈打印到原始 stderr 并结束进程，
+挂起的测试不会占满整次运行的超时，也能看到卡在哪里。
+"""
+import faulthandler
+import os
+import sys
+
+import pytest
+
+# 插件加载时 pytest 尚未接管 fd 2，复制一份原始 stderr，避免栈信息被输出捕获吞掉
+try:
+    _STDERR = os.fdopen(os.dup(2), "w")
+except OSError:
+    _STDERR = sys.__stderr__
+
+
+def _timeout():
+    try:
+        return float(os.environ.get("MATE_TEST_TIMEOUT", "0") or 0)
+    except ValueError:
+        return 0.0
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_protocol(item, nextitem):
+    timeout = _timeout()
+    if timeout > 0:
+        faulthandler.dump_traceback_later(timeout, exit=True, file=_STDERR)
+    try:
+        yield
+    finally:
+        if timeout > 0:
+            faulthandler.cancel_dump_traceback_later()
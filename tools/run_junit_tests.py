@@ -1,12 +1,28 @@
-import subprocess
+import asyncio
 import os
 import re
+import json
+import time
 from datetime import datetime
 from typing import Optional, Type
 
 from crewai.tools import BaseTool
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, PrivateAttr
 
+from tools.cancellation import CancelToken, RunCancelled
+from tools.maven_fastpath import (
+    FastPathUnavailable,
+    junit_timeout_config,
+    resolve_test_classes,
+    run_fast,
+    run_fast_sharded,
+)
+from tools.sandbox import JAVA_DUMP_SIGNAL, java_test_limits, sandboxed_run
+from tools.test_impact import get_impact_store, java_fingerprints
+from tools.test_reports import build_digest, parse_surefire_reports, summarize_by_file, tail_within_budget
+
+# Maven 输出中的错误行（编译错误等没有生成测试报告的情况）
+_MVN_ERROR_RE = re.compile(r"^\[ERROR\]\s*(.*)$")
 
 
 # 1. 定义输入参数 Schema (保持不变)
@@ -19,6 +35,14 @@ class MavenJUnitToolInput(BaseModel):
         None,
         description="可选。指定要运行的测试类或方法（Maven -Dtest 语法）。如 'MyTest' 或 'MyTest#method'。留空则运行全部。"
     )
+    token_budget: int = Field(
+        1500,
+        description="返回摘要的大致 token 预算；完整输出始终写入 log 文件。"
+    )
+    affected_only: bool = Field(
+        False,
+        description="只运行受影响的测试类：自身或引用到的项目类内容自上次运行后有变化、新增、或上次未通过的测试类。"
+    )
 
 
 # 2. 定义带日志功能的工具类
@@ -30,8 +54,91 @@ class MavenJUnitTool(BaseTool):
         "执行结果会自动保存到本地 log 目录中，并将摘要返回给 Agent。"
     )
     args_schema: Type[BaseModel] = MavenJUnitToolInput
+    # 运维配置（config.yaml 的 tools.run_junit_tests），不在 args_schema 中，由部署方决定：
+    # 是否跳过 Maven 生命周期：缓存 classpath、增量编译并直接用 JUnit 启动器运行；不可用时自动退回 mvn test
+    fast_path: bool = True
+    # 并行分片数：>1 时按历史耗时把测试类分到多个 JVM 并行运行（mvn 模式下使用 surefire forkCount），每个分片单独记录日志
+    shards: int = 1
+    # 整次运行的超时（秒）；超时后打印线程转储并结束整个进程组
+    timeout_sec: int = 600
+    # 单个测试方法的超时（秒），超时的用例记为失败并打印线程转储，其余用例继续；0 表示不限制
+    per_test_timeout_sec: int = 60
+    # 当前运行的取消标记（由流水线绑定）；取消时结束 javac / JVM / mvn 进程组
+    _cancel_token: Optional[CancelToken] = PrivateAttr(default=None)
+
+    @staticmethod
+    def _error_lines(stdout: str, token_budget: int) -> str:
+        """没有测试报告时（如编译失败），只返回去重后的 [ERROR] 行"""
+        seen = {}
+        for line in stdout.splitlines():
+            m = _MVN_ERROR_RE.match(line.strip())
+            if m and m.group(1).strip():
+                seen.setdefault(m.group(1).strip(), None)
+        if not seen:
+            return tail_within_budget(stdout, token_budget) if stdout else "No output captured."
+        return tail_within_budget("\n".join(seen), token_budget)
 
-    def _run(self, project_path: str, test_selection: Optional[str] = None) -> str:
+    @staticmethod
+    def _write_log(log_filename: str, command, returncode, stdout: str, stderr: str, note: str = "") -> str:
+        """将一次执行的完整输出写入 log 目录，返回日志路径"""
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        output_lines = []
+        output_lines.append(f"=== Execution Timestamp: {timestamp} ===")
+        output_lines.append(f"=== Command: {' '.join(command)} ===")
+        if note:
+            output_lines.append(f"=== {note} ===")
+        output_lines.append(f"=== Exit Code: {returncode} ===")
+        output_lines.append("\n--- STDOUT ---")
+        output_lines.append(stdout or "")
+
+        if stderr:
+            output_lines.append("\n--- STDERR ---")
+            output_lines.append(stderr)
+
+        log_dir = os.path.join(os.getcwd(), "log")
+        os.makedirs(log_dir, exist_ok=True)
+        log_file_path = os.path.join(log_dir, log_filename)
+        with open(log_file_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(output_lines))
+        return log_file_path
+
+    @staticmethod
+    def _plan_impact(project_path: str, test_selection: Optional[str]):
+        """
+        展开选中的测试类并计算依赖指纹，返回 (units, class_files, fingerprints)；无法分析时返回 None。
+        units：类名 -> 方法列表；class_files：类名 -> 源文件（源码中找不到的类没有条目）。
+        """
+        test_src = os.path.join(project_path, "src", "test", "java")
+        try:
+            units = resolve_test_classes(test_selection, test_src)
+            class_files = {}
+            for fqn in units:
+                path = os.path.join(test_src, *fqn.split(".")) + ".java"
+                if os.path.isfile(path):
+                    class_files[fqn] = path
+            fingerprints = java_fingerprints(project_path, list(class_files.values()),
+                                             extra_inputs=[os.path.join(project_path, "pom.xml")])
+        except Exception:
+            return None
+        return units, class_files, fingerprints
+
+    @staticmethod
+    def _record_impact(impact, cases, returncode) -> None:
+        """按测试类的结论更新影响分析记录（嵌套类归到外部类）；未运行到的类保持原记录"""
+        units, class_files, fingerprints = impact
+        outcomes = {}
+        for key, info in summarize_by_file([dict(c, file=None) for c in cases]).items():
+            path = class_files.get(key.split("$")[0])
+            if path and outcomes.get(path) not in ("error", "failed"):
+                outcomes[path] = info["outcome"]
+        if returncode == 0:
+            for path in class_files.values():
+                outcomes.setdefault(path, "passed")
+        get_impact_store().record(fingerprints, outcomes)
+
+    def _run(self, project_path: str, test_selection: Optional[str] = None, token_budget: int = 1500,
+             affected_only: bool = False) -> str:
+        timeout_sec, per_test_timeout_sec = self.timeout_sec, self.per_test_timeout_sec
         # --- 路径检查 ---
         if not os.path.exists(project_path):
             return f"Error: Project path '{project_path}' does not exist."
@@ -40,78 +147,167 @@ class MavenJUnitTool(BaseTool):
         if not os.path.exists(pom_path):
             return f"Error: No 'pom.xml' found in '{project_path}'."
 
-        # --- 构建命令 ---
-        # 自动检测操作系统使用 mvn 还是 mvn.cmd (Windows兼容性)
-        mvn_cmd = "mvn.cmd" if os.name == 'nt' else "mvn"
-        command = [mvn_cmd, "test"]
-
         # 用于生成文件名的标签
         selection_tag = "all_tests"
-
         if test_selection:
-            command.append(f"-Dtest={test_selection}")
             # 清理文件名中的特殊字符
-            selection_tag = re.sub(r'[^a-zA-Z0-9_\-]', '_', test_selection)
+            selection_tag = re.sub(r'[^a-zA-Z0-9_\-]', '_', test_selection)[:80]
 
-        try:
-            # --- 执行命令 ---
-            print(f"Executing: {' '.join(command)} in {project_path}")
-            result = subprocess.run(
-                command,
-                cwd=project_path,
-                capture_output=True,
-                text=True,
-                check=False,
-                encoding='utf-8',  # 强制 utf-8 防止乱码
-                errors='replace'
+        # --- 影响分析：只保留自身或依赖有变化、新增或上次未通过的测试类 ---
+        impact = self._plan_impact(project_path, test_selection)
+        affected_note = ""
+        if affected_only and impact is not None:
+            units, class_files, fingerprints = impact
+            affected, reasons = get_impact_store().select(fingerprints)
+            affected_set = set(affected)
+            # 源码中找不到的类无法分析，始终保留
+            kept = [fqn for fqn in units if fqn not in class_files or class_files[fqn] in affected_set]
+            if not kept:
+                return (f"No affected tests: all {len(units)} selected test classes passed last time "
+                        f"and nothing they reference changed.")
+            reason_counts = {}
+            for r in reasons.values():
+                reason_counts[r] = reason_counts.get(r, 0) + 1
+            affected_note = (f"Affected-only: running {len(kept)} of {len(units)} test classes "
+                             f"({', '.join(f'{k}: {v}' for k, v in sorted(reason_counts.items()))}).\n")
+            # 路径写法同时被 surefire 与快速路径识别
+            test_selection = ",".join(
+                fqn.replace(".", "/") + ("#" + "+".join(units[fqn]) if units[fqn] else "") for fqn in kept
             )
 
-            # --- 组合输出内容 ---
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            output_lines = []
-            output_lines.append(f"=== Execution Timestamp: {timestamp} ===")
-            output_lines.append(f"=== Command: {' '.join(command)} ===")
-            output_lines.append(f"=== Exit Code: {result.returncode} ===")
-            output_lines.append("\n--- STDOUT ---")
-            output_lines.append(result.stdout)
+        # --- 构建命令 ---
+        # 自动检测操作系统使用 mvn 还是 mvn.cmd (Windows兼容性)
+        mvn_cmd = "mvn.cmd" if os.name == 'nt' else "mvn"
+        command = [mvn_cmd, "test"]
+        if test_selection:
+            command.append(f"-Dtest={test_selection}")
+        # surefire 把用户属性传给测试 JVM，作为 JUnit Jupiter 的配置参数
+        command += [f"-D{k}={v}" for k, v in junit_timeout_config(per_test_timeout_sec).items()]
 
-            if result.stderr:
-                output_lines.append("\n--- STDERR ---")
-                output_lines.append(result.stderr)
+        try:
+            # --- 快速路径：缓存 classpath + 增量 javac + JUnit 控制台启动器 ---
+            fast = None
+            shard_runs = []
+            fallback_reason = ""
+            if self.fast_path:
+                try:
+                    if self.shards > 1:
+                        sharded = run_fast_sharded(project_path, test_selection, self.shards,
+                                                   timeout_sec=timeout_sec, per_test_timeout_sec=per_test_timeout_sec,
+                                                   cancel=self._cancel_token)
+                        fast = sharded["compile"]
+                        shard_runs = list(zip(sharded["plan"], sharded["shards"]))
+                    else:
+                        fast = run_fast(project_path, test_selection, timeout_sec=timeout_sec,
+                                        per_test_timeout_sec=per_test_timeout_sec, cancel=self._cancel_token)
+                except FastPathUnavailable as e:
+                    fallback_reason = str(e)
 
-            full_log_content = "\n".join(output_lines)
+            file_time = datetime.now().strftime("%Y%m%d_%H%M%S")
+            shard_lines = []
+            full_output = None
+            timed_out = False
+            if shard_runs:
+                # 每个分片一个日志文件，汇总日志中只记录分片概况
+                print(f"Executing (fast path): {len(shard_runs)} JUnit shards in {project_path}")
+                command = ["junit-console-launcher", f"--shards={len(shard_runs)}"]
+                cases = [c for _, r in shard_runs for c in r.cases]
+                failing = [r.exit_code if r.exit_code is not None else -1
+                           for _, r in shard_runs if r.exit_code != 0]
+                returncode = failing[0] if failing else 0
+                for i, (classes, r) in enumerate(shard_runs):
+                    shard_log = self._write_log(
+                        f"test_run_{selection_tag}_{file_time}_shard{i}.log",
+                        r.command, r.exit_code, r.stdout, r.stderr,
+                        note=f"Full output: {r.log_file}" if r.log_file else "",
+                    )
+                    status = "timed out" if r.timed_out else f"exit {r.exit_code}"
+                    shard_lines.append(f"shard {i}: {len(classes)} classes, {status}, "
+                                       f"{r.duration:.1f}s, log: {shard_log}")
+                stdout = "\n".join(shard_lines)
+                stderr = ""
+            elif fast is not None:
+                print(f"Executing (fast path): {' '.join(fast.command[:3])} ... in {project_path}")
+                command = fast.command
+                returncode = fast.exit_code if fast.exit_code is not None else -1
+                stdout, stderr = fast.stdout, fast.stderr
+                full_output = fast.log_file
+                timed_out = fast.timed_out
+                cases = fast.cases
+            else:
+                if self.shards > 1:
+                    # 不修改用户 pom：通过属性让 surefire 把测试类分配到多个并行 JVM
+                    command += [f"-DforkCount={self.shards}", "-DreuseForks=true"]
+                # --- 执行命令 ---
+                print(f"Executing: {' '.join(command)} in {project_path}")
+                # 只读取本次运行生成的 surefire 报告（留 1 秒余量应对文件系统时间精度）
+                started_at = time.time() - 1
+                # 受控运行：独立进程组、rlimit、主机级并发名额；输出只在内存中保留首尾片段
+                result = sandboxed_run(command, cwd=project_path, timeout=timeout_sec,
+                                       limits=java_test_limits(timeout_sec), dump_signal=JAVA_DUMP_SIGNAL,
+                                       log_prefix="mvn_test", cancel=self._cancel_token)
+                returncode = result.returncode if result.returncode is not None else -1
+                stdout, stderr = result.stdout, result.stderr
+                full_output = result.log_file
+                timed_out = result.timed_out
+                cases = parse_surefire_reports(project_path, since=started_at)
 
-            # --- 日志记录逻辑 (核心修改) ---
-            # 1. 创建 log 目录 (如果不存在)
-            log_dir = os.path.join(os.getcwd(), "log")
-            os.makedirs(log_dir, exist_ok=True)
+            if impact is not None and not (fast is not None and fast.phase == "compile"):
+                self._record_impact(impact, cases, returncode)
 
-            # 2. 生成带时间戳的文件名
+            # --- 日志记录 ---
             # 格式: test_run_[ClassName]_[YYYYMMDD_HHMMSS].log
-            file_time = datetime.now().strftime("%Y%m%d_%H%M%S")
-            log_filename = f"test_run_{selection_tag}_{file_time}.log"
-            log_file_path = os.path.join(log_dir, log_filename)
-
-            # 3. 写入文件
-            with open(log_file_path, "w", encoding="utf-8") as f:
-                f.write(full_log_content)
+            notes = []
+            if timed_out:
+                notes.append(f"Timed out after {timeout_sec}s, process group killed")
+            if fallback_reason:
+                notes.append(f"Fast path skipped: {fallback_reason}")
+            if full_output:
+                notes.append(f"Output truncated in memory, full output: {full_output}")
+            log_file_path = self._write_log(
+                f"test_run_{selection_tag}_{file_time}.log",
+                command, returncode, stdout, stderr,
+                note=" | ".join(notes),
+            )
 
             # --- 返回给 Agent 的信息 ---
-            # 提示 Agent 日志已保存，并返回部分关键信息，避免 Token 溢出
+            # 提示 Agent 日志已保存；有测试报告时返回逐用例摘要，否则只返回错误行，避免 Token 溢出
+            if cases:
+                digest = build_digest(cases, token_budget=token_budget)
+                detail = "--- Test Results ---\n" + json.dumps(digest, ensure_ascii=False)
+            elif fast is not None and fast.phase == "compile":
+                detail = "--- Compile Errors (javac) ---\n" + tail_within_budget(stdout, token_budget)
+            elif timed_out:
+                detail = (f"--- Timed out after {timeout_sec}s (thread dump at the end of the output) ---\n"
+                          + tail_within_budget(stdout, token_budget))
+            elif shard_runs:
+                detail = "--- No test reports generated ---"
+            else:
+                detail = "--- Build Errors (no test reports generated) ---\n" + self._error_lines(stdout or "", token_budget)
+            if shard_lines:
+                detail = "--- Shards ---\n" + "\n".join(shard_lines) + "\n\n" + detail
+            fast_used = fast is not None or bool(shard_runs)
+            mode = "fast path" if fast_used else "maven"
             summary = (
-                f"Maven Execution Finished (Exit Code: {result.returncode}).\n"
+                f"{'JUnit' if fast_used else 'Maven'} Execution Finished (Exit Code: {returncode}, mode: {mode}).\n"
+                f"{affected_note}"
                 f"Full logs saved to: {log_file_path}\n\n"
-                f"--- Output Snippet (Last 2000 chars) ---\n"
-                f"{result.stdout[-2000:] if result.stdout else 'No output captured.'}"
+                f"{detail}"
             )
 
             return summary
 
+        except RunCancelled as e:
+            return f"Test run cancelled ({e}); the test process group was killed."
         except FileNotFoundError:
             return f"Error: '{mvn_cmd}' not found. Please ensure Maven is installed and in system PATH."
         except Exception as e:
             return f"Error executing Maven tests: {str(e)}"
 
+    async def _arun(self, project_path: str, **kwargs) -> str:
+        # 快速路径（classpath 缓存、增量 javac、分片调度）是同步实现，整体放到线程池执行，不阻塞事件循环
+        return await asyncio.to_thread(self._run, project_path, **kwargs)
+
 if __name__ == '__main__':
     tool = MavenJUnitTool()
 
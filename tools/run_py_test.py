@@ -1,14 +1,53 @@
+import asyncio
 import fnmatch
 import json
 import os
 import py_compile
+import re
 import subprocess
 import sys
+import tempfile
 import traceback
-from typing import Optional, Type, List, Literal, Dict, Any
+from dataclasses import dataclass, field
+from typing import Optional, Type, List, Literal, Dict, Any, Callable, Tuple
 
 from crewai.tools import BaseTool
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, PrivateAttr
+
+from tools.cancellation import CancelToken, RunCancelled
+from tools.py_test_worker import WarmWorkerError, get_warm_worker, warm_worker_supported
+from tools.test_impact import get_impact_store, python_fingerprints
+from tools.test_preflight import validate_files
+from tools.test_reports import (
+    build_digest,
+    estimate_tokens,
+    parse_junit_xml,
+    spill_log,
+    summarize_by_file,
+    tail_within_budget,
+)
+from tools.output_capture import CapturedRun
+from tools.sandbox import (
+    PYTEST_TIMEOUT_PLUGIN,
+    PYTHON_DUMP_SIGNAL,
+    asandboxed_run,
+    pytest_sandbox_env,
+    python_test_limits,
+    sandboxed_run,
+)
+from tools.speculative_runs import SpeculativeResult, get_speculative_runner, speculation_key
+from tools.test_shards import run_sharded
+
+# runner 探测结果缓存：key 为 (解释器, PYTHONPATH)，避免每次都起一个 `pytest --version` 子进程
+_RUNNER_CACHE: Dict[tuple, str] = {}
+
+
+# faulthandler 超时输出：`Timeout (0:00:30)!` 之后是各线程的栈（最近的调用在前）
+_PER_TEST_TIMEOUT_RE = re.compile(r"^Timeout \((\d+:\d\d:\d\d(?:\.\d+)?)\)!$", re.MULTILINE)
+_FRAME_RE = re.compile(r'^\s+File "([^"]+)", line (\d+) in (\S+)$', re.MULTILINE)
+
+# 预检诊断最多返回多少条
+MAX_PREFLIGHT_ERRORS = 30
 
 
 class RunProjectTestsInput(BaseModel):
@@ -64,10 +103,43 @@ class RunProjectTestsInput(BaseModel):
     # 语法检查开关
     precheck_syntax: bool = Field(True, description="是否在运行前对选中的文件做语法检查")
 
+    preflight: bool = Field(
+        True,
+        description="运行前在进程内做静态检查（项目内的导入、属性、调用参数个数、mock.patch 目标），发现问题时直接返回诊断、不启动子进程"
+    )
+
+    affected_only: bool = Field(
+        False,
+        description="只运行受影响的测试：自身或传递导入的 SUT 模块内容自上次运行后有变化、新增、或上次未通过的测试文件"
+    )
+
     # 输出控制
+    token_budget: int = Field(
+        2000,
+        description="返回结果的大致 token 预算：失败摘要与输出片段按预算裁剪，完整输出写入 log_file"
+    )
     verbose: bool = Field(True, description="是否输出更详细的摘要")
 
 
+@dataclass
+class _PreparedRun:
+    """预检通过、待执行的一次运行；同步与 asyncio 两条执行路径共用"""
+    res: Dict[str, Any]
+    project_root_abs: str
+    env: Dict[str, str]
+    timeout_sec: int
+    fingerprints: Dict[str, str]
+    selected: List[str]
+    worker: Any
+    python_executable: str
+    pytest_args: List[str]
+    shards: int
+    sharded: bool = False
+    cmd: List[str] = field(default_factory=list)
+    report_path: Optional[str] = None
+    cancel: Optional[CancelToken] = None
+
+
 class RunProjectGeneratedTestsTool(BaseTool):
     name: str = "run_project_generated_tests"
     description: str = (
@@ -75,6 +147,22 @@ class RunProjectGeneratedTestsTool(BaseTool):
         "Supports file pattern/keyword selection, syntax precheck, and returns detailed errors."
     )
     args_schema: Type[BaseModel] = RunProjectTestsInput
+    # 运维配置（config.yaml 的 tools.run_py_test），不在 args_schema 中，由部署方决定：
+    # 是否使用常驻 worker（预导入 pytest 与 SUT 依赖，每次 fork 干净子进程运行；仅 POSIX，失败自动退回冷启动）
+    warm_worker: bool = True
+    # 并行分片数（仅 pytest）：>1 时按历史耗时把文件分到多个进程并发运行，不在首个失败处停止，返回逐文件的结果
+    shards: int = 1
+    # 若 write_code_file 已在后台预跑过同一内容的单个测试文件，且依赖未变，则直接复用其结果
+    speculative: bool = True
+    # 单个 pytest 用例的超时（秒），超时时打印所有线程的栈并结束该次运行；0 表示不限制
+    per_test_timeout_sec: int = 30
+    # 当前运行的取消标记（由流水线绑定）；取消时结束测试进程组
+    _cancel_token: Optional[CancelToken] = PrivateAttr(default=None)
+
+    def _settings(self, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        """调用参数加上运维配置；运维配置优先，调用方传入的同名参数不生效"""
+        return {**kwargs, "warm_worker": self.warm_worker, "shards": self.shards, "speculative": self.speculative,
+                "per_test_timeout_sec": self.per_test_timeout_sec}
 
     def _abs_tests_dir(self, project_root: str, tests_dir: str) -> str:
         if os.path.isabs(tests_dir):
@@ -147,6 +235,12 @@ class RunProjectGeneratedTestsTool(BaseTool):
     def _detect_runner(self, runner: str, python_executable: str, env: Dict[str, str], cwd: str) -> str:
         if runner != "auto":
             return runner
+        cache_key = (python_executable, env.get("PYTHONPATH", ""))
+        if cache_key not in _RUNNER_CACHE:
+            _RUNNER_CACHE[cache_key] = self._probe_runner(python_executable, env, cwd)
+        return _RUNNER_CACHE[cache_key]
+
+    def _probe_runner(self, python_executable: str, env: Dict[str, str], cwd: str) -> str:
         # 优先尝试 pytest 是否可用
         try:
             p = subprocess.run(
@@ -176,7 +270,217 @@ class RunProjectGeneratedTestsTool(BaseTool):
                 })
         return errors
 
-    def _run(
+    @staticmethod
+    def _collect_report(report_path: Optional[str], project_root_abs: str) -> Optional[List[Dict[str, Any]]]:
+        """读取并删除本次运行的 JUnit XML；没有报告（unittest 或进程崩溃）时返回 None"""
+        if not report_path:
+            return None
+        cases = parse_junit_xml(report_path, root_dir=project_root_abs)
+        try:
+            has_report = os.path.getsize(report_path) > 0
+            os.unlink(report_path)
+        except OSError:
+            has_report = False
+        return cases if has_report else None
+
+    def _classify(self, res: Dict[str, Any], cases: Optional[List[Dict[str, Any]]]) -> None:
+        """根据结构化用例结果设置 error_type / summary；没有结构化结果时退回到输出文本匹配"""
+        failing = [c for c in (cases or []) if c["outcome"] in ("failed", "error")]
+        if failing:
+            import_err = any(
+                "modulenotfounderror" in (c["message"] + c["text"]).lower()
+                or "importerror" in (c["message"] + c["text"]).lower()
+                for c in failing
+            )
+            n_failed = sum(1 for c in failing if c["outcome"] == "failed")
+            n_error = len(failing) - n_failed
+            counts_text = f"{n_failed} failed, {n_error} error, {len(cases) - len(failing)} other"
+            if import_err:
+                res["error_type"] = "ImportError"
+                res["summary"] = f"Import failed (ModuleNotFoundError/ImportError); {counts_text}."
+            elif n_failed:
+                res["error_type"] = "TestFailure"
+                res["summary"] = f"Tests failed; {counts_text}."
+            else:
+                res["error_type"] = "RuntimeError"
+                res["summary"] = f"Tests errored during execution; {counts_text}."
+            return
+
+        # 逐用例超时：faulthandler 打印栈后结束进程，没有 JUnit 报告
+        hung = _PER_TEST_TIMEOUT_RE.search(res["stderr"])
+        if hung:
+            frames = _FRAME_RE.findall(res["stderr"][hung.end():])
+            where = f" Innermost frames: {'; '.join(f'{f}:{n} in {fn}' for f, n, fn in frames[:3])}." if frames else ""
+            res["error_type"] = "TestTimeout"
+            res["summary"] = f"A test exceeded the per-test timeout ({hung.group(1)}); stack dump is in stderr.{where}"
+            return
+
+        combined = (res["stdout"] + "\n" + res["stderr"]).lower()
+        if "modulenotfounderror" in combined or "importerror" in combined:
+            res["error_type"] = "ImportError"
+            res["summary"] = "Import failed (ModuleNotFoundError/ImportError)."
+        elif "assertionerror" in combined or "failed" in combined:
+            res["error_type"] = "TestFailure"
+            res["summary"] = "Tests failed (assertion failure)."
+        else:
+            res["error_type"] = "RuntimeError"
+            res["summary"] = "Tests errored during execution."
+
+    @staticmethod
+    def _record_impact(fingerprints: Dict[str, str], res: Dict[str, Any],
+                       cases: Optional[List[Dict[str, Any]]]) -> None:
+        """按本次运行的逐文件结论更新影响分析记录；未运行到的文件保持原记录"""
+        outcomes = {f: info["outcome"] for f, info in summarize_by_file(cases or []).items()}
+        for f, info in (res.get("per_file") or {}).items():
+            outcomes[f] = "passed" if info["outcome"] == "no_tests" else info["outcome"]
+        if res["exit_code"] == 0:
+            for f in fingerprints:
+                outcomes.setdefault(f, "passed")
+        get_impact_store().record(fingerprints, outcomes)
+
+    def _finish(self, res: Dict[str, Any], cases: Optional[List[Dict[str, Any]]], token_budget: int,
+                fingerprints: Optional[Dict[str, str]] = None) -> str:
+        """
+        生成返回给 Agent 的紧凑 JSON：
+        - tests：结构化摘要（计数 + 去重裁剪后的失败回溯）
+        - 原始输出超出预算时完整写入 log_file，stdout/stderr 只保留结尾片段
+        """
+        if fingerprints and res["phase"] == "test_run":
+            self._record_impact(fingerprints, res, cases)
+        if cases is not None:
+            res["tests"] = build_digest(cases, token_budget=token_budget)
+        stdout, stderr = res["stdout"] or "", res["stderr"] or ""
+        # 有结构化摘要时原始输出只是辅助，给更小的预算
+        raw_budget = token_budget // 4 if cases else token_budget // 2
+        if estimate_tokens(stdout) + estimate_tokens(stderr) > raw_budget:
+            # 捕获阶段已截断的输出已有完整日志，不再重复落盘
+            if not res.get("log_file"):
+                res["log_file"] = spill_log(f"--- STDOUT ---\n{stdout}\n--- STDERR ---\n{stderr}", "pytest_run")
+            res["stdout"] = tail_within_budget(stdout, raw_budget // 2)
+            res["stderr"] = tail_within_budget(stderr, raw_budget // 2)
+        return json.dumps(res, ensure_ascii=False)
+
+    def _run_sharded(self, res: Dict[str, Any], selected: List[str], shards: int, python_executable: str,
+                     pytest_extra_args: List[str], project_root_abs: str, env: Dict[str, str],
+                     timeout_sec: int, fingerprints: Dict[str, str],
+                     cancel: Optional[CancelToken] = None) -> SpeculativeResult:
+        merged = run_sharded(
+            selected,
+            shards,
+            python_executable=python_executable,
+            pytest_args=pytest_extra_args,
+            cwd=project_root_abs,
+            env=env,
+            timeout_sec=timeout_sec,
+            cancel=cancel,
+        )
+        res["exit_code"] = merged["exit_code"]
+        res["stdout"] = merged["stdout"]
+        res["stderr"] = merged["stderr"]
+        res["shards"] = merged["shards"]
+        res["per_file"] = merged["per_file"]
+
+        counts = {"passed": 0, "failed": 0, "error": 0}
+        for info in merged["per_file"].values():
+            counts[info["outcome"]] = counts.get(info["outcome"], 0) + 1
+        counts_text = f"{counts['passed']} passed, {counts['failed']} failed, {counts['error']} error (files)"
+
+        if merged["exit_code"] == 0:
+            res["ok"] = True
+            res["summary"] = f"Selected tests passed ({len(merged['shards'])} shards)."
+        elif merged["timed_out"]:
+            res["error_type"] = "TimeoutError"
+            res["summary"] = f"Some shards exceeded timeout ({timeout_sec}s); {counts_text}."
+        else:
+            self._classify(res, merged["cases"])
+            res["summary"] = f"Sharded run finished with failures: {counts_text}. {res['summary']}"
+        return res, merged["cases"], fingerprints
+
+    def _run(self, project_root: str, tests_dir: str, token_budget: int = 2000, **kwargs) -> str:
+        res, cases, fingerprints = self._evaluate(project_root, tests_dir, cancel=self._cancel_token,
+                                                  **self._settings(kwargs))
+        return self._finish(res, cases, token_budget, fingerprints)
+
+    async def _arun(self, project_root: str, tests_dir: str, token_budget: int = 2000, **kwargs) -> str:
+        res, cases, fingerprints = await self._aevaluate(project_root, tests_dir, cancel=self._cancel_token,
+                                                         **self._settings(kwargs))
+        return self._finish(res, cases, token_budget, fingerprints)
+
+    def speculate(self, test_file: str, project_root: str, extra_pythonpath: Optional[str] = None) -> bool:
+        """
+        在后台预跑单个刚写入的测试文件（使用默认参数），结果留给随后的运行调用。
+        文件被重写、或依赖的 SUT 内容变化时结果自动作废。
+        """
+        test_file = os.path.abspath(test_file)
+
+        def job(on_key):
+            return self._evaluate(
+                project_root,
+                os.path.dirname(test_file),
+                **self._settings({
+                    "selected_files": [test_file],
+                    "extra_pythonpath": extra_pythonpath,
+                    "on_key": on_key,
+                }),
+            )
+
+        return get_speculative_runner().submit(test_file, job)
+
+    def _evaluate(self, project_root: str, tests_dir: str, cancel: Optional[CancelToken] = None,
+                  **kwargs) -> SpeculativeResult:
+        """
+        执行选择、预检与运行，返回 (res, cases, fingerprints)，由 _run 统一生成摘要。
+        参数见 _prepare；cancel 被取消时结束测试进程组，结果的 error_type 为 Cancelled。
+        后台预跑不传 cancel：预跑结果可能被之后的运行复用，不随某一次运行取消。
+        """
+        done, run = self._prepare(project_root, tests_dir, **kwargs)
+        if done is not None:
+            return done
+        run.cancel = cancel
+        try:
+            if run.sharded:
+                return self._run_sharded(run.res, run.selected, run.shards, run.python_executable, run.pytest_args,
+                                         run.project_root_abs, run.env, run.timeout_sec, run.fingerprints, cancel)
+            proc = self._run_warm(run)
+            if proc is None:
+                # 独立进程组 + rlimit + 主机级并发名额；超时先打印栈再结束整组
+                proc = self._completed(run, sandboxed_run(
+                    run.cmd, cwd=run.project_root_abs, env=run.env, timeout=run.timeout_sec,
+                    limits=python_test_limits(run.timeout_sec), dump_signal=PYTHON_DUMP_SIGNAL,
+                    log_prefix="pytest_run", cancel=cancel,
+                ))
+            return self._conclude(run, proc)
+        except Exception as e:
+            return self._fail(run, e)
+
+    async def _aevaluate(self, project_root: str, tests_dir: str, cancel: Optional[CancelToken] = None,
+                         **kwargs) -> SpeculativeResult:
+        """
+        _evaluate 的 asyncio 版本：冷启动运行用 asyncio 子进程，不占用线程；
+        选择、影响分析与静态预检是 CPU 密集的，常驻 worker 与分片运行有各自的同步协议，这几步放到线程池执行。
+        """
+        done, run = await asyncio.to_thread(self._prepare, project_root, tests_dir, **kwargs)
+        if done is not None:
+            return done
+        run.cancel = cancel
+        try:
+            if run.sharded:
+                return await asyncio.to_thread(
+                    self._run_sharded, run.res, run.selected, run.shards, run.python_executable, run.pytest_args,
+                    run.project_root_abs, run.env, run.timeout_sec, run.fingerprints, cancel,
+                )
+            proc = await asyncio.to_thread(self._run_warm, run) if run.worker is not None else None
+            if proc is None:
+                proc = self._completed(run, await asandboxed_run(
+                    run.cmd, cwd=run.project_root_abs, env=run.env, timeout=run.timeout_sec,
+                    limits=python_test_limits(run.timeout_sec), dump_signal=PYTHON_DUMP_SIGNAL,
+                    log_prefix="pytest_run", cancel=cancel,
+                ))
+            return self._conclude(run, proc)
+        except Exception as e:
+            return self._fail(run, e)
+
+    def _prepare(
         self,
         project_root: str,
         tests_dir: str,
@@ -187,17 +491,30 @@ class RunProjectGeneratedTestsTool(BaseTool):
         runner: str = "auto",
         python_executable: str = sys.executable,
         timeout_sec: int = 60,
+        per_test_timeout_sec: int = 30,
         pytest_extra_args: List[str] = None,
         unittest_pattern: str = "test*.py",
         extra_pythonpath: Optional[str] = None,
         precheck_syntax: bool = True,
+        preflight: bool = True,
+        warm_worker: bool = True,
+        shards: int = 1,
+        affected_only: bool = False,
         verbose: bool = True,
-    ) -> str:
+        speculative: bool = True,
+        on_key: Optional[Callable[[str], None]] = None,
+    ) -> Tuple[Optional[SpeculativeResult], Optional[_PreparedRun]]:
+        """
+        运行前的全部步骤：选择、影响分析、预跑结果复用、语法检查、静态预检，最后组装命令。
+        返回 (结果, None) 表示无需启动子进程；否则返回 (None, 待执行的运行)。
+        on_key 不为空时表示这是一次后台预跑：算出复用 key 后上报，不再查找预跑结果。
+        """
         include_patterns = include_patterns or ["test_*.py", "*_test.py"]
         exclude_patterns = exclude_patterns or []
         include_keywords = include_keywords or []
         selected_files = selected_files or []
         pytest_extra_args = pytest_extra_args or ["-q", "--maxfail=1", "-s"]
+        fingerprints: Dict[str, str] = {}
 
         res: Dict[str, Any] = {
             "ok": False,
@@ -206,8 +523,9 @@ class RunProjectGeneratedTestsTool(BaseTool):
             "runner": None,
             "selected_count": 0,
             "selected_files": [],
-            "phase": None,  # selection | syntax_check | test_run | tool_error
+            "phase": None,  # selection | syntax_check | preflight | test_run | tool_error
             "syntax_errors": [],
+            "preflight_errors": [],
             "exit_code": None,
             "stdout": "",
             "stderr": "",
@@ -223,7 +541,7 @@ class RunProjectGeneratedTestsTool(BaseTool):
             if not os.path.isdir(tests_dir_abs):
                 res["error_type"] = "PathError"
                 res["summary"] = f"tests_dir not found: {tests_dir_abs}"
-                return json.dumps(res, ensure_ascii=False, indent=2)
+                return (res, None, {}), None
 
             selected = self._select_files(
                 tests_dir_abs,
@@ -238,12 +556,63 @@ class RunProjectGeneratedTestsTool(BaseTool):
             if not selected:
                 res["ok"] = True
                 res["summary"] = "No test files selected (nothing to run)."
-                return json.dumps(res, ensure_ascii=False, indent=2)
+                return (res, None, {}), None
 
-            env = self._prepare_env(project_root_abs, extra_pythonpath)
-            runner_use = self._detect_runner(runner, python_executable, env, project_root_abs)
+            # 影响分析：测试文件 + 传递依赖的内容指纹；分析失败不影响运行本身
+            try:
+                fingerprints = python_fingerprints(project_root_abs, selected)
+            except Exception:
+                fingerprints = {}
+            if affected_only and fingerprints:
+                affected, reasons = get_impact_store().select(fingerprints)
+                res["skipped_unaffected"] = len(selected) - len(affected)
+                res["affected_reasons"] = {os.path.relpath(f, project_root_abs): r for f, r in reasons.items()}
+                selected = affected
+                res["selected_count"] = len(selected)
+                res["selected_files"] = selected
+                if not selected:
+                    res["ok"] = True
+                    res["summary"] = "No affected tests: all selected tests passed last time and nothing they depend on changed."
+                    return (res, None, {}), None
+
+            env = pytest_sandbox_env(self._prepare_env(project_root_abs, extra_pythonpath), per_test_timeout_sec)
+
+            # 常驻 worker：启动时已确认 pytest 是否可用，无需再探测
+            worker = None
+            if warm_worker and warm_worker_supported():
+                try:
+                    # 影响分析已刷新过符号索引时，worker 指纹直接复用
+                    worker = get_warm_worker(python_executable, project_root_abs, env, tests_dir_abs,
+                                             index_fresh=bool(fingerprints))
+                except WarmWorkerError:
+                    worker = None
+            if worker is not None and runner == "auto":
+                runner_use = "pytest" if worker.has_pytest else "unittest"
+            else:
+                runner_use = self._detect_runner(runner, python_executable, env, project_root_abs)
             res["runner"] = runner_use
 
+            # 预跑结果：同一文件、同一依赖指纹、同一运行参数时直接复用
+            if fingerprints and len(selected) == 1 and (on_key is not None or speculative):
+                # unittest 未显式指定文件时按目录 discover，命令与单文件运行不同
+                mode = (pytest_extra_args, per_test_timeout_sec) if runner_use == "pytest" else (
+                    None if selected_files else (tests_dir_abs, unittest_pattern))
+                key = speculation_key(
+                    selected[0], fingerprints.get(selected[0]), runner_use, python_executable, mode,
+                    extra_pythonpath, precheck_syntax, preflight,
+                )
+                if on_key is not None:
+                    on_key(key)
+                else:
+                    hit = get_speculative_runner().take(selected[0], key, timeout=timeout_sec)
+                    if hit is not None:
+                        spec_res, spec_cases, _ = hit
+                        for name in ("tests_dir", "skipped_unaffected", "affected_reasons"):
+                            if name in res:
+                                spec_res[name] = res[name]
+                        spec_res["speculative"] = True
+                        return (spec_res, spec_cases, fingerprints), None
+
             # 语法预检查（可选）
             if precheck_syntax:
                 res["phase"] = "syntax_check"
@@ -253,61 +622,48 @@ class RunProjectGeneratedTestsTool(BaseTool):
                     res["ok"] = False
                     res["error_type"] = "SyntaxError"
                     res["summary"] = f"Syntax check failed for {len(syn_errs)} file(s)."
-                    return json.dumps(res, ensure_ascii=False, indent=2)
+                    return (res, None, {}), None
+
+            # 静态预检：能确定的导入 / 属性 / 参数错误不必启动子进程
+            if preflight:
+                res["phase"] = "preflight"
+                try:
+                    diags = validate_files(selected, project_root_abs, extra_pythonpath)
+                except Exception:
+                    diags = []
+                if diags:
+                    res["preflight_errors"] = [
+                        {**d, "file": os.path.relpath(d["file"], project_root_abs)} for d in diags[:MAX_PREFLIGHT_ERRORS]
+                    ]
+                    res["error_type"] = diags[0]["error_type"]
+                    res["summary"] = (f"Static pre-flight check found {len(diags)} problem(s); tests were not run. "
+                                      f"Fix them, or pass preflight=False if a finding is wrong.")
+                    return (res, None, {}), None
 
             # 运行测试
             res["phase"] = "test_run"
-            if runner_use == "pytest":
-                # 直接把选中的文件列表传给 pytest
-                cmd = [python_executable, "-m", "pytest", *pytest_extra_args, *selected]
+            # 逐用例超时插件；超时值由环境变量传入，0 时插件不生效
+            pytest_args = [*pytest_extra_args, "-p", PYTEST_TIMEOUT_PLUGIN]
+            run = _PreparedRun(res=res, project_root_abs=project_root_abs, env=env, timeout_sec=timeout_sec,
+                               fingerprints=fingerprints, selected=selected, worker=worker,
+                               python_executable=python_executable, pytest_args=pytest_args, shards=shards)
+            if runner_use == "pytest" and shards > 1 and len(selected) > 1:
+                run.sharded = True
+            elif runner_use == "pytest":
+                # 直接把选中的文件列表传给 pytest，并生成 JUnit XML 以获得逐用例结果
+                fd, run.report_path = tempfile.mkstemp(prefix="mate_junit_", suffix=".xml")
+                os.close(fd)
+                run.cmd = [python_executable, "-m", "pytest", *pytest_args,
+                           "-o", "junit_family=xunit1", "--junitxml", run.report_path, *selected]
             else:
                 # unittest discover 只能按目录+pattern，没法精确到“文件集合”
                 # 做法：如果用户显式 selected_files，则逐个文件运行；否则 discover
                 if selected_files:
-                    cmd = [python_executable, "-m", "unittest", *selected]
+                    run.cmd = [python_executable, "-m", "unittest", *selected]
                 else:
-                    cmd = [python_executable, "-m", "unittest", "discover", "-s", tests_dir_abs, "-p", unittest_pattern]
-
-            proc = subprocess.run(
-                cmd,
-                cwd=project_root_abs,
-                env=env,
-                capture_output=True,
-                text=True,
-                timeout=timeout_sec,
-            )
-
-            res["exit_code"] = proc.returncode
-            res["stdout"] = proc.stdout or ""
-            res["stderr"] = proc.stderr or ""
-
-            if proc.returncode == 0:
-                res["ok"] = True
-                res["summary"] = "Selected tests passed."
-                return json.dumps(res, ensure_ascii=False, indent=2)
-
-            # 错误分类
-            combined = (res["stdout"] + "\n" + res["stderr"]).lower()
-            if "modulenotfounderror" in combined or "importerror" in combined:
-                res["error_type"] = "ImportError"
-                res["summary"] = "Import failed (ModuleNotFoundError/ImportError)."
-            elif "assertionerror" in combined or "failed" in combined:
-                res["error_type"] = "TestFailure"
-                res["summary"] = "Tests failed (assertion failure)."
-            else:
-                res["error_type"] = "RuntimeError"
-                res["summary"] = "Tests errored during execution."
-
-            return json.dumps(res, ensure_ascii=False, indent=2)
-
-        except subprocess.TimeoutExpired as e:
-            res["ok"] = False
-            res["phase"] = "test_run"
-            res["error_type"] = "TimeoutError"
-            res["summary"] = f"Test execution exceeded timeout ({timeout_sec}s)."
-            res["stdout"] = (e.stdout or "") if hasattr(e, "stdout") else ""
-            res["stderr"] = (e.stderr or "") if hasattr(e, "stderr") else ""
-            return json.dumps(res, ensure_ascii=False, indent=2)
+                    run.cmd = [python_executable, "-m", "unittest", "discover", "-s", tests_dir_abs,
+                               "-p", unittest_pattern]
+            return None, run
 
         except Exception:
             res["ok"] = False
@@ -315,4 +671,76 @@ class RunProjectGeneratedTestsTool(BaseTool):
             res["error_type"] = "ToolError"
             res["summary"] = "Tool crashed unexpectedly."
             res["stderr"] = traceback.format_exc()
-            return json.dumps(res, ensure_ascii=False, indent=2)
+            return (res, None, {}), None
+
+    def _run_warm(self, run: _PreparedRun) -> Optional[subprocess.CompletedProcess]:
+        """在常驻 worker 中运行；没有 worker 或 worker 不可用时返回 None，由调用方冷启动"""
+        if run.worker is None:
+            return None
+        cmd = run.cmd
+        try:
+            warm = run.worker.run(cmd[2], cmd[3:], cwd=run.project_root_abs, env=run.env, timeout=run.timeout_sec,
+                                  limits=python_test_limits(run.timeout_sec), dump_signal=PYTHON_DUMP_SIGNAL,
+                                  cancel=run.cancel)
+        except WarmWorkerError:
+            return None
+        if warm.log_file:
+            run.res["log_file"] = warm.log_file
+        if warm.timed_out:
+            raise subprocess.TimeoutExpired(cmd, run.timeout_sec, output=warm.stdout, stderr=warm.stderr)
+        return subprocess.CompletedProcess(cmd, warm.exit_code, warm.stdout, warm.stderr)
+
+    @staticmethod
+    def _completed(run: _PreparedRun, captured: CapturedRun) -> subprocess.CompletedProcess:
+        if captured.log_file:
+            run.res["log_file"] = captured.log_file
+        if captured.queued_sec >= 0.1:
+            run.res["queued_sec"] = captured.queued_sec
+        if captured.timed_out:
+            raise subprocess.TimeoutExpired(run.cmd, run.timeout_sec, output=captured.stdout, stderr=captured.stderr)
+        return subprocess.CompletedProcess(run.cmd, captured.returncode, captured.stdout, captured.stderr)
+
+    def _conclude(self, run: _PreparedRun, proc: subprocess.CompletedProcess) -> SpeculativeResult:
+        res = run.res
+        res["exit_code"] = proc.returncode
+        res["stdout"] = proc.stdout or ""
+        res["stderr"] = proc.stderr or ""
+        cases = self._collect_report(run.report_path, run.project_root_abs)
+
+        if proc.returncode == 0:
+            res["ok"] = True
+            res["summary"] = "Selected tests passed."
+            return res, cases, run.fingerprints
+
+        # 错误分类
+        self._classify(res, cases)
+        return res, cases, run.fingerprints
+
+    def _fail(self, run: _PreparedRun, e: Exception) -> SpeculativeResult:
+        res = run.res
+        res["ok"] = False
+        if isinstance(e, subprocess.TimeoutExpired):
+            res["phase"] = "test_run"
+            res["error_type"] = "TimeoutError"
+            res["summary"] = f"Test execution exceeded timeout ({run.timeout_sec}s)."
+            res["stdout"] = e.stdout or ""
+            res["stderr"] = e.stderr or ""
+            if isinstance(res["stdout"], bytes):
+                res["stdout"] = res["stdout"].decode("utf-8", "replace")
+            if isinstance(res["stderr"], bytes):
+                res["stderr"] = res["stderr"].decode("utf-8", "replace")
+            return res, self._collect_report(run.report_path, run.project_root_abs), run.fingerprints
+
+        if isinstance(e, RunCancelled):
+            # 结果不完整，不计入影响分析
+            res["phase"] = "test_run"
+            res["error_type"] = "Cancelled"
+            res["summary"] = f"Test run cancelled ({e}); the test process group was killed."
+            self._collect_report(run.report_path, run.project_root_abs)
+            return res, None, {}
+
+        res["phase"] = "tool_error"
+        res["error_type"] = "ToolError"
+        res["summary"] = "Tool crashed unexpectedly."
+        res["stderr"] = "".join(traceback.format_exception(type(e), e, e.__traceback__))
+        return res, self._collect_report(run.report_path, run.project_root_abs), {}
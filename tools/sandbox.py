@@ -0,0 +1,264 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import shutil
+import signal
+import sys
+import tempfile
+import time
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, Iterator, List, Optional
+
+from tools.cancellation import CancelToken
+from tools.output_capture import CapturedRun, arun_captured, run_captured
+
+try:
+    import fcntl
+except ImportError:  # Windows：没有跨进程的主机级信号量
+    fcntl = None
+
+# 在目标进程 exec 之前设置 rlimit 的启动脚本（不依赖本仓库的其他模块）
+_LAUNCHER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sandbox_launch.py")
+
+# 每台主机同时运行的测试进程数：优先取环境变量，默认 CPU 核数
+SLOTS_ENV = "MATE_TEST_SLOTS"
+DEFAULT_SLOT_DIR = os.path.join(tempfile.gettempdir(), "mate_test_slots")
+
+# pytest 逐用例超时插件（tools/pytest_plugins/mate_test_timeout.py）及其读取的环境变量
+PYTEST_PLUGIN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pytest_plugins")
+PYTEST_TIMEOUT_PLUGIN = "mate_test_timeout"
+PER_TEST_TIMEOUT_ENV = "MATE_TEST_TIMEOUT"
+
+# 整体超时后、强制结束前发给进程组的信号：
+# Python 进程开启 PYTHONFAULTHANDLER 后收到 SIGABRT 会打印所有线程的栈；JVM 收到 SIGQUIT 打印线程转储
+PYTHON_DUMP_SIGNAL = getattr(signal, "SIGABRT", None)
+JAVA_DUMP_SIGNAL = getattr(signal, "SIGQUIT", None)
+
+
+def _user_tasks() -> Optional[int]:
+    """当前用户已有的任务（进程 + 线程）数；RLIMIT_NPROC 在 Linux 上按用户统计。无法统计时返回 None"""
+    if not os.path.isdir("/proc/self/task"):
+        return None
+    uid = os.getuid()
+    count = 0
+    for pid in os.listdir("/proc"):
+        if not pid.isdigit():
+            continue
+        try:
+            if os.stat(f"/proc/{pid}").st_uid == uid:
+                count += len(os.listdir(f"/proc/{pid}/task"))
+        except OSError:
+            continue
+    return count
+
+
+@dataclass
+class ResourceLimits:
+    """测试进程（及其后代）的资源上限；None 表示不限制"""
+    cpu_sec: Optional[int] = None
+    address_space_mb: Optional[int] = None
+    open_files: Optional[int] = None
+    # 在当前用户已有任务数之上还允许新建多少进程 / 线程，用于拦住 fork 炸弹
+    processes: Optional[int] = None
+
+    def rlimits(self) -> Dict[str, int]:
+        out: Dict[str, int] = {}
+        if self.cpu_sec:
+            out["RLIMIT_CPU"] = int(self.cpu_sec)
+        if self.address_space_mb:
+            out["RLIMIT_AS"] = int(self.address_space_mb) * 1024 * 1024
+        if self.open_files:
+            out["RLIMIT_NOFILE"] = int(self.open_files)
+        # root 不受 RLIMIT_NPROC 约束，也就不必统计
+        if self.processes and hasattr(os, "getuid") and os.getuid() != 0:
+            existing = _user_tasks()
+            if existing is not None:
+                out["RLIMIT_NPROC"] = existing + int(self.processes)
+        return out
+
+
+def python_test_limits(timeout_sec: float) -> ResourceLimits:
+    # CPU 时间留出多线程余量，主要拦截脱离进程组后仍在空转的进程
+    return ResourceLimits(cpu_sec=int(timeout_sec * 2) + 30, address_space_mb=8192,
+                          open_files=1024, processes=256)
+
+
+def java_test_limits(timeout_sec: float) -> ResourceLimits:
+    # JVM 启动时会预留大量虚拟地址空间，不限制 RLIMIT_AS；JIT / GC 线程多，CPU 与任务数放宽
+    return ResourceLimits(cpu_sec=int(timeout_sec * 4) + 60, open_files=4096, processes=1024)
+
+
+class HostSlots:
+    """
+    主机级信号量：slot_dir 下的 N 个锁文件，进程持有其中一个的 flock 即占用一个名额。
+    跨进程（多个 Flask worker、多个 Agent）共享，进程退出时锁自动释放。
+    """
+
+    def __init__(self, slots: Optional[int] = None, slot_dir: str = DEFAULT_SLOT_DIR):
+        self.slots = max(1, int(slots or os.environ.get(SLOTS_ENV) or os.cpu_count() or 1))
+        self.slot_dir = slot_dir
+
+    def _open_slot(self, i: int) -> Optional[int]:
+        """
+        打开第 i 个名额的锁文件；没有权限打开（其他用户按自己的 umask 创建）时返回 None。
+        flock 不需要写权限，读写打开失败时退回只读打开。
+        """
+        path = os.path.join(self.slot_dir, f"slot_{i}.lock")
+        try:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_EXCL, 0o666)
+        except FileExistsError:
+            for flags in (os.O_RDWR, os.O_RDONLY):
+                try:
+                    return os.open(path, flags)
+                except OSError:
+                    continue
+            return None
+        except OSError:
+            return None
+        try:
+            # 新建的锁文件不受 umask 影响，其他用户也能打开
+            os.fchmod(fd, 0o666)
+        except OSError:
+            pass
+        return fd
+
+    def _try_lock(self) -> Optional[int]:
+        """尝试占用任意一个空闲名额，返回持有 flock 的 fd；全部被占用时返回 None"""
+        if not os.path.isdir(self.slot_dir):
+            os.makedirs(self.slot_dir, exist_ok=True)
+            try:
+                # 多个用户共用同一台构建机
+                os.chmod(self.slot_dir, 0o1777)
+            except OSError:
+                pass
+        usable = 0
+        for i in range(self.slots):
+            fd = self._open_slot(i)
+            if fd is None:
+                continue
+            usable += 1
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                os.close(fd)
+                continue
+            return fd
+        own_dir = f"{self.slot_dir.rstrip(os.sep)}_{os.getuid()}" if os.name == "posix" else None
+        if not usable and own_dir and not self.slot_dir.endswith(f"_{os.getuid()}"):
+            # 一个锁文件都打不开（目录属于其他用户且不可写）：改用本用户自己的名额目录
+            self.slot_dir = own_dir
+            return self._try_lock()
+        return None
+
+    @staticmethod
+    def _unlock(fd: int) -> None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+    @contextmanager
+    def acquire(self, poll_sec: float = 0.05, cancel: Optional[CancelToken] = None) -> Iterator[float]:
+        """占用一个名额直到退出上下文；产出排队等待的秒数。排队期间被取消时抛出 RunCancelled"""
+        if fcntl is None:
+            yield 0.0
+            return
+        start = time.monotonic()
+        fd = self._try_lock()
+        while fd is None:
+            if cancel is not None:
+                cancel.check()
+            time.sleep(poll_sec)
+            fd = self._try_lock()
+        try:
+            yield time.monotonic() - start
+        finally:
+            self._unlock(fd)
+
+    @asynccontextmanager
+    async def aacquire(self, poll_sec: float = 0.05, cancel: Optional[CancelToken] = None) -> AsyncIterator[float]:
+        """acquire 的 asyncio 版本：排队时让出事件循环而不是阻塞线程"""
+        if fcntl is None:
+            yield 0.0
+            return
+        start = time.monotonic()
+        fd = self._try_lock()
+        while fd is None:
+            if cancel is not None:
+                cancel.check()
+            await asyncio.sleep(poll_sec)
+            fd = self._try_lock()
+        try:
+            yield time.monotonic() - start
+        finally:
+            self._unlock(fd)
+
+
+_SLOTS: Optional[HostSlots] = None
+
+
+def get_host_slots() -> HostSlots:
+    global _SLOTS
+    if _SLOTS is None:
+        _SLOTS = HostSlots()
+    return _SLOTS
+
+
+def _sandbox_command(cmd: List[str], env: Optional[Dict[str, str]],
+                     limits: Optional[ResourceLimits]) -> List[str]:
+    """检查命令存在，并在需要 rlimit 时包上启动脚本"""
+    search_path = (env or os.environ).get("PATH")
+    if not os.path.isfile(cmd[0]) and shutil.which(cmd[0], path=search_path) is None:
+        raise FileNotFoundError(cmd[0])
+    rlimits = limits.rlimits() if limits is not None and os.name == "posix" else {}
+    return [sys.executable, "-I", "-S", _LAUNCHER, json.dumps(rlimits), *cmd] if rlimits else cmd
+
+
+def sandboxed_run(cmd: List[str], *, cwd: Optional[str] = None, env: Optional[Dict[str, str]] = None,
+                  timeout: float, limits: Optional[ResourceLimits] = None, dump_signal: Optional[int] = None,
+                  log_prefix: str = "subprocess", slots: Optional[HostSlots] = None,
+                  cancel: Optional[CancelToken] = None) -> CapturedRun:
+    """
+    在受控环境中运行一个测试进程：
+    - 占用一个主机级名额（名额用尽时排队）
+    - 独立进程组，rlimit 在 exec 之前设置，后代进程一并继承
+    - 超时后先发 dump_signal 打印栈，再强制结束整个进程组；正常退出后也清理残留的后代进程
+    - cancel 被取消时（排队中或运行中）结束整个进程组并抛出 RunCancelled
+    输出按 run_captured 的方式有界捕获；命令不存在时抛出 FileNotFoundError。
+    """
+    wrapped = _sandbox_command(cmd, env, limits)
+    with (slots or get_host_slots()).acquire(cancel=cancel) as queued:
+        result = run_captured(wrapped, cwd=cwd, env=env, timeout=timeout, log_prefix=log_prefix,
+                              new_group=True, dump_signal=dump_signal, cancel=cancel)
+    result.queued_sec = round(queued, 3)
+    return result
+
+
+async def asandboxed_run(cmd: List[str], *, cwd: Optional[str] = None, env: Optional[Dict[str, str]] = None,
+                         timeout: float, limits: Optional[ResourceLimits] = None,
+                         dump_signal: Optional[int] = None, log_prefix: str = "subprocess",
+                         slots: Optional[HostSlots] = None, cancel: Optional[CancelToken] = None) -> CapturedRun:
+    """
+    sandboxed_run 的 asyncio 版本：排队与运行期间都不占用线程。
+    协程被取消或 cancel 被取消时结束整个进程组。
+    """
+    wrapped = _sandbox_command(cmd, env, limits)
+    async with (slots or get_host_slots()).aacquire(cancel=cancel) as queued:
+        result = await arun_captured(wrapped, cwd=cwd, env=env, timeout=timeout, log_prefix=log_prefix,
+                                     new_group=True, dump_signal=dump_signal, cancel=cancel)
+    result.queued_sec = round(queued, 3)
+    return result
+
+
+def pytest_sandbox_env(env: Dict[str, str], per_test_timeout_sec: float) -> Dict[str, str]:
+    """为 pytest 运行补充：faulthandler（超时打印栈）、逐用例超时插件的路径与超时值"""
+    env = dict(env)
+    env["PYTHONFAULTHANDLER"] = "1"
+    env[PER_TEST_TIMEOUT_ENV] = str(per_test_timeout_sec or 0)
+    parts = [p for p in env.get("PYTHONPATH", "").split(os.pathsep) if p]
+    if PYTEST_PLUGIN_DIR not in parts:
+        # 放在最后，避免插件目录遮蔽被测项目的模块
+        parts.append(PYTEST_PLUGIN_DIR)
+    env["PYTHONPATH"] = os.pathsep.join(parts)
+    return env
@@ -0,0 +1,35 @@
+"""
+测试进程启动器（由 tools/sandbox.py 调用，不依赖本仓库的其他模块）。
+
+用法：python sandbox_launch.py '<rlimits json>' <command> [args...]
+先设置 rlimit（不超过当前硬上限），再 exec 目标命令，rlimit 由目标进程及其后代继承。
+"""
+import json
+import os
+import resource
+import sys
+
+
+def main():
+    limits = json.loads(sys.argv[1])
+    cmd = sys.argv[2:]
+    for name, value in limits.items():
+        res = getattr(resource, name, None)
+        if res is None:
+            continue
+        soft, hard = resource.getrlimit(res)
+        if hard != resource.RLIM_INFINITY:
+            value = min(value, hard)
+        try:
+            resource.setrlimit(res, (value, hard))
+        except (ValueError, OSError):
+            pass
+    try:
+        os.execvp(cmd[0], cmd)
+    except OSError as e:
+        sys.stderr.write(f"sandbox_launch: cannot execute {cmd[0]}: {e}\n")
+        os._exit(127)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+# 后台预跑的线程数；每个任务本身会起子进程（或复用常驻 worker），线程只负责等待
+DEFAULT_SPECULATIVE_WORKERS = 2
+
+# 结果最多保留多少条；预跑结果只为紧接着的一次运行调用服务
+MAX_SPECULATIVE_ENTRIES = 32
+
+
+def file_digest(path: str) -> Optional[str]:
+    try:
+        with open(path, "rb") as f:
+            return hashlib.sha1(f.read()).hexdigest()
+    except OSError:
+        return None
+
+
+class _Entry:
+    def __init__(self, path: str, digest: str):
+        self.path = path
+        self.digest = digest
+        # 任务算出依赖指纹后填入；前台据此判断能否复用，不必等任务结束
+        self.key: Optional[str] = None
+        self.future: Optional[Future] = None
+
+
+class SpeculativeRunner:
+    """
+    写入测试文件后在后台预跑（语法检查 + 预检 + 运行），前台运行调用到来时直接取结果。
+    条目按文件路径登记并记录写入时的内容哈希：文件被重写时旧条目作废，
+    取结果时还要求任务实际运行时的依赖指纹与前台一致。
+    """
+
+    def __init__(self, max_workers: int = DEFAULT_SPECULATIVE_WORKERS):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="speculative-run")
+        self._lock = threading.Lock()
+        self._entries: Dict[str, _Entry] = {}
+
+    def submit(self, path: str, job: Callable[[Callable[[str], None]], Any]) -> bool:
+        """
+        登记并提交一次预跑；job 接收一个回调，用于在真正运行前上报依赖指纹 key。
+        同一文件内容已有条目时不重复提交。
+        """
+        path = os.path.abspath(path)
+        digest = file_digest(path)
+        if digest is None:
+            return False
+        with self._lock:
+            old = self._entries.get(path)
+            if old is not None and old.digest == digest:
+                return False
+            if old is not None and old.future is not None:
+                old.future.cancel()
+            entry = _Entry(path, digest)
+            self._entries[path] = entry
+            self._evict()
+
+        def set_key(key: str) -> None:
+            entry.key = key
+
+        entry.future = self._pool.submit(job, set_key)
+        return True
+
+    def invalidate(self, path: str) -> None:
+        path = os.path.abspath(path)
+        with self._lock:
+            entry = self._entries.pop(path, None)
+        if entry is not None and entry.future is not None:
+            entry.future.cancel()
+
+    def take(self, path: str, key: str, timeout: float) -> Optional[Any]:
+        """
+        取出与 key 匹配的预跑结果（最多等待 timeout 秒）；不匹配、已作废或超时返回 None。
+        结果只用一次，取出后条目即移除。
+        """
+        path = os.path.abspath(path)
+        with self._lock:
+            entry = self._entries.get(path)
+        if entry is None or entry.future is None or entry.digest != file_digest(path):
+            return None
+        if entry.key is not None and entry.key != key:
+            return None
+        try:
+            result = entry.future.result(timeout=timeout)
+        except Exception:
+            return None
+        # 等待期间文件可能被重写
+        if entry.key != key or entry.digest != file_digest(path):
+            return None
+        with self._lock:
+            if self._entries.get(path) is entry:
+                del self._entries[path]
+        return result
+
+    def _evict(self) -> None:
+        while len(self._entries) > MAX_SPECULATIVE_ENTRIES:
+            oldest = next(iter(self._entries))
+            entry = self._entries.pop(oldest)
+            if entry.future is not None:
+                entry.future.cancel()
+
+
+_RUNNER: Optional[SpeculativeRunner] = None
+_RUNNER_LOCK = threading.Lock()
+
+
+def get_speculative_runner() -> SpeculativeRunner:
+    """进程内共享的预跑池：写文件工具提交，运行工具取结果"""
+    global _RUNNER
+    with _RUNNER_LOCK:
+        if _RUNNER is None:
+            _RUNNER = SpeculativeRunner()
+        return _RUNNER
+
+
+def speculation_key(*parts: Any) -> str:
+    return hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()
+
+
+SpeculativeResult = Tuple[Dict[str, Any], Optional[list], Dict[str, str]]
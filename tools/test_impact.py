@@ -0,0 +1,194 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from config.paths import MEMORY_DIR, resolve_path
+from tools.java_outline import get_java_index
+from tools.py_symbol_index import get_symbol_index
+
+# 每个测试文件上次运行时的依赖指纹与结论
+DEFAULT_IMPACT_PATH = MEMORY_DIR / "test_impact.json"
+
+# 构建 Python 导入图时跳过的目录
+_PY_SKIP_DIRS = {".git", "__pycache__", ".venv", "venv", ".tox", ".pytest_cache", "node_modules", "build", "dist"}
+
+
+class ImpactStore:
+    """测试文件 -> {fingerprint, outcome}；只有指纹未变且上次通过的测试才会被跳过"""
+
+    def __init__(self, path: str | Path = DEFAULT_IMPACT_PATH):
+        self.path = resolve_path(path)
+        self._lock = threading.Lock()
+        try:
+            self._data: Dict[str, Dict[str, str]] = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, json.JSONDecodeError):
+            self._data = {}
+
+    def select(self, fingerprints: Dict[str, str]) -> Tuple[List[str], Dict[str, str]]:
+        """返回 (需要运行的测试, 原因)；原因为 new / changed / last_failed"""
+        affected: List[str] = []
+        reasons: Dict[str, str] = {}
+        with self._lock:
+            for test, fp in fingerprints.items():
+                last = self._data.get(test)
+                if last is None:
+                    reasons[test] = "new"
+                elif last.get("fingerprint") != fp:
+                    reasons[test] = "changed"
+                elif last.get("outcome") != "passed":
+                    reasons[test] = "last_failed"
+                else:
+                    continue
+                affected.append(test)
+        return affected, reasons
+
+    def record(self, fingerprints: Dict[str, str], outcomes: Dict[str, str]) -> None:
+        """记录本次运行的结论；没有结论的测试（未运行到）保持原记录"""
+        with self._lock:
+            for test, outcome in outcomes.items():
+                if test in fingerprints:
+                    self._data[test] = {"fingerprint": fingerprints[test], "outcome": outcome}
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            tmp.write_text(json.dumps(self._data, ensure_ascii=False), encoding="utf-8")
+            os.replace(tmp, self.path)
+
+
+_STORE: Optional[ImpactStore] = None
+_STORE_LOCK = threading.Lock()
+
+
+def get_impact_store() -> ImpactStore:
+    """进程内共享的 ImpactStore，避免多个工具实例互相覆盖记录"""
+    global _STORE
+    with _STORE_LOCK:
+        if _STORE is None:
+            _STORE = ImpactStore()
+        return _STORE
+
+
+def _closure(graph: Dict[str, Set[str]], start: Iterable[str]) -> Set[str]:
+    seen: Set[str] = set()
+    stack = list(start)
+    while stack:
+        node = stack.pop()
+        if node in seen:
+            continue
+        seen.add(node)
+        stack.extend(graph.get(node, ()))
+    return seen
+
+
+def _fingerprint(files: Iterable[str], hashes: Dict[str, str]) -> str:
+    h = hashlib.sha1()
+    for rel in sorted(files):
+        h.update(f"{rel}|{hashes.get(rel, '')}\n".encode("utf-8"))
+    return h.hexdigest()
+
+
+# ---------- Python：测试文件与 SUT 模块的导入图 ----------
+
+def python_import_graph(project_root: str) -> Tuple[Dict[str, Set[str]], Dict[str, str]]:
+    """
+    基于符号索引构建项目内的导入图：相对路径 -> 直接导入的项目文件集合，以及相对路径 -> sha1。
+    导入名先精确匹配模块名，找不到时按后缀匹配（兼容 src 布局或把子目录加入 sys.path 的项目）。
+    """
+    index = get_symbol_index(project_root)
+    index.refresh("**/*.py", skip_dirs=_PY_SKIP_DIRS)
+    index.save()
+    snap = index.snapshot()
+
+    by_module: Dict[str, List[str]] = {}
+    by_suffix: Dict[str, List[str]] = {}
+    for rel, rec in snap.items():
+        module = rec["module"]
+        by_module.setdefault(module, []).append(rel)
+        parts = module.split(".")
+        for i in range(1, len(parts)):
+            by_suffix.setdefault(".".join(parts[i:]), []).append(rel)
+
+    graph: Dict[str, Set[str]] = {}
+    for rel, rec in snap.items():
+        deps: Set[str] = set()
+        for name in rec["imports"]:
+            parts = name.split(".")
+            # 导入子模块时父包的 __init__ 也会执行
+            for i in range(1, len(parts) + 1):
+                prefix = ".".join(parts[:i])
+                deps.update(by_module.get(prefix) or by_suffix.get(prefix, ()))
+        deps.discard(rel)
+        graph[rel] = deps
+    return graph, {rel: rec["sha1"] for rel, rec in snap.items()}
+
+
+def python_fingerprints(project_root: str, test_files: List[str]) -> Dict[str, str]:
+    """
+    测试文件（绝对路径） -> 指纹：测试文件自身、其上级目录中的 conftest.py，
+    以及它们传递依赖的所有项目模块的内容哈希。
+    """
+    root = Path(project_root).resolve()
+    graph, hashes = python_import_graph(str(root))
+    out: Dict[str, str] = {}
+    for test in test_files:
+        rel = Path(test).resolve().relative_to(root).as_posix()
+        seeds = [rel]
+        parent = Path(rel).parent
+        while True:
+            conftest = (parent / "conftest.py").as_posix()
+            if conftest in hashes:
+                seeds.append(conftest)
+            if parent == parent.parent:
+                break
+            parent = parent.parent
+        out[test] = _fingerprint(_closure(graph, seeds), hashes)
+    return out
+
+
+# ---------- Java：类引用图 ----------
+
+def java_reference_graph(project_root: str) -> Tuple[Dict[str, Set[str]], Dict[str, str]]:
+    """
+    基于 Java 大纲索引构建类引用图：相对路径 -> 引用到的类型所在的项目文件集合。
+    只按简单类名匹配（同名类全部计入），宁可多跑也不漏跑。
+    """
+    index = get_java_index(project_root)
+    index.refresh()
+    index.save()
+    snap = index.snapshot()
+
+    declared: Dict[str, List[str]] = {}
+    for rel, rec in snap.items():
+        for name in rec["types"]:
+            declared.setdefault(name, []).append(rel)
+
+    graph: Dict[str, Set[str]] = {}
+    for rel, rec in snap.items():
+        deps = {dep for ref in rec["refs"] for dep in declared.get(ref, ())}
+        deps.discard(rel)
+        graph[rel] = deps
+    return graph, {rel: rec["sha1"] for rel, rec in snap.items()}
+
+
+def java_fingerprints(project_root: str, test_files: List[str],
+                      extra_inputs: Optional[List[str]] = None) -> Dict[str, str]:
+    """
+    测试类源文件（绝对路径） -> 指纹：测试类及其传递引用的所有项目类的内容哈希。
+    extra_inputs（如 pom.xml）的内容变化会使所有测试失效。
+    """
+    root = Path(project_root).resolve()
+    graph, hashes = java_reference_graph(str(root))
+    for extra in extra_inputs or []:
+        try:
+            hashes[extra] = hashlib.sha1(Path(extra).read_bytes()).hexdigest()
+        except OSError:
+            hashes[extra] = ""
+    out: Dict[str, str] = {}
+    for test in test_files:
+        rel = Path(test).resolve().relative_to(root).as_posix()
+        out[test] = _fingerprint(_closure(graph, [rel]) | set(extra_inputs or []), hashes)
+    return out
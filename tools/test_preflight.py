@@ -0,0 +1,511 @@
+from __future__ import annotations
+
+import ast
+import os
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from tools.py_symbol_index import get_symbol_index, infer_module_name
+
+# 扫描项目模块时跳过的目录
+_SKIP_DIRS = {".git", "__pycache__", ".venv", "venv", ".tox", ".pytest_cache", "node_modules", "build", "dist"}
+
+# 期望抛出异常的上下文：其中的错误是测试有意为之，不做检查
+_RAISES_NAMES = {"raises", "assertRaises", "assertRaisesRegex", "assertRaisesRegexp"}
+
+# 解析 import 链时的最大跳转深度（防止循环导入）
+_MAX_DEPTH = 8
+
+# 引用的解析结果
+#   ("module", 模块名)
+#   ("symbol", 模块名, 定义记录)
+#   ("instance", 模块名, 类定义记录)
+Ref = Tuple[Any, ...]
+
+# 确定不存在的名字
+_MISSING = ("missing",)
+
+# 每个类都从 object 继承、类对象还从 type 获得的属性（mro、__subclasses__、__name__ 等）
+_IMPLICIT_ATTRS = frozenset(dir(type)) | frozenset(dir(object))
+
+
+class _Resolver:
+    """
+    基于符号索引解析项目内的模块 / 类 / 函数。
+    只对项目本地的顶层包下结论；第三方库与动态绑定的名字一律视为未知（不报错）。
+    """
+
+    def __init__(self, project_root: str, search_roots: List[str]):
+        self.root = Path(project_root).resolve()
+        index = get_symbol_index(self.root)
+        index.refresh("**/*.py", skip_dirs=_SKIP_DIRS)
+        index.save()
+        self.modules = index.module_table()
+        # 项目中任意位置赋值过的属性名：这些属性可能是动态添加的，不报告缺失
+        self.stored_attrs: Set[str] = set()
+        for entry in self.modules.values():
+            self.stored_attrs.update(entry.get("attr_stores", []))
+        # 命名空间包（没有 __init__.py 的目录）也可以导入
+        self.packages: Set[str] = set()
+        for name in self.modules:
+            parts = name.split(".")
+            for i in range(1, len(parts)):
+                self.packages.add(".".join(parts[:i]))
+
+        # 每个 sys.path 根目录对应的模块名前缀（项目根为空前缀，src 布局为 "src."）
+        self.prefixes: List[str] = []
+        for r in search_roots:
+            try:
+                rel = Path(r).resolve().relative_to(self.root)
+            except ValueError:
+                continue
+            prefix = ".".join(rel.parts)
+            prefix = f"{prefix}." if prefix else ""
+            if prefix not in self.prefixes:
+                self.prefixes.append(prefix)
+        if "" not in self.prefixes:
+            self.prefixes.insert(0, "")
+
+    def _full(self, name: str) -> Optional[str]:
+        for prefix in self.prefixes:
+            full = prefix + name
+            if full in self.modules or full in self.packages:
+                return full
+        return None
+
+    def is_local(self, name: str) -> bool:
+        return self._full(name.split(".")[0]) is not None
+
+    def module_exists(self, name: str) -> bool:
+        return self._full(name) is not None
+
+    def module_entry(self, name: str) -> Optional[Dict[str, Any]]:
+        full = self._full(name)
+        return self.modules.get(full) if full else None
+
+    @staticmethod
+    def _top_symbol(entry: Dict[str, Any], qualname: str) -> Optional[Dict[str, Any]]:
+        for sym in entry["symbols"]:
+            if sym["qualname"] == qualname:
+                return sym
+        return None
+
+    def module_attr(self, module: str, attr: str, depth: int = 0) -> Optional[Ref]:
+        """模块上的属性：返回引用，None 表示未知，_MISSING 表示确定不存在"""
+        if depth > _MAX_DEPTH or not self.is_local(module):
+            return None
+        sub = f"{module}.{attr}"
+        entry = self.module_entry(module)
+        if entry is None:
+            # 命名空间包只有子模块
+            if self.module_exists(sub):
+                return ("module", sub)
+            return _MISSING if self.module_exists(module) and not attr.startswith("__") else None
+        exports = entry["exports"]
+        kind = exports["names"].get(attr)
+        if kind is None:
+            # 子模块：`from pkg import mod` 总能导入
+            if self.module_exists(sub):
+                return ("module", sub)
+            if exports["open"] or entry["syntax_error"] or attr.startswith("__"):
+                return None
+            return _MISSING
+        if kind in ("def", "class"):
+            sym = self._top_symbol(entry, attr)
+            return ("symbol", module, sym) if sym else None
+        if kind.startswith("import:"):
+            target = kind[len("import:"):]
+            if ":" in target:
+                mod, name = target.split(":", 1)
+                ref = self.module_attr(mod, name, depth + 1) if mod else None
+                return None if ref is _MISSING else ref
+            return ("module", target) if self.is_local(target) and self.module_exists(target) else None
+        return None
+
+    def class_attr(self, module: str, cls: Dict[str, Any], attr: str, depth: int = 0) -> Optional[Ref]:
+        """
+        类（或其实例）上的属性：沿项目内的基类查找；有任何无法解析的基类时视为未知，
+        object / type 上的属性视为存在（未知）
+        """
+        if depth > _MAX_DEPTH or attr.startswith("__") or cls.get("open_members"):
+            return None
+        if attr in cls.get("members", []):
+            entry = self.module_entry(module)
+            sym = self._top_symbol(entry, f"{cls['qualname']}.{attr}") if entry else None
+            return ("symbol", module, sym) if sym else ("member",)
+        for base in cls.get("bases", []):
+            if base == "object":
+                continue
+            parts = base.split(".")
+            ref = self.module_attr(module, parts[0])
+            for part in parts[1:]:
+                if ref is None or ref is _MISSING or ref[0] != "module":
+                    ref = None
+                    break
+                ref = self.module_attr(ref[1], part)
+            if ref is None or ref is _MISSING or ref[0] != "symbol" or ref[2]["kind"] != "class":
+                return None
+            found = self.class_attr(ref[1], ref[2], attr, depth + 1)
+            if found is not _MISSING:
+                return found
+        # 基类链在（隐式的）object 处结束：object / type 提供的属性存在，但没有可用于检查的定义记录
+        if attr in _IMPLICIT_ATTRS:
+            return None
+        return _MISSING
+
+
+def _ref_key(ref: Optional[Ref]) -> Optional[Tuple]:
+    """引用的可哈希表示（定义记录用其限定名代替）"""
+    if ref is None:
+        return None
+    return tuple(x["qualname"] if isinstance(x, dict) else x for x in ref)
+
+
+def _dotted_parts(node: ast.AST) -> Optional[List[str]]:
+    parts: List[str] = []
+    while isinstance(node, ast.Attribute):
+        parts.append(node.attr)
+        node = node.value
+    if isinstance(node, ast.Name):
+        parts.append(node.id)
+        return parts[::-1]
+    return None
+
+
+def check_arity(params: Optional[Dict[str, Any]], call: ast.Call) -> Optional[str]:
+    """按记录的调用约定检查实参；有 *args / **kwargs 展开时不检查"""
+    if params is None:
+        return None
+    if any(isinstance(a, ast.Starred) for a in call.args) or any(k.arg is None for k in call.keywords):
+        return None
+    positional = params["positional"]
+    npos = len(call.args)
+    if npos > len(positional) and not params["vararg"]:
+        return f"takes {len(positional)} positional argument(s) but {npos} were given"
+    kwnames = [k.arg for k in call.keywords]
+    allowed = set(positional[params["posonly"]:]) | set(params["kwonly"])
+    for k in kwnames:
+        if k in positional[:npos]:
+            return f"got multiple values for argument '{k}'"
+        if k not in allowed and not params["varkw"]:
+            return f"got an unexpected keyword argument '{k}'"
+    covered = set(positional[:npos]) | set(kwnames)
+    missing = [p for p in positional[:params["required"]] if p not in covered]
+    missing += [k for k in params["kwonly_required"] if k not in kwnames]
+    if missing:
+        return f"missing required argument(s): {', '.join(repr(m) for m in missing)}"
+    return None
+
+
+class _FileChecker:
+    def __init__(self, path: str, tree: ast.Module, module: str, resolver: _Resolver):
+        self.path = path
+        self.tree = tree
+        self.module = module
+        self.r = resolver
+        self.diags: List[Dict[str, Any]] = []
+        self.bindings: Dict[str, Optional[Ref]] = {}
+        self.skip_lines: Set[int] = set()
+        # 本文件中通过赋值 / setattr / patch.object 动态设置的属性名
+        self.dynamic_attrs: Set[str] = set(resolver.stored_attrs)
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Attribute) and isinstance(node.ctx, ast.Store):
+                self.dynamic_attrs.add(node.attr)
+            elif (isinstance(node, ast.Call) and len(node.args) >= 2 and isinstance(node.args[1], ast.Constant)
+                  and isinstance(node.args[1].value, str)):
+                parts = _dotted_parts(node.func) or []
+                if parts[-1:] == ["setattr"] or parts[-2:] == ["patch", "object"]:
+                    self.dynamic_attrs.add(node.args[1].value)
+
+    def _diag(self, node: ast.AST, error_type: str, message: str) -> None:
+        if getattr(node, "lineno", None) in self.skip_lines:
+            return
+        self.diags.append({
+            "file": self.path,
+            "line": getattr(node, "lineno", 0),
+            "col": getattr(node, "col_offset", 0),
+            "error_type": error_type,
+            "message": message,
+        })
+
+    # ---------- 预处理 ----------
+
+    def _collect_skip_lines(self) -> None:
+        """pytest.raises / assertRaises 块与带 except 的 try 块中的代码可能有意触发错误"""
+        for node in ast.walk(self.tree):
+            body: List[ast.AST] = []
+            if isinstance(node, (ast.With, ast.AsyncWith)):
+                for item in node.items:
+                    expr = item.context_expr
+                    if isinstance(expr, ast.Call):
+                        parts = _dotted_parts(expr.func)
+                        if parts and parts[-1] in _RAISES_NAMES:
+                            body = node.body
+            elif isinstance(node, ast.Try) and node.handlers:
+                body = node.body
+            for stmt in body:
+                start = getattr(stmt, "lineno", None)
+                end = getattr(stmt, "end_lineno", None) or start
+                if start is not None:
+                    self.skip_lines.update(range(start, end + 1))
+
+    def _relative_base(self, level: int) -> Optional[List[str]]:
+        base = self.module.split(".")[:-1] if self.module else []
+        if level - 1 > len(base):
+            return None
+        return base[:len(base) - (level - 1)]
+
+    def _check_imports(self) -> None:
+        """检查导入并记录名字绑定；同名被多次绑定或被赋值过的名字视为未知"""
+        candidates: Dict[str, List[Optional[Ref]]] = {}
+        for node in ast.walk(self.tree):
+            if isinstance(node, ast.Import):
+                for alias in node.names:
+                    name = alias.name
+                    if self.r.is_local(name) and not self.r.module_exists(name):
+                        self._diag(node, "ImportError", f"No module named '{name}' in project")
+                        continue
+                    if alias.asname:
+                        ref = ("module", name) if self.r.is_local(name) else None
+                        candidates.setdefault(alias.asname, []).append(ref)
+                    else:
+                        top = name.split(".")[0]
+                        ref = ("module", top) if self.r.is_local(top) else None
+                        candidates.setdefault(top, []).append(ref)
+            elif isinstance(node, ast.ImportFrom):
+                if node.level:
+                    base = self._relative_base(node.level)
+                    if base is None:
+                        continue
+                    module = ".".join(base + ([node.module] if node.module else []))
+                else:
+                    module = node.module or ""
+                local = bool(module) and self.r.is_local(module)
+                if local and not self.r.module_exists(module):
+                    self._diag(node, "ImportError", f"No module named '{module}' in project")
+                    continue
+                for alias in node.names:
+                    if alias.name == "*":
+                        continue
+                    ref = self.r.module_attr(module, alias.name) if local else None
+                    if ref is _MISSING:
+                        self._diag(node, "ImportError", f"cannot import name '{alias.name}' from '{module}'")
+                        ref = None
+                    candidates.setdefault(alias.asname or alias.name, []).append(ref)
+
+        # 其他方式绑定过的名字（赋值、参数、def/class、for/with/except 目标等）不做推断
+        rebound: Set[str] = set()
+        for node in ast.walk(self.tree):
+            if isinstance(node, ast.Name) and isinstance(node.ctx, (ast.Store, ast.Del)):
+                rebound.add(node.id)
+            elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                rebound.add(node.name)
+            elif isinstance(node, ast.arg):
+                rebound.add(node.arg)
+            elif isinstance(node, ast.ExceptHandler) and node.name:
+                rebound.add(node.name)
+        for name, refs in candidates.items():
+            if name in rebound or len({_ref_key(r) for r in refs}) != 1 or refs[0] is None:
+                continue
+            self.bindings[name] = refs[0]
+
+    # ---------- 表达式解析 ----------
+
+    def _resolve(self, node: ast.AST, instances: Dict[str, Ref]) -> Optional[Ref]:
+        """解析 Name / Attribute 链；发现确定不存在的属性时报告并返回 None"""
+        parts = _dotted_parts(node)
+        if not parts:
+            return None
+        ref = instances.get(parts[0]) or self.bindings.get(parts[0])
+        for i, attr in enumerate(parts[1:], start=1):
+            if ref is None:
+                return None
+            if ref[0] == "module":
+                nxt = self.r.module_attr(ref[1], attr)
+                owner = f"module '{ref[1]}'"
+            elif ref[0] == "symbol" and ref[2]["kind"] == "class":
+                nxt = self.r.class_attr(ref[1], ref[2], attr)
+                owner = f"type object '{ref[2]['name']}'"
+                # 通过类访问的普通方法是未绑定的，参数个数含 self，不做参数检查
+                if nxt is not None and nxt is not _MISSING and nxt[0] == "symbol" and nxt[2]["kind"] == "function":
+                    nxt = ("unbound",)
+            elif ref[0] == "instance":
+                nxt = self.r.class_attr(ref[1], ref[2], attr)
+                owner = f"'{ref[2]['name']}' object"
+            else:
+                return None
+            if nxt is _MISSING:
+                if attr not in self.dynamic_attrs:
+                    self._diag(node, "AttributeError",
+                               f"{owner} has no attribute '{attr}' ({'.'.join(parts[:i + 1])})")
+                return None
+            ref = nxt
+        return ref
+
+    def _instances(self, scope: ast.AST) -> Dict[str, Ref]:
+        """作用域内 `x = Cls(...)` 且只赋值一次、从未给 x 的属性赋值的变量，视为 Cls 的实例"""
+        assigns: Dict[str, List[ast.AST]] = {}
+        attr_stored: Set[str] = set()
+        for node in self._scope_nodes(scope):
+            if isinstance(node, ast.Name) and isinstance(node.ctx, (ast.Store, ast.Del)):
+                assigns.setdefault(node.id, []).append(node)
+            elif (isinstance(node, ast.Attribute) and isinstance(node.ctx, (ast.Store, ast.Del))
+                  and isinstance(node.value, ast.Name)):
+                attr_stored.add(node.value.id)
+            elif isinstance(node, (ast.Call,)) and _dotted_parts(node.func) in (["setattr"], ["patch", "object"],
+                                                                               ["mock", "patch", "object"]):
+                if node.args and isinstance(node.args[0], ast.Name):
+                    attr_stored.add(node.args[0].id)
+        out: Dict[str, Ref] = {}
+        for node in self._scope_nodes(scope):
+            if not (isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name)
+                    and isinstance(node.value, ast.Call)):
+                continue
+            name = node.targets[0].id
+            if len(assigns.get(name, [])) != 1 or name in attr_stored:
+                continue
+            ref = self._resolve(node.value.func, {})
+            if ref is not None and ref[0] == "symbol" and ref[2]["kind"] == "class":
+                out[name] = ("instance", ref[1], ref[2])
+        return out
+
+    @staticmethod
+    def _scope_nodes(scope: ast.AST):
+        """作用域内的节点（不进入嵌套的函数 / 类定义）"""
+        stack = list(ast.iter_child_nodes(scope))
+        while stack:
+            node = stack.pop()
+            yield node
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.Lambda)):
+                continue
+            stack.extend(ast.iter_child_nodes(node))
+
+    def _check_patch_target(self, call: ast.Call) -> None:
+        """mock.patch("pkg.mod.name") 的目标必须存在"""
+        if not call.args or not isinstance(call.args[0], ast.Constant) or not isinstance(call.args[0].value, str):
+            return
+        if any(k.arg == "create" for k in call.keywords):
+            return
+        target = call.args[0].value
+        parts = target.split(".")
+        if len(parts) < 2 or not self.r.is_local(parts[0]):
+            return
+        for i in range(len(parts) - 1, 0, -1):
+            mod = ".".join(parts[:i])
+            if not self.r.module_exists(mod):
+                continue
+            ref: Optional[Ref] = ("module", mod)
+            for j, attr in enumerate(parts[i:], start=i):
+                if ref is None:
+                    return
+                if ref[0] == "module":
+                    nxt = self.r.module_attr(ref[1], attr)
+                elif ref[0] == "symbol" and ref[2]["kind"] == "class":
+                    nxt = self.r.class_attr(ref[1], ref[2], attr)
+                else:
+                    return
+                if nxt is _MISSING:
+                    self._diag(call, "AttributeError",
+                               f"patch target '{target}': '{'.'.join(parts[:j])}' has no attribute '{attr}'")
+                    return
+                ref = nxt
+            return
+        self._diag(call, "ImportError", f"patch target '{target}': no module named '{parts[0]}' in project")
+
+    def _check_scope(self, scope: ast.AST) -> None:
+        instances = self._instances(scope)
+        for node in self._scope_nodes(scope):
+            if isinstance(node, ast.Call):
+                parts = _dotted_parts(node.func)
+                if parts and parts[-1] == "patch":
+                    self._check_patch_target(node)
+                    continue
+                ref = self._resolve(node.func, instances)
+                if ref is not None and ref[0] == "symbol":
+                    problem = check_arity(ref[2].get("params"), node)
+                    if problem:
+                        self._diag(node, "TypeError", f"{'.'.join(parts or [ref[2]['name']])}() {problem}")
+            elif isinstance(node, ast.Attribute) and isinstance(node.ctx, ast.Load):
+                # 普通的属性读取（被调用的属性链重复解析时，诊断会在最后去重）
+                self._resolve(node, instances)
+
+    def run(self) -> List[Dict[str, Any]]:
+        self._collect_skip_lines()
+        self._check_imports()
+        scopes = [self.tree] + [n for n in ast.walk(self.tree) if isinstance(n, (ast.FunctionDef, ast.AsyncFunctionDef))]
+        for scope in scopes:
+            self._check_scope(scope)
+        # 同一位置的同一问题只报告一次（属性链会被多次解析）
+        seen: Set[Tuple] = set()
+        out = []
+        for d in self.diags:
+            key = (d["line"], d["error_type"], d["message"])
+            if key not in seen:
+                seen.add(key)
+                out.append(d)
+        return sorted(out, key=lambda d: (d["line"], d["col"]))
+
+
+def _pytest_rootdir_insert(test_file: Path) -> Path:
+    """pytest（prepend 模式）把测试文件所在的第一个非包目录加入 sys.path"""
+    d = test_file.parent
+    while (d / "__init__.py").exists() and d.parent != d:
+        d = d.parent
+    return d
+
+
+def validate_files(files: List[str], project_root: str,
+                   extra_pythonpath: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    在进程内静态检查测试文件，返回诊断列表：
+    {"file", "line", "col", "error_type": ImportError|AttributeError|TypeError|SyntaxError, "message"}
+    只报告能确定的错误：项目内不存在的模块 / 名字 / 属性、参数个数或关键字不匹配、mock.patch 目标不存在。
+    """
+    root = Path(project_root).resolve()
+    roots = [str(root)] + [p for p in (extra_pythonpath or "").split(os.pathsep) if p.strip()]
+    roots += sorted({str(_pytest_rootdir_insert(Path(f).resolve())) for f in files})
+    resolver = _Resolver(str(root), roots)
+
+    diags: List[Dict[str, Any]] = []
+    for f in files:
+        path = Path(f).resolve()
+        try:
+            text = path.read_text(encoding="utf-8", errors="ignore")
+            tree = ast.parse(text, filename=str(path))
+        except OSError:
+            continue
+        except SyntaxError as e:
+            diags.append({"file": f, "line": e.lineno or 0, "col": e.offset or 0,
+                          "error_type": "SyntaxError", "message": e.msg})
+            continue
+        try:
+            module = infer_module_name(root, path)
+        except ValueError:
+            module = path.stem
+        for d in _FileChecker(f, tree, module, resolver).run():
+            diags.append(d)
+    return diags
+
+
+_ROOT_MARKERS = ("pyproject.toml", "setup.py", "setup.cfg", "requirements.txt", ".git")
+
+
+def find_project_root(path: str) -> str:
+    """从文件向上查找项目根目录（含 pyproject.toml / setup.py / .git 等标记）；找不到时取最外层包的上级目录"""
+    start = Path(path).resolve().parent
+    for d in [start, *start.parents]:
+        if any((d / m).exists() for m in _ROOT_MARKERS):
+            return str(d)
+    d = start
+    while (d / "__init__.py").exists() and d.parent != d:
+        d = d.parent
+    # tests/ 目录通常与被测包同级
+    return str(d.parent if d.name in ("tests", "test") else d)
+
+
+def format_diagnostics(diags: List[Dict[str, Any]], root: Optional[str] = None) -> str:
+    lines = []
+    for d in diags:
+        f = os.path.relpath(d["file"], root) if root else d["file"]
+        lines.append(f"{f}:{d['line']}:{d['col']}: {d['error_type']}: {d['message']}")
+    return "\n".join(lines)
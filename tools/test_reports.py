@@ -0,0 +1,160 @@
+from __future__ import annotations
+
+import glob
+import json
+import os
+import re
+import xml.etree.ElementTree as ET
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+
+def parse_junit_xml(path: str, *, root_dir: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    解析 JUnit XML 报告（pytest --junitxml），返回每个用例的结构化结果：
+    {"file", "classname", "name", "time", "outcome", "message", "text"}
+    outcome 为 passed / failed / error / skipped。
+    """
+    try:
+        tree = ET.parse(path)
+    except (OSError, ET.ParseError):
+        return []
+
+    cases: List[Dict[str, Any]] = []
+    for tc in tree.getroot().iter("testcase"):
+        outcome, message, text = "passed", "", ""
+        for tag in ("failure", "error", "skipped"):
+            node = tc.find(tag)
+            if node is not None:
+                outcome = {"failure": "failed", "error": "error", "skipped": "skipped"}[tag]
+                message = node.get("message", "") or ""
+                text = node.text or ""
+                break
+
+        file = tc.get("file")
+        if file and root_dir and not os.path.isabs(file):
+            file = os.path.abspath(os.path.join(root_dir, file))
+        cases.append({
+            "file": file,
+            "classname": tc.get("classname", ""),
+            "name": tc.get("name", ""),
+            "time": float(tc.get("time", 0) or 0),
+            "outcome": outcome,
+            "message": message,
+            "text": text,
+        })
+    return cases
+
+
+def summarize_by_file(cases: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """按测试文件聚合用例结果：计数、耗时与整体结论（error > failed > passed）"""
+    per_file: Dict[str, Dict[str, Any]] = {}
+    for case in cases:
+        key = case["file"] or case["classname"]
+        info = per_file.setdefault(key, {
+            "outcome": "passed", "passed": 0, "failed": 0, "error": 0, "skipped": 0, "duration": 0.0,
+        })
+        info[case["outcome"]] += 1
+        info["duration"] += case["time"]
+        if case["outcome"] == "error":
+            info["outcome"] = "error"
+        elif case["outcome"] == "failed" and info["outcome"] != "error":
+            info["outcome"] = "failed"
+    return per_file
+
+
+# ---------- 失败摘要 ----------
+
+# 粗略估算：1 token ≈ 4 个字符
+CHARS_PER_TOKEN = 4
+
+_NOISE_RE = re.compile(r"0x[0-9a-fA-F]+|line \d+|:\d+:|\d+(\.\d+)?s\b")
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def trim_traceback(text: str, *, head: int = 3, tail: int = 12) -> str:
+    """只保留回溯的开头几行与结尾若干行（断言 / 异常所在处），中间用省略标记代替"""
+    lines = [ln.rstrip() for ln in (text or "").strip().splitlines() if ln.strip()]
+    if len(lines) <= head + tail:
+        return "\n".join(lines)
+    return "\n".join(lines[:head] + [f"... ({len(lines) - head - tail} lines omitted) ..."] + lines[-tail:])
+
+
+def _signature(case: Dict[str, Any]) -> str:
+    """失败特征：去掉地址、行号、耗时后的消息 + 回溯最后几行，用于去重"""
+    last = "\n".join((case["text"] or "").strip().splitlines()[-3:])
+    return _NOISE_RE.sub("#", f"{case['message']}\n{last}")
+
+
+def build_digest(cases: List[Dict[str, Any]], *, token_budget: int = 2000) -> Dict[str, Any]:
+    """
+    生成紧凑的测试结果摘要：
+    - counts：各结论的用例数
+    - failures：每个失败/错误用例一条；回溯相同的用例只保留第一条回溯，其余标注 same_as
+    - omitted：超出 token 预算而省略的失败条数
+    """
+    counts = {"total": len(cases), "passed": 0, "failed": 0, "error": 0, "skipped": 0}
+    for case in cases:
+        counts[case["outcome"]] += 1
+
+    digest: Dict[str, Any] = {"counts": counts, "failures": [], "omitted": 0}
+    used = estimate_tokens(json.dumps(counts))
+    seen: Dict[str, str] = {}
+    for case in cases:
+        if case["outcome"] not in ("failed", "error"):
+            continue
+        test_id = f"{case['file'] or case['classname']}::{case['name']}"
+        sig = _signature(case)
+        entry: Dict[str, Any] = {"test": test_id, "outcome": case["outcome"]}
+        if sig in seen:
+            entry["same_as"] = seen[sig]
+        else:
+            seen[sig] = test_id
+            entry["message"] = (case["message"] or "").strip().splitlines()[0][:300] if case["message"] else ""
+            entry["traceback"] = trim_traceback(case["text"])
+        cost = estimate_tokens(json.dumps(entry, ensure_ascii=False))
+        if used + cost > token_budget:
+            digest["omitted"] += 1
+            continue
+        used += cost
+        digest["failures"].append(entry)
+    return digest
+
+
+def tail_within_budget(text: str, token_budget: int) -> str:
+    """取文本末尾不超过预算的部分"""
+    limit = max(0, token_budget) * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    return f"... ({len(text) - limit} chars omitted, see log_file) ...\n" + text[-limit:]
+
+
+def spill_log(content: str, prefix: str, log_dir: str = "log") -> str:
+    """将完整原始输出写入 log 目录，返回日志文件路径"""
+    log_dir = os.path.join(os.getcwd(), log_dir)
+    os.makedirs(log_dir, exist_ok=True)
+    file_time = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    path = os.path.join(log_dir, f"{prefix}_{file_time}.log")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(content)
+    return path
+
+
+def parse_surefire_reports(project_path: str, *, since: Optional[float] = None) -> List[Dict[str, Any]]:
+    """
+    读取 Maven Surefire 的 TEST-*.xml 报告（含多模块的 */target/surefire-reports），
+    since 不为空时只读取该时间之后生成的报告，避免混入上一次运行的结果。
+    """
+    cases: List[Dict[str, Any]] = []
+    pattern = os.path.join(project_path, "**", "target", "surefire-reports", "TEST-*.xml")
+    for path in sorted(glob.glob(pattern, recursive=True)):
+        try:
+            if since is not None and os.path.getmtime(path) < since:
+                continue
+        except OSError:
+            continue
+        cases.extend(parse_junit_xml(path))
+    return cases
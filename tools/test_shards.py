@@ -0,0 +1,163 @@
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from config.paths import MEMORY_DIR, resolve_path
+from tools.cancellation import CancelToken
+from tools.sandbox import PYTHON_DUMP_SIGNAL, python_test_limits, sandboxed_run
+from tools.test_reports import parse_junit_xml, summarize_by_file
+
+# 历史耗时记录文件（按测试文件绝对路径）
+DEFAULT_DURATIONS_PATH = MEMORY_DIR / "test_durations.json"
+
+# 分片运行时需要去掉的“首个失败即停止”参数，保证拿到完整的失败全貌
+_STOP_EARLY_ARGS = ("-x", "--exitfirst")
+
+
+class DurationStore:
+    """测试文件历史耗时，用于分片负载均衡"""
+
+    def __init__(self, path: str | Path = DEFAULT_DURATIONS_PATH):
+        self.path = resolve_path(path)
+        self._lock = threading.Lock()
+        try:
+            self._data: Dict[str, float] = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, json.JSONDecodeError):
+            self._data = {}
+
+    def get(self, file: str) -> Optional[float]:
+        return self._data.get(file)
+
+    def update(self, durations: Dict[str, float]) -> None:
+        with self._lock:
+            self._data.update(durations)
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            tmp.write_text(json.dumps(self._data, ensure_ascii=False), encoding="utf-8")
+            os.replace(tmp, self.path)
+
+
+def plan_shards(files: List[str], shards: int, durations: DurationStore) -> List[List[str]]:
+    """
+    最长处理时间优先（LPT）分配：按历史耗时从大到小，依次放入当前总耗时最小的分片。
+    没有历史记录的文件按已知耗时的中位数估计。分片内保持文件名顺序，结果确定。
+    """
+    shards = max(1, min(shards, len(files)))
+    known = sorted(d for d in (durations.get(f) for f in files) if d is not None)
+    default = known[len(known) // 2] if known else 1.0
+
+    weighted = sorted(files, key=lambda f: (-(durations.get(f) or default), f))
+    buckets: List[List[str]] = [[] for _ in range(shards)]
+    loads = [0.0] * shards
+    for f in weighted:
+        k = loads.index(min(loads))
+        buckets[k].append(f)
+        loads[k] += durations.get(f) or default
+    return [sorted(b) for b in buckets if b]
+
+
+def strip_stop_early(args: List[str]) -> List[str]:
+    return [a for a in args if a not in _STOP_EARLY_ARGS and not a.startswith("--maxfail")]
+
+
+@dataclass
+class ShardResult:
+    index: int
+    files: List[str]
+    exit_code: Optional[int]
+    stdout: str
+    stderr: str
+    duration: float
+    timed_out: bool = False
+    cases: List[Dict[str, Any]] = field(default_factory=list)
+    log_file: Optional[str] = None
+
+
+def _run_shard(index: int, files: List[str], python_executable: str, pytest_args: List[str],
+               cwd: str, env: Dict[str, str], timeout_sec: int,
+               cancel: Optional[CancelToken] = None) -> ShardResult:
+    # 每个分片独立的临时目录：basetemp、TMPDIR 与报告互不干扰
+    tmp = tempfile.mkdtemp(prefix=f"mate_shard{index}_")
+    report = os.path.join(tmp, "report.xml")
+    cmd = [
+        python_executable, "-m", "pytest", *pytest_args,
+        "--basetemp", os.path.join(tmp, "basetemp"),
+        "-p", "no:cacheprovider",
+        # 某个文件导入失败时其余文件照常运行
+        "--continue-on-collection-errors",
+        "-o", "junit_family=xunit1",
+        "--junitxml", report,
+        *files,
+    ]
+    shard_env = dict(env, TMPDIR=tmp, TEMP=tmp, TMP=tmp)
+    start = time.monotonic()
+    try:
+        captured = sandboxed_run(cmd, cwd=cwd, env=shard_env, timeout=timeout_sec,
+                                 limits=python_test_limits(timeout_sec), dump_signal=PYTHON_DUMP_SIGNAL,
+                                 log_prefix=f"pytest_shard{index}", cancel=cancel)
+        result = ShardResult(index, files, captured.returncode, captured.stdout, captured.stderr,
+                             time.monotonic() - start, timed_out=captured.timed_out, log_file=captured.log_file)
+        result.cases = parse_junit_xml(report, root_dir=cwd)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return result
+
+
+def run_sharded(files: List[str], shards: int, *, python_executable: str, pytest_args: List[str],
+                cwd: str, env: Dict[str, str], timeout_sec: int,
+                durations: Optional[DurationStore] = None, cancel: Optional[CancelToken] = None) -> Dict[str, Any]:
+    """
+    将测试文件按历史耗时分成若干片，每片一个 pytest 进程并发运行，合并为逐文件结果。
+    cancel 被取消时结束所有分片并抛出 RunCancelled。
+    返回 {"shards": [...], "per_file": {...}, "exit_code", "stdout", "stderr", "timed_out"}。
+    """
+    durations = durations or DurationStore()
+    plan = plan_shards(files, shards, durations)
+    args = strip_stop_early(pytest_args)
+
+    with ThreadPoolExecutor(max_workers=len(plan)) as pool:
+        results = list(pool.map(
+            lambda item: _run_shard(item[0], item[1], python_executable, args, cwd, env, timeout_sec, cancel),
+            enumerate(plan),
+        ))
+
+    per_file: Dict[str, Dict[str, Any]] = {}
+    for r in results:
+        summary = summarize_by_file(r.cases)
+        for f in r.files:
+            info = summary.get(f)
+            if info is None:
+                # 分片崩溃/超时或文件未产生任何用例
+                info = {"outcome": "error" if (r.timed_out or r.exit_code not in (0, 5)) else "no_tests",
+                        "passed": 0, "failed": 0, "error": 0, "skipped": 0, "duration": 0.0}
+                if r.timed_out:
+                    info["message"] = f"shard {r.index} timed out after {timeout_sec}s"
+            per_file[f] = info
+
+    durations.update({f: round(info["duration"], 3) for f, info in per_file.items() if info["duration"] > 0})
+
+    # 任一分片失败则整体失败；超时的分片没有退出码，记为 1
+    failing = [1 if r.exit_code is None else r.exit_code for r in results if r.exit_code not in (0, 5)]
+    return {
+        "shards": [
+            {"index": r.index, "files": r.files, "exit_code": r.exit_code,
+             "duration": round(r.duration, 3), "timed_out": r.timed_out,
+             **({"log_file": r.log_file} if r.log_file else {})}
+            for r in results
+        ],
+        "per_file": per_file,
+        "cases": [c for r in results for c in r.cases],
+        "exit_code": failing[0] if failing else 0,
+        "timed_out": any(r.timed_out for r in results),
+        "stdout": "\n".join(f"===== shard {r.index} =====\n{r.stdout}" for r in results),
+        "stderr": "\n".join(f"===== shard {r.index} =====\n{r.stderr}" for r in results if r.stderr),
+    }
@@ -1,9 +1,60 @@
+import fnmatch
+import hashlib
+import json
 import os
-from typing import Optional, Type
+import threading
+from typing import Any, Dict, Optional, Type
 
 import datetime
 from crewai.tools import BaseTool
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, PrivateAttr
+
+from config.paths import WORKING_MEMORY_DIR
+from tools.code_merge import MergeError, merge_code
+from tools.run_py_test import RunProjectGeneratedTestsTool
+from tools.speculative_runs import get_speculative_runner
+from tools.test_preflight import find_project_root, format_diagnostics, validate_files
+
+# 生成测试清单：绝对路径 -> {name, sha1, updated_at}；generatedTest.txt 为去重后的文件名列表
+MANIFEST_FILE = "generated_tests.json"
+NAMES_FILE = "generatedTest.txt"
+_MANIFEST_LOCK = threading.Lock()
+
+
+def _atomic_write(path: str, text: str) -> None:
+    """先写同目录临时文件再替换，中途失败不会留下半个文件"""
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def _record_generated(path: str, text: str, memory_dir: str) -> None:
+    file_name = os.path.basename(path)
+    os.makedirs(memory_dir, exist_ok=True)
+    manifest_path = os.path.join(memory_dir, MANIFEST_FILE)
+    names_path = os.path.join(memory_dir, NAMES_FILE)
+    with _MANIFEST_LOCK:
+        try:
+            with open(manifest_path, encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            manifest = {}
+        manifest[os.path.abspath(path)] = {
+            "name": file_name,
+            "sha1": hashlib.sha1(text.encode("utf-8")).hexdigest(),
+            "updated_at": datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        }
+        _atomic_write(manifest_path, json.dumps(manifest, ensure_ascii=False, indent=2))
+
+        try:
+            with open(names_path, encoding="utf-8") as f:
+                names = [line.strip() for line in f if line.strip()]
+        except OSError:
+            names = []
+        if file_name not in names or len(set(names)) != len(names):
+            names = list(dict.fromkeys(names + [file_name]))
+            _atomic_write(names_path, "\n".join(names) + "\n")
 
 
 class WriteFileInput(BaseModel):
@@ -11,24 +62,53 @@ class WriteFileInput(BaseModel):
     path: str = Field(..., description="目标文件绝对路径")
     code: str = Field(..., description="要写入的代码内容")
     overwrite: Optional[bool] = Field(False, description="是否覆盖已有文件 (True = 覆盖, False = 追加)")
+    merge: Optional[bool] = Field(
+        False,
+        description="仅在 overwrite=False 时有效。默认 False：追加到文件末尾。"
+                    "True 且目标为已有的 .py / .java 文件时按语法结构合并：import 去重，同名测试函数/方法/类原位替换，新的追加；"
+                    "无法解析或有同名定义（如 property setter、重载组）时退回追加"
+    )
+    preflight: Optional[bool] = Field(True, description="写入 .py 文件后做静态检查（导入、属性、调用参数），在返回信息中附上诊断")
 
 
 class WriteCodeFileTool(BaseTool):
     name: str = "write_code_file"
     description: str = "Write given code to the specified file path."
     args_schema: Type[BaseModel] = WriteFileInput
+    # 运维配置（config.yaml 的 tools.write_code_file），不在 args_schema 中，由部署方决定：
+    # 写入 Python 测试文件后在后台预跑它（语法检查 + 预检 + 运行），随后的 run_project_generated_tests 调用可直接取结果
+    speculative_run: bool = False
+    # 预跑所用的运行配置，与 run_project_generated_tests 一致（tools.run_py_test）
+    runner_config: Dict[str, Any] = Field(default_factory=dict)
+    # 本次运行的工作目录（由 PipelineStep 绑定），生成测试清单写在这里；未绑定时使用共享的 working_memory
+    _working_dir: Optional[str] = PrivateAttr(default=None)
 
-    def _run(self, path: str, code: str, overwrite: bool = False) -> str:
+    def _run(self, path: str, code: str, overwrite: bool = False, merge: bool = False,
+             preflight: bool = True) -> str:
         # 确保目录存在
         dir_name = os.path.dirname(path)
         if dir_name and not os.path.exists(dir_name):
             os.makedirs(dir_name, exist_ok=True)
 
-        mode = "w" if overwrite else "a"
-        with open(path, mode, encoding="utf-8") as f:
-            f.write(code)
-            if not code.endswith("\n"):
-                f.write("\n")
+        if not code.endswith("\n"):
+            code += "\n"
+        existing = None
+        if not overwrite and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                existing = f.read()
+        merge_note = ""
+        if existing is None:
+            text = code
+        elif merge and existing.strip() and path.endswith((".py", ".java")):
+            try:
+                text = merge_code(path, existing, code)
+                merge_note = ", merged"
+            except MergeError as e:
+                text = existing + code
+                merge_note = f", appended (merge skipped: {e})"
+        else:
+            text = existing + code
+        _atomic_write(path, text)
         log_entry = (
             f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] "
             f"Write to file: {path}\n"
@@ -41,11 +121,25 @@ class WriteCodeFileTool(BaseTool):
             log_file.write(log_entry)
         file_name = os.path.basename(path)
         if file_name.endswith(".java") or file_name.endswith(".py"):
-            memory_dir = "memory/working_memory"
-            os.makedirs(memory_dir, exist_ok=True)
-
-            memory_file = os.path.join(memory_dir, "generatedTest.txt")
-            with open(memory_file, "a", encoding="utf-8") as mem_file:
-                mem_file.write(file_name + "\n")
+            _record_generated(path, text, self._working_dir or str(WORKING_MEMORY_DIR))
         print('写入日志')
-        return f"Wrote code to {path} (overwrite={overwrite})"
+        message = f"Wrote code to {path} (overwrite={overwrite}{merge_note})"
+        if not file_name.endswith(".py"):
+            return message
+        # 文件已改写，之前的预跑结果作废
+        get_speculative_runner().invalidate(path)
+        root = find_project_root(path)
+        diags = []
+        if preflight:
+            try:
+                diags = validate_files([path], root)
+            except Exception:
+                diags = []
+            if diags:
+                message += (f"\nStatic pre-flight check found {len(diags)} problem(s):\n"
+                            + format_diagnostics(diags[:20], root))
+        is_test = fnmatch.fnmatch(file_name, "test_*.py") or fnmatch.fnmatch(file_name, "*_test.py")
+        if self.speculative_run and is_test and not diags:
+            if RunProjectGeneratedTestsTool(**self.runner_config).speculate(path, root):
+                message += "\nStarted a background pre-run of this file; run_project_generated_tests will reuse its result."
+        return message
@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Set, Tuple
+
+# ---------- PlantUML 类图解析 ----------
+
+_CLASS_DECL_RE = re.compile(
+    r'^\s*(?:abstract\s+class|abstract|class|interface|enum|annotation|entity|record)\s+'
+    r'"?([\w.$]+)"?'
+)
+# 关系行：A <|-- B、A --> B、A "1" *-- "many" B : label、A ..|> B
+_RELATION_RE = re.compile(
+    r'^\s*"?([\w.$]+)"?\s*(?:"[^"]*"\s*)?'
+    r'([<>*o#x+^|}{]*[-.]+(?:\[[^\]]*\])?[-.]*[<>*o#x+^|}{]*)'
+    r'\s*(?:"[^"]*"\s*)?"?([\w.$]+)"?\s*(?::.*)?$'
+)
+_IDENT_RE = re.compile(r"[A-Za-z_$][\w$]*")
+# 对切片无意义、只影响渲染的 PlantUML 指令
+_NOISE_RE = re.compile(r"^\s*(?:'|skinparam\b|!theme\b|!pragma\b|hide\b|show\b|scale\b|left to right\b|top to bottom\b)")
+
+
+def _short(name: str) -> str:
+    """去掉包名前缀：com.x.OrderService -> OrderService"""
+    return name.rsplit(".", 1)[-1]
+
+
+@dataclass
+class ClassDiagram:
+    """解析后的类图：每个类的源码片段、关系行、以及类之间的直接依赖"""
+    fragments: Dict[str, str] = field(default_factory=dict)
+    relations: List[Tuple[str, str, str]] = field(default_factory=list)  # (源类, 目标类, 原始行)
+    deps: Dict[str, Set[str]] = field(default_factory=dict)
+
+    @property
+    def is_empty(self) -> bool:
+        return not self.fragments
+
+
+def parse_class_diagram(text: str) -> ClassDiagram:
+    """
+    将 PlantUML 类图拆分为按类的片段：
+    - class / interface / enum 等声明（单行或带 { } 成员块）
+    - 关系行（继承、实现、关联、依赖等）
+    - 依赖：关系两端 + 成员签名中引用到的其他类
+    非 PlantUML 文本解析不出类声明时，返回空的 ClassDiagram。
+    """
+    diagram = ClassDiagram()
+    lines = text.splitlines()
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        decl = _CLASS_DECL_RE.match(line)
+        if decl:
+            name = _short(decl.group(1))
+            block = [line]
+            depth = line.count("{") - line.count("}")
+            while depth > 0 and i + 1 < len(lines):
+                i += 1
+                block.append(lines[i])
+                depth += lines[i].count("{") - lines[i].count("}")
+            diagram.fragments[name] = "\n".join(block)
+            diagram.deps.setdefault(name, set())
+        else:
+            rel = _RELATION_RE.match(line)
+            if rel and ("-" in rel.group(2) or "." in rel.group(2)):
+                a, b = _short(rel.group(1)), _short(rel.group(3))
+                diagram.relations.append((a, b, line.strip()))
+        i += 1
+
+    known = set(diagram.fragments)
+    for a, b, _ in diagram.relations:
+        diagram.deps.setdefault(a, set()).add(b)
+        diagram.deps.setdefault(b, set()).add(a)
+    for name, fragment in diagram.fragments.items():
+        body = fragment.split("{", 1)[1] if "{" in fragment else fragment
+        header = fragment.split("{", 1)[0]
+        refs = set(_IDENT_RE.findall(body)) | (set(_IDENT_RE.findall(header)) - {name})
+        diagram.deps[name] |= (refs & known) - {name}
+    return diagram
+
+
+def _resolve(names: Iterable[str], known: Iterable[str]) -> Set[str]:
+    """将模块中的类名映射到类图中的类名（先精确匹配，再忽略大小写）"""
+    known = list(known)
+    lower = {k.lower(): k for k in known}
+    out: Set[str] = set()
+    for raw in names:
+        name = _short(str(raw).strip())
+        if name in known:
+            out.add(name)
+        elif name.lower() in lower:
+            out.add(lower[name.lower()])
+    return out
+
+
+def slice_class_diagram(text: str, classes: Iterable[str]) -> str:
+    """
+    只保留 classes 以及它们的直接依赖类的片段和相关关系行。
+    解析不出类或一个都匹配不上时返回原文，保证不丢上下文。
+    """
+    diagram = parse_class_diagram(text)
+    if diagram.is_empty:
+        return text
+    selected = _resolve(classes, diagram.fragments)
+    if not selected:
+        return text
+
+    keep = set(selected)
+    for name in selected:
+        keep |= diagram.deps.get(name, set())
+
+    parts = ["@startuml"]
+    parts.extend(fragment for name, fragment in diagram.fragments.items() if name in keep)
+    parts.extend(line for a, b, line in diagram.relations
+                 if (a in selected or b in selected) and a in keep and b in keep)
+    parts.append("@enduml")
+    return "\n".join(parts)
+
+
+def compact_plantuml(text: str) -> str:
+    """
+    去掉 @startuml / @enduml 块内的注释、skinparam 等渲染指令和空行，内容不变但更省 token；
+    块外的文本（纯文本设计、说明文字）原样保留。
+    """
+    kept = []
+    in_uml = False
+    for line in text.splitlines():
+        stripped = line.strip()
+        if stripped.startswith("@startuml"):
+            in_uml = True
+        elif stripped.startswith("@enduml"):
+            in_uml = False
+        elif in_uml and (not stripped or _NOISE_RE.match(line)):
+            continue
+        kept.append(line.rstrip())
+    return "\n".join(kept)
@@ -63,6 +63,27 @@ class Module:
         """
         return self.to_json()
 
+def parse_module(data: Dict[str, Any]) -> Module:
+    """将 test_plan 中 modules 数组的一个元素解析为 Module"""
+    features = [
+        Feature(
+            name=f["name"],
+            methods=f.get("methods", []),
+            requirements=f.get("requirements", "")
+        )
+        for f in data.get("features", [])
+    ]
+
+    return Module(
+        module_id=data["module_id"],
+        name=data["name"],
+        classes=data.get("classes", []),
+        responsibility_summary=data.get("responsibility_summary", ""),
+        reasons=data.get("reasons", {}),
+        features=features
+    )
+
+
 # ---------- Memory 管理类 ----------
 
 class Memory:
@@ -112,23 +133,7 @@ class Memory:
         self._modules = [self._parse_module(m) for m in modules_raw]
 
     def _parse_module(self, data: Dict[str, Any]) -> Module:
-        features = [
-            Feature(
-                name=f["name"],
-                methods=f.get("methods", []),
-                requirements=f.get("requirements", "")
-            )
-            for f in data.get("features", [])
-        ]
-
-        return Module(
-            module_id=data["module_id"],
-            name=data["name"],
-            classes=data.get("classes", []),
-            responsibility_summary=data.get("responsibility_summary", ""),
-            reasons=data.get("reasons", {}),
-            features=features
-        )
+        return parse_module(data)
 
     # ---------- 对外接口 ----------
 
@@ -152,6 +157,118 @@ class Memory:
             yield from module.iter_methods()
 
 
+# ---------- 流式解析 ----------
+
+class ModuleStreamParser:
+    """
+    增量解析流式输出的测试计划：
+    支持纯 JSON 和 Markdown（```json ... ```）两种格式，与 Memory 的加载规则一致。
+    每当 "modules" 数组中的一个对象闭合，就立即解析出对应的 Module，
+    不必等整个计划生成完毕。
+
+    用法：
+        parser = ModuleStreamParser()
+        for chunk in stream:
+            for module in parser.feed(chunk):
+                ...
+    """
+
+    _FENCE_RE = re.compile(r"```json[^\n]*\n", re.IGNORECASE)
+
+    def __init__(self):
+        self._buf = ""
+        self._pos = 0            # 下一个待扫描字符的下标
+        self._started = False    # 是否已定位到 JSON 起点
+        self._finished = False   # 根对象是否已闭合
+        self._stack: List[str] = []   # 容器栈：'{' / '['
+        self._in_string = False
+        self._escape = False
+        self._string_start = -1
+        self._last_string = None      # 最近一个完整字符串（用于识别 key）
+        self._modules_depth = -1      # modules 数组所在栈深度
+        self._item_start = -1         # 当前模块对象的起始下标
+        self._modules: List[Module] = []
+
+    @property
+    def modules(self) -> List[Module]:
+        return list(self._modules)
+
+    def _locate_start(self) -> None:
+        stripped = self._buf.lstrip()
+        if not stripped:
+            return
+        if stripped[0] == "{":
+            self._pos = len(self._buf) - len(stripped)
+            self._started = True
+            return
+        match = self._FENCE_RE.search(self._buf)
+        if match:
+            self._pos = match.end()
+            self._started = True
+
+    def feed(self, text: str) -> List[Module]:
+        """追加一段文本，返回本次新闭合的模块列表"""
+        self._buf += text
+        if not self._started:
+            self._locate_start()
+            if not self._started:
+                return []
+        if self._finished:
+            return []
+
+        new_modules: List[Module] = []
+        buf = self._buf
+        i = self._pos
+        n = len(buf)
+        while i < n:
+            ch = buf[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    self._last_string = buf[self._string_start + 1:i]
+            elif ch == '"':
+                self._in_string = True
+                self._string_start = i
+            elif ch in "{[":
+                if (ch == "[" and self._last_string == "modules"
+                        and self._stack == ["{"] and self._modules_depth < 0):
+                    self._modules_depth = 2
+                elif ch == "{" and len(self._stack) == self._modules_depth and self._stack[-1] == "[":
+                    self._item_start = i
+                self._stack.append(ch)
+                self._last_string = None
+            elif ch in "}]":
+                if self._stack:
+                    self._stack.pop()
+                if ch == "}" and self._item_start >= 0 and len(self._stack) == self._modules_depth:
+                    module = self._parse_item(buf[self._item_start:i + 1])
+                    self._item_start = -1
+                    if module is not None:
+                        self._modules.append(module)
+                        new_modules.append(module)
+                if not self._stack:
+                    self._finished = True
+                    i += 1
+                    break
+            elif ch == ",":
+                self._last_string = None
+            i += 1
+        self._pos = i
+        return new_modules
+
+    @staticmethod
+    def _parse_item(text: str) -> Module | None:
+        try:
+            return parse_module(json.loads(text))
+        except (json.JSONDecodeError, KeyError, TypeError, AttributeError):
+            # 单个模块格式不对不影响后续模块，最终结果仍以 Memory 加载为准
+            return None
+
+
 if __name__ == '__main__':
     memory = Memory('/home/mgh/dev/projects/python_projects/mate/memory/working_memory/test_plan.json')
     modules = memory.modules